@@ -0,0 +1,134 @@
+"""
+Background writer for the activity (audit) log
+
+Requests only put their entries on a bounded in-process queue; a single
+worker thread drains it and writes each batch with one multi-row INSERT on its
+own session, so logging never commits (or fails) inside the request's session.
+
+When the queue is full, log() waits up to ACTIVITY_LOG_ENQUEUE_TIMEOUT seconds
+for room (back-pressure) and then writes the entry itself rather than drop it.
+Pending entries are flushed on shutdown and at interpreter exit. Entries are
+stamped when written, at most ACTIVITY_LOG_FLUSH_INTERVAL after the event.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+
+from sqlalchemy import insert, func
+
+from database import SessionLocal
+import models
+
+ACTIVITY_LOG_QUEUE_SIZE = int(os.getenv("ACTIVITY_LOG_QUEUE_SIZE", "10000"))
+ACTIVITY_LOG_BATCH_SIZE = int(os.getenv("ACTIVITY_LOG_BATCH_SIZE", "500"))
+ACTIVITY_LOG_FLUSH_INTERVAL = float(os.getenv("ACTIVITY_LOG_FLUSH_INTERVAL", "0.2"))
+ACTIVITY_LOG_ENQUEUE_TIMEOUT = float(os.getenv("ACTIVITY_LOG_ENQUEUE_TIMEOUT", "1.0"))
+
+WRITE_ATTEMPTS = 3
+
+# Every queued entry carries all of these, so a batch is one executemany
+COLUMNS = ('user_id', 'username', 'action', 'entity_type', 'entity_id', 'entity_name', 'details', 'ip_address')
+
+_STOP = object()
+
+
+class ActivityLogWriter:
+    def __init__(self, max_size: int = ACTIVITY_LOG_QUEUE_SIZE, batch_size: int = ACTIVITY_LOG_BATCH_SIZE,
+                 flush_interval: float = ACTIVITY_LOG_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="activity-log-writer", daemon=True)
+                self._thread.start()
+
+    def log(self, entry: dict):
+        """Queue an activity_logs row (a dict of column values)"""
+        entry = {column: entry.get(column) for column in COLUMNS}
+        self.start()
+        try:
+            self._queue.put(entry, timeout=ACTIVITY_LOG_ENQUEUE_TIMEOUT)
+        except queue.Full:
+            # The writer can't keep up; write this one directly instead of losing it
+            self._write([entry])
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until everything queued so far is written; False on timeout"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stop(self, timeout: float = 10):
+        """Write what is still queued and stop the worker"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Linger briefly so a burst of events goes out as one INSERT
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not _STOP and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = batch[-1] is _STOP
+            entries = batch[:-1] if stop else batch
+            if entries:
+                self._write(entries)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, entries: list):
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            db = SessionLocal()
+            try:
+                db.execute(insert(models.ActivityLog).values(created_at=func.clock_timestamp()), entries)
+                db.commit()
+                return
+            except Exception as e:
+                db.rollback()
+                if attempt == WRITE_ATTEMPTS:
+                    print(f"Error logging activity: dropped {len(entries)} entries: {e}")
+                else:
+                    time.sleep(0.5 * attempt)
+            finally:
+                db.close()
+
+
+writer = ActivityLogWriter()
+atexit.register(writer.stop)
+
+
+def log(**entry):
+    writer.log(entry)
+
+
+def flush(timeout: float = None) -> bool:
+    return writer.flush(timeout)
+
+
+def stop():
+    writer.stop()
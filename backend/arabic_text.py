@@ -0,0 +1,49 @@
+"""
+Arabic text normalization for product search
+
+Names are stored and searched in a normalized form so that spelling variants a
+cashier is likely to type match each other: hamza/madda alef forms, alef maqsura
+vs ya, ta marbuta vs ha, Persian keyboard ya/kaf, diacritics and tatweel, and
+Arabic-Indic digits. The stored column is computed by the database with
+NORMALIZE_ARABIC_SQL, the same folding written in SQL; normalize_arabic folds
+the search term.
+"""
+import re
+
+_FOLD = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ی": "ي", "ئ": "ي",
+    "ؤ": "و",
+    "ة": "ه",
+    "ک": "ك",
+    **{chr(0x0660 + d): str(d) for d in range(10)},  # ٠-٩
+    **{chr(0x06F0 + d): str(d) for d in range(10)},  # ۰-۹
+})
+
+# Harakat, tanween, shadda, sukun, superscript alef and tatweel
+_MARKS = re.compile("[\u064B-\u065F\u0670\u0640]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_arabic(value: str) -> str:
+    """Fold `value` to its search form, e.g. 'شاىٌ  أحمد' -> 'شاي احمد'"""
+    if not value:
+        return ""
+    value = _MARKS.sub("", value).translate(_FOLD).lower()
+    return _SPACES.sub(" ", value).strip()
+
+
+# normalize_arabic as an IMMUTABLE SQL function, so products.name_normalized can
+# be a generated column that rows written outside the application fill too
+_FOLD_FROM = "".join(chr(c) for c in _FOLD)
+_FOLD_TO = "".join(_FOLD.values())
+
+NORMALIZE_ARABIC_SQL = r"""
+CREATE OR REPLACE FUNCTION normalize_arabic(value TEXT) RETURNS TEXT
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+    SELECT btrim(regexp_replace(lower(translate(
+        regexp_replace(value, '[\u064B-\u065F\u0670\u0640]', '', 'g'),
+        '%s', '%s'
+    )), '\s+', ' ', 'g'))
+$$
+""" % (_FOLD_FROM, _FOLD_TO)
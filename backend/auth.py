@@ -32,6 +32,7 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     username: Optional[str] = None
     role: Optional[str] = None
+    user_id: Optional[int] = None  # "uid" claim; None in tokens issued before it was added
 
 
 class UserCreate(BaseModel):
@@ -99,9 +100,10 @@ def decode_token(token: str) -> Optional[TokenData]:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         role: str = payload.get("role")
+        user_id: Optional[int] = payload.get("uid")
         if username is None:
             return None
-        return TokenData(username=username, role=role)
+        return TokenData(username=username, role=role, user_id=user_id)
     except JWTError:
         return None
 
@@ -0,0 +1,166 @@
+"""
+Analytics result cache
+
+Dashboard and analytics results are cached per function and arguments. Every
+entry is keyed with the current version of the data domains it reads (sales,
+purchases, inventory, ...). The write paths in crud.py bump those versions after
+they commit, so a cached result is never served once the underlying data has
+changed; TTL and LRU eviction only bound memory and clock-dependent staleness.
+
+Backends:
+    memory - in-process (default); single worker only, since another worker's
+             writes can't bump this one's versions
+    redis  - shared by all workers, requires the `redis` package and REDIS_URL
+    none   - caching disabled
+
+Both backends hand out copies, so a caller changing a result can't change the
+cached entry.
+"""
+import functools
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+try:
+    import redis
+except ImportError:  # optional dependency, only needed for the redis backend
+    redis = None
+
+CACHE_BACKEND = os.getenv("ANALYTICS_CACHE_BACKEND", "memory")
+CACHE_TTL_SECONDS = int(os.getenv("ANALYTICS_CACHE_TTL", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", "512"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Worker processes, as uvicorn and gunicorn read it for their --workers default
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# Data domains bumped by the crud write paths
+SALES = "sales"
+PURCHASES = "purchases"
+INVENTORY = "inventory"
+CASH = "cash"
+CUSTOMERS = "customers"
+SUPPLIERS = "suppliers"
+
+
+class MemoryBackend:
+    """In-process TTL + LRU cache with local version counters; values are stored pickled"""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return pickle.loads(value)
+
+    def set(self, key, value, ttl: int):
+        value = pickle.dumps(value)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def versions(self, domains):
+        with self._lock:
+            return tuple(self._versions.get(d, 0) for d in domains)
+
+    def bump(self, domains):
+        with self._lock:
+            for d in domains:
+                self._versions[d] = self._versions.get(d, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisBackend:
+    """Cache shared across workers; Redis handles TTL, and LRU via its maxmemory policy"""
+
+    prefix = "analytics:"
+
+    def __init__(self, url: str = REDIS_URL):
+        if redis is None:
+            raise RuntimeError("ANALYTICS_CACHE_BACKEND=redis requires the 'redis' package")
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        data = self.client.get(self.prefix + key)
+        return pickle.loads(data) if data is not None else None
+
+    def set(self, key, value, ttl: int):
+        self.client.setex(self.prefix + key, ttl, pickle.dumps(value))
+
+    def versions(self, domains):
+        values = self.client.mget([f"{self.prefix}version:{d}" for d in domains])
+        return tuple(int(v) if v is not None else 0 for v in values)
+
+    def bump(self, domains):
+        pipe = self.client.pipeline()
+        for d in domains:
+            pipe.incr(f"{self.prefix}version:{d}")
+        pipe.execute()
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(key)
+
+
+def _create_backend():
+    if CACHE_BACKEND == "none":
+        return None
+    if CACHE_BACKEND == "redis":
+        return RedisBackend()
+    if WEB_CONCURRENCY > 1:
+        raise RuntimeError(
+            "ANALYTICS_CACHE_BACKEND=memory would serve stale results with several workers; "
+            "use ANALYTICS_CACHE_BACKEND=redis (or none) when WEB_CONCURRENCY > 1"
+        )
+    return MemoryBackend()
+
+
+backend = _create_backend()
+
+
+def cached(*domains, ttl: int = CACHE_TTL_SECONDS):
+    """
+    Cache a crud read function `fn(db, *args, **kwargs)` by its arguments.
+    `domains` lists the data the result depends on; bumping any of them
+    makes the cached entry unreachable.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(db, *args, **kwargs):
+            if backend is None:
+                return fn(db, *args, **kwargs)
+            # Read versions before computing, so a concurrent write can only
+            # leave a result under the versions it has already replaced
+            versions = backend.versions(domains)
+            key = repr((fn.__name__, args, sorted(kwargs.items()), versions, date.today()))
+            value = backend.get(key)
+            if value is None:
+                value = fn(db, *args, **kwargs)
+                backend.set(key, value, ttl)
+            return value
+        return wrapper
+    return decorator
+
+
+def invalidate(*domains):
+    """Bump the version of the given domains; call after the write has committed"""
+    if backend is not None:
+        backend.bump(domains)
@@ -1,13 +1,187 @@
 """
 CRUD Operations for all entities
 """
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
-from datetime import date, datetime
+from sqlalchemy.orm import Session, selectinload, noload, with_expression
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import event, func, and_, or_, select, union_all, literal, insert, update, delete, values, column, literal_column, cast, text, null, tuple_, Sequence, Integer, Date, DateTime, Interval
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 from decimal import Decimal
+from types import SimpleNamespace
 from typing import List, Optional
+import base64
+import hashlib
+import json
+import os
+import re
 import models
 import schemas
+import cache
+import fact_cache
+from arabic_text import normalize_arabic
+
+
+# Line cost/profit use the purchase price snapshotted on the sale item. A line
+# whose cost is unknown (NULL) is costed at its sale value, so it adds no profit.
+SALE_ITEM_COST = func.coalesce(models.SaleItem.unit_cost * models.SaleItem.quantity, models.SaleItem.total)
+SALE_ITEM_PROFIT = models.SaleItem.total - SALE_ITEM_COST
+
+# The same figures read from daily_sales_summary (revenue is net of discount)
+SUMMARY_SUBTOTAL = models.DailySalesSummary.revenue + models.DailySalesSummary.discount
+SUMMARY_PROFIT = SUMMARY_SUBTOTAL - models.DailySalesSummary.cost
+
+
+# ============================================
+# NUMBERING
+# ============================================
+# "yearly" restarts invoice numbers every January as INV2025-001, INV2025-002, ...
+INVOICE_NUMBER_RESET = os.getenv("INVOICE_NUMBER_RESET", "never")
+
+_yearly_sequences = set()
+
+
+def _next_value(db: Session, sequence: Sequence) -> int:
+    """nextval() is atomic and never hands out the same number twice, even across rollbacks.
+
+    Every call uses a number up: a rolled back invoice, or an add form opened
+    and cancelled after /generate-code, leaves a gap. Numbers only identify
+    records; nothing counts on them being contiguous.
+    """
+    return db.execute(select(sequence.next_value())).scalar()
+
+
+def _next_values(db: Session, sequence: Sequence, count: int) -> list:
+    """`count` sequence values in one round trip"""
+    return db.execute(
+        select(sequence.next_value()).select_from(func.generate_series(1, count))
+    ).scalars().all()
+
+
+def _yearly_sequence(db: Session, sequence: Sequence, year: int) -> Sequence:
+    yearly = Sequence(f"{sequence.name}_{year}")
+    if yearly.name not in _yearly_sequences:
+        # Own connection, so a rolled back invoice doesn't take the sequence with it
+        with db.get_bind().connect() as conn:
+            try:
+                conn.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {yearly.name}"))
+                conn.commit()
+            except DBAPIError:
+                # Another worker created it at the same moment
+                conn.rollback()
+        _yearly_sequences.add(yearly.name)
+    return yearly
+
+
+def _next_invoice_no(db: Session, prefix: str, sequence: Sequence) -> str:
+    if INVOICE_NUMBER_RESET == "yearly":
+        year = date.today().year
+        number = _next_value(db, _yearly_sequence(db, sequence, year))
+        return f"{prefix}{year}-{str(number).zfill(3)}"
+    return f"{prefix}{str(_next_value(db, sequence)).zfill(3)}"
+
+
+def _next_invoice_nos(db: Session, prefix: str, sequence: Sequence, count: int) -> list:
+    if INVOICE_NUMBER_RESET == "yearly":
+        year = date.today().year
+        numbers = _next_values(db, _yearly_sequence(db, sequence, year), count)
+        return [f"{prefix}{year}-{str(number).zfill(3)}" for number in numbers]
+    return [f"{prefix}{str(number).zfill(3)}" for number in _next_values(db, sequence, count)]
+
+
+# ============================================
+# PAGINATION
+# ============================================
+def _encode_cursor(values: list) -> str:
+    raw = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, columns: list) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError
+        return [
+            datetime.fromisoformat(value) if isinstance(col.type, DateTime) else int(value)
+            for value, col in zip(values, columns)
+        ]
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def _keyset_page(query, columns: list, cursor: str = None, limit: int = 100) -> dict:
+    """One page of `query`, newest first by `columns`, starting after `cursor`.
+
+    The cursor is an opaque token holding the last row's column values, so the
+    next page is a range scan on the matching index (WHERE (created_at, id) <
+    (...)) that costs the same at any depth, and rows added in the meantime
+    don't shift later pages. Returns {'items', 'next_cursor'}; next_cursor is
+    None on the last page.
+    """
+    if cursor:
+        query = query.filter(tuple_(*columns) < tuple_(*_decode_cursor(cursor, columns)))
+    rows = query.order_by(*[col.desc() for col in columns]).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor([getattr(rows[-1], col.key) for col in columns])
+    return {'items': rows, 'next_cursor': next_cursor}
+
+
+def _escape_like(term: str) -> str:
+    """Escape LIKE wildcards in `term` (use with escape='\\')"""
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _contains(column, term: str):
+    """Case-insensitive substring match with LIKE wildcards in `term` taken literally"""
+    return column.ilike(f"%{_escape_like(term)}%", escape='\\')
+
+
+def _grid_page(db: Session, stmt, sort: str, sort_columns: dict, tiebreak, skip: int = 0, limit: int = 100,
+               entities: bool = True) -> dict:
+    """One page of a filtered master-data grid, with the total number of matching rows.
+
+    `sort` is a key of sort_columns, prefixed with '-' for descending; `tiebreak`
+    (the id) keeps the order stable between pages. With entities the rows are
+    ORM objects, otherwise flat row mappings. Returns {'items', 'total', 'skip',
+    'limit'}; raises ValueError for an unknown sort key.
+    """
+    key = sort[1:] if sort.startswith('-') else sort
+    if key not in sort_columns:
+        raise ValueError(f"Invalid sort '{sort}'. Use one of: {', '.join(sort_columns)} (prefix '-' for descending)")
+    column = sort_columns[key]
+    if sort.startswith('-'):
+        order = [column.desc().nulls_last(), tiebreak.desc()]
+    else:
+        order = [column.asc().nulls_last(), tiebreak.asc()]
+    
+    total = db.execute(select(func.count()).select_from(stmt.order_by(None).subquery())).scalar()
+    result = db.execute(stmt.order_by(*order).offset(skip).limit(limit))
+    items = result.scalars().all() if entities else result.mappings().all()
+    return {'items': items, 'total': total, 'skip': skip, 'limit': limit}
+
+
+def _invoice_page(db: Session, model, item_fk, cursor: str = None, limit: int = 100,
+                  include_items: bool = True) -> dict:
+    """A page of sales or purchases with items_count set, in at most two queries.
+
+    With include_items the items of the whole page come from one
+    SELECT ... WHERE <invoice>_id IN (...); without, they are not loaded at
+    all (items stays empty) and items_count comes from a subquery instead.
+    """
+    if include_items:
+        query = db.query(model).options(selectinload(model.items))
+    else:
+        items_count = select(func.count()).where(item_fk == model.id).correlate(model).scalar_subquery()
+        query = db.query(model).options(noload(model.items), with_expression(model.items_count, items_count))
+    page = _keyset_page(query, [model.id], cursor, limit)
+    if include_items:
+        for invoice in page['items']:
+            set_committed_value(invoice, 'items_count', len(invoice.items))
+    return page
 
 
 # ============================================
@@ -29,6 +203,7 @@ def create_category(db: Session, category: schemas.CategoryCreate):
     db_category = models.Category(**category.model_dump())
     db.add(db_category)
     db.commit()
+    cache.invalidate(cache.INVENTORY)
     db.refresh(db_category)
     return db_category
 
@@ -40,6 +215,7 @@ def update_category(db: Session, category_id: int, category: schemas.CategoryUpd
         for key, value in update_data.items():
             setattr(db_category, key, value)
         db.commit()
+        cache.invalidate(cache.INVENTORY)
         db.refresh(db_category)
     return db_category
 
@@ -49,6 +225,9 @@ def delete_category(db: Session, category_id: int):
     if db_category:
         db.delete(db_category)
         db.commit()
+        # Its products lose their category_id (ON DELETE SET NULL), and with them their sale lines
+        cache.invalidate(cache.INVENTORY, cache.SALES)
+        fact_cache.invalidate()
         return True
     return False
 
@@ -56,8 +235,27 @@ def delete_category(db: Session, category_id: int):
 # ============================================
 # SUPPLIER CRUD
 # ============================================
-def get_suppliers(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Supplier).offset(skip).limit(limit).all()
+SUPPLIER_SORTS = {
+    'id': models.Supplier.id,
+    'code': models.Supplier.code,
+    'name': models.Supplier.name,
+    'balance': models.Supplier.balance,
+    'total_purchases': models.Supplier.total_purchases,
+}
+
+
+def get_suppliers(db: Session, search: str = None, has_balance: bool = None, sort: str = 'id',
+                  skip: int = 0, limit: int = 100) -> dict:
+    """A page of suppliers matching name/code/phone `search` and, if given, whether they are owed money"""
+    supplier = models.Supplier
+    stmt = select(supplier)
+    if search:
+        stmt = stmt.where(
+            _contains(supplier.name, search) | _contains(supplier.code, search) | _contains(supplier.phone, search)
+        )
+    if has_balance is not None:
+        stmt = stmt.where(supplier.balance > 0 if has_balance else func.coalesce(supplier.balance, 0) <= 0)
+    return _grid_page(db, stmt, sort, SUPPLIER_SORTS, supplier.id, skip, limit)
 
 
 def get_supplier(db: Session, supplier_id: int):
@@ -72,6 +270,7 @@ def create_supplier(db: Session, supplier: schemas.SupplierCreate):
     db_supplier = models.Supplier(**supplier.model_dump())
     db.add(db_supplier)
     db.commit()
+    cache.invalidate(cache.SUPPLIERS)
     db.refresh(db_supplier)
     return db_supplier
 
@@ -83,6 +282,7 @@ def update_supplier(db: Session, supplier_id: int, supplier: schemas.SupplierUpd
         for key, value in update_data.items():
             setattr(db_supplier, key, value)
         db.commit()
+        cache.invalidate(cache.SUPPLIERS)
         db.refresh(db_supplier)
     return db_supplier
 
@@ -92,21 +292,40 @@ def delete_supplier(db: Session, supplier_id: int):
     if db_supplier:
         db.delete(db_supplier)
         db.commit()
+        cache.invalidate(cache.SUPPLIERS)
         return True
     return False
 
 
 def generate_supplier_code(db: Session) -> str:
-    """Generate unique supplier code based on max ID to avoid duplicates"""
-    max_id = db.query(func.max(models.Supplier.id)).scalar() or 0
-    return f"SUPP{str(max_id + 1).zfill(3)}"
+    """Generate unique supplier code from its sequence (see _next_value; an unused code leaves a gap)"""
+    return f"SUPP{str(_next_value(db, models.supplier_code_seq)).zfill(3)}"
 
 
 # ============================================
 # CUSTOMER CRUD
 # ============================================
-def get_customers(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Customer).offset(skip).limit(limit).all()
+CUSTOMER_SORTS = {
+    'id': models.Customer.id,
+    'code': models.Customer.code,
+    'name': models.Customer.name,
+    'balance': models.Customer.balance,
+    'total_purchases': models.Customer.total_purchases,
+}
+
+
+def get_customers(db: Session, search: str = None, has_balance: bool = None, sort: str = 'id',
+                  skip: int = 0, limit: int = 100) -> dict:
+    """A page of customers matching name/code/phone `search` and, if given, whether they owe money"""
+    customer = models.Customer
+    stmt = select(customer)
+    if search:
+        stmt = stmt.where(
+            _contains(customer.name, search) | _contains(customer.code, search) | _contains(customer.phone, search)
+        )
+    if has_balance is not None:
+        stmt = stmt.where(customer.balance > 0 if has_balance else func.coalesce(customer.balance, 0) <= 0)
+    return _grid_page(db, stmt, sort, CUSTOMER_SORTS, customer.id, skip, limit)
 
 
 def get_customer(db: Session, customer_id: int):
@@ -121,6 +340,7 @@ def create_customer(db: Session, customer: schemas.CustomerCreate):
     db_customer = models.Customer(**customer.model_dump())
     db.add(db_customer)
     db.commit()
+    cache.invalidate(cache.CUSTOMERS)
     db.refresh(db_customer)
     return db_customer
 
@@ -132,6 +352,7 @@ def update_customer(db: Session, customer_id: int, customer: schemas.CustomerUpd
         for key, value in update_data.items():
             setattr(db_customer, key, value)
         db.commit()
+        cache.invalidate(cache.CUSTOMERS)
         db.refresh(db_customer)
     return db_customer
 
@@ -141,14 +362,14 @@ def delete_customer(db: Session, customer_id: int):
     if db_customer:
         db.delete(db_customer)
         db.commit()
+        cache.invalidate(cache.CUSTOMERS)
         return True
     return False
 
 
 def generate_customer_code(db: Session) -> str:
-    """Generate unique customer code based on max ID to avoid duplicates"""
-    max_id = db.query(func.max(models.Customer.id)).scalar() or 0
-    return f"CUST{str(max_id + 1).zfill(3)}"
+    """Generate unique customer code from its sequence (see _next_value; an unused code leaves a gap)"""
+    return f"CUST{str(_next_value(db, models.customer_code_seq)).zfill(3)}"
 
 
 # ============================================
@@ -176,6 +397,7 @@ def create_product(db: Session, product: schemas.ProductCreate):
     db_product = models.Product(**product_data)
     db.add(db_product)
     db.commit()
+    cache.invalidate(cache.INVENTORY)
     db.refresh(db_product)
     return db_product
 
@@ -187,9 +409,17 @@ def update_product(db: Session, product_id: int, product: schemas.ProductUpdate)
         # Prevent quantity changes from product form - quantity only changes via purchases/sales
         if 'quantity' in update_data:
             del update_data['quantity']
+        category_changed = 'category_id' in update_data and update_data['category_id'] != db_product.category_id
         for key, value in update_data.items():
             setattr(db_product, key, value)
         db.commit()
+        if category_changed:
+            # The columnar sales facts carry each line's category; the SALES
+            # bump makes the other workers reload theirs too
+            cache.invalidate(cache.INVENTORY, cache.SALES)
+            fact_cache.invalidate()
+        else:
+            cache.invalidate(cache.INVENTORY)
         db.refresh(db_product)
     return db_product
 
@@ -199,48 +429,148 @@ def delete_product(db: Session, product_id: int):
     if db_product:
         db.delete(db_product)
         db.commit()
+        # Its sale items lose their product_id (ON DELETE SET NULL)
+        cache.invalidate(cache.INVENTORY, cache.SALES)
+        fact_cache.invalidate()
         return True
     return False
 
 
 def generate_product_code(db: Session) -> str:
-    """Generate unique product code based on max ID to avoid duplicates"""
-    max_id = db.query(func.max(models.Product.id)).scalar() or 0
-    return f"PROD{str(max_id + 1).zfill(3)}"
+    """Generate unique product code from its sequence (see _next_value; an unused code leaves a gap)"""
+    return f"PROD{str(_next_value(db, models.product_code_seq)).zfill(3)}"
+
+
+def _product_details_query():
+    """Flat product rows with their category and supplier names (one SELECT, outer joins)"""
+    product = models.Product
+    return select(
+        product.id,
+        product.code,
+        product.name,
+        product.category_id,
+        product.supplier_id,
+        product.purchase_price,
+        product.sale_price,
+        product.quantity,
+        product.min_quantity,
+        product.description,
+        models.Category.name_ar.label('category'),
+        models.Supplier.name.label('supplier')
+    ).outerjoin(
+        models.Category, models.Category.id == product.category_id
+    ).outerjoin(
+        models.Supplier, models.Supplier.id == product.supplier_id
+    )
 
 
 def get_products_with_details(db: Session, skip: int = 0, limit: int = 100, category: str = None):
-    """Get products with category and supplier names"""
-    query = db.query(models.Product)
+    """Get products with category and supplier names.
+
+    Returned as flat read-only row mappings rather than ORM objects, so a large
+    listing or export neither lazy-loads per product nor fills the session
+    identity map.
+    """
+    query = _product_details_query()
     if category and category != 'all':
-        query = query.join(models.Category).filter(models.Category.code == category)
+        query = query.where(models.Category.code == category)
     
-    products = query.offset(skip).limit(limit).all()
-    result = []
-    for p in products:
-        product_dict = {
-            'id': p.id,
-            'code': p.code,
-            'name': p.name,
-            'category_id': p.category_id,
-            'supplier_id': p.supplier_id,
-            'purchase_price': p.purchase_price,
-            'sale_price': p.sale_price,
-            'quantity': p.quantity,
-            'min_quantity': p.min_quantity,
-            'description': p.description,
-            'category': p.category.name_ar if p.category else None,
-            'supplier': p.supplier.name if p.supplier else None
-        }
-        result.append(product_dict)
-    return result
+    return db.execute(query.order_by(models.Product.id).offset(skip).limit(limit)).mappings().all()
+
+
+PRODUCT_SORTS = {
+    'id': models.Product.id,
+    'code': models.Product.code,
+    'name': models.Product.name,
+    'quantity': models.Product.quantity,
+    'purchase_price': models.Product.purchase_price,
+    'sale_price': models.Product.sale_price,
+    'category': models.Category.name_ar,
+    'supplier': models.Supplier.name,
+}
+
+
+def get_products_page(db: Session, search: str = None, category: str = None, supplier_id: int = None,
+                      low_stock: bool = None, sort: str = 'id', skip: int = 0, limit: int = 100) -> dict:
+    """A page of products (with category and supplier names) for the catalog grid.
+
+    search matches name or code; category is a category code ('all' for any);
+    low_stock selects products at or below their minimum quantity (or, if
+    False, above it).
+    """
+    product = models.Product
+    query = _product_details_query()
+    if search:
+        query = query.where(_contains(product.name, search) | _contains(product.code, search))
+    if category and category != 'all':
+        query = query.where(models.Category.code == category)
+    if supplier_id is not None:
+        query = query.where(product.supplier_id == supplier_id)
+    if low_stock is not None:
+        at_or_below = product.quantity <= product.min_quantity
+        query = query.where(at_or_below if low_stock else ~at_or_below)
+    return _grid_page(db, query, sort, PRODUCT_SORTS, product.id, skip, limit, entities=False)
+
+
+def search_products(db: Session, q: str, limit: int = 20) -> list:
+    """Ranked product lookup for the point of sale.
+
+    An exact code (a scanned barcode) returns just that product. Otherwise, in
+    this order: names starting with q, codes starting with q, then names with
+    words starting with each word of q, with or without the article ('سكر كب'
+    finds 'سكر ابيض كبير', 'عروسه' finds 'شاي العروسه'). Names are compared in
+    their Arabic-normalized form. There is no mid-word substring match.
+    """
+    product = models.Product
+    q = q.strip()
+    term = normalize_arabic(q)
+    name = product.name_normalized
+    code = product.code.collate('C')
+
+    # (condition, order) per rank; each rank excludes the rows of the ones before
+    steps = [(product.code == q, None)]
+    if term:
+        name_prefix = name.like(f"{_escape_like(term)}%", escape='\\')
+        code_prefix = code.like(f"{_escape_like(q)}%", escape='\\')
+        steps += [(name_prefix, name), (code_prefix & ~name_prefix, code)]
+        words = re.findall(r'[^\W_]+', term)
+        if words:
+            stems = [word[2:] if word.startswith('ال') and len(word) > 3 else word for word in words]
+            words_query = ' & '.join(f"({stem}:* | ال{stem}:*)" for stem in stems)
+            words_match = func.to_tsvector(literal_column("'simple'"), name).op('@@')(
+                func.to_tsquery(literal_column("'simple'"), words_query)
+            )
+            # Left unordered so the GIN scan can stop early; sorted below
+            steps.append((words_match & ~name_prefix & ~code_prefix, None))
+
+    # One round trip: the outer LIMIT stops reading the later ranks once the
+    # earlier ones have filled the list, and every rank is an index scan
+    ranked = union_all(*(
+        select(product.id, literal(rank).label('rank')).where(condition).order_by(order).limit(limit)
+        for rank, (condition, order) in enumerate(steps)
+    )).limit(limit).subquery()
+    rows = db.execute(
+        _product_details_query().add_columns(ranked.c.rank).join(ranked, ranked.c.id == product.id)
+    ).mappings().all()
+    for row in rows:
+        if row['rank'] == 0:
+            return [row]
+
+    def position(row):
+        # The order each rank's index scan used; word matches shortest first
+        if row['rank'] == 1:
+            return (1, normalize_arabic(row['name']))
+        if row['rank'] == 2:
+            return (2, row['code'])
+        return (3, len(row['name']), row['name'])
+    return sorted(rows, key=position)
 
 
 # ============================================
 # SALE CRUD
 # ============================================
-def get_sales(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Sale).order_by(models.Sale.id.desc()).offset(skip).limit(limit).all()
+def get_sales(db: Session, cursor: str = None, limit: int = 100, include_items: bool = True) -> dict:
+    return _invoice_page(db, models.Sale, models.SaleItem.sale_id, cursor, limit, include_items)
 
 
 def get_sale(db: Session, sale_id: int):
@@ -248,31 +578,266 @@ def get_sale(db: Session, sale_id: int):
 
 
 def generate_invoice_no(db: Session) -> str:
-    count = db.query(models.Sale).count()
-    return f"INV{str(count + 1).zfill(3)}"
+    return _next_invoice_no(db, "INV", models.sale_invoice_seq)
+
 
+def _lock_products(db: Session, product_ids) -> dict:
+    """Load products by id in one SELECT ... FOR UPDATE.
+
+    Rows are locked in id order, so two invoices touching the same products
+    always lock them in the same order and cannot deadlock each other.
+    """
+    ids = sorted({pid for pid in product_ids if pid})
+    if not ids:
+        return {}
+    products = db.query(models.Product).filter(
+        models.Product.id.in_(ids)
+    ).order_by(models.Product.id).with_for_update().all()
+    return {product.id: product for product in products}
 
-def create_sale(db: Session, sale: schemas.SaleCreate, username: str = None):
-    # Generate invoice number
-    invoice_no = generate_invoice_no(db)
+
+def _lock_products_with_suppliers(db: Session, product_ids):
+    """Like _lock_products, also returning {supplier_id: name} for the products' suppliers.
+
+    The supplier names come from the same query (an outer join), so pricing a
+    purchase needs no lookup per line. Only the product rows are locked.
+    """
+    ids = sorted({pid for pid in product_ids if pid})
+    if not ids:
+        return {}, {}
+    rows = db.query(models.Product, models.Supplier.name).outerjoin(
+        models.Supplier, models.Supplier.id == models.Product.supplier_id
+    ).filter(
+        models.Product.id.in_(ids)
+    ).order_by(models.Product.id).with_for_update(of=models.Product).all()
+    products = {product.id: product for product, _ in rows}
+    supplier_names = {product.supplier_id: name for product, name in rows if name is not None}
+    return products, supplier_names
+
+
+def _apply_stock_deltas(db: Session, deltas: dict, products: dict) -> dict:
+    """Add {product_id: delta} to product stock in one atomic UPDATE ... FROM (VALUES ...) RETURNING.
+
+    A row is only updated when its stock stays non-negative, so concurrent sales
+    cannot oversell even if the Python-side check raced. Raises ValueError if any
+    product lacked stock; the caller's transaction must then be rolled back.
+    Returns {product_id: new quantity} and syncs the loaded `products` objects.
+    """
+    deltas = {pid: delta for pid, delta in deltas.items() if delta}
+    if not deltas:
+        return {}
+    
+    table = models.Product.__table__
+    changes = values(
+        column('product_id', Integer), column('delta', Integer), name='changes'
+    ).data(sorted(deltas.items()))
+    rows = db.execute(
+        update(table).where(
+            table.c.id == changes.c.product_id,
+            table.c.quantity + changes.c.delta >= 0
+        ).values(
+            quantity=table.c.quantity + changes.c.delta
+        ).returning(table.c.id, table.c.quantity)
+    ).all()
+    new_quantities = dict(rows)
     
-    # Get customer name
-    customer_name = sale.customer_name or "عميل نقدي"
-    if sale.customer_id:
-        customer = get_customer(db, sale.customer_id)
-        if customer:
-            customer_name = customer.name
+    for pid in deltas:
+        if pid not in new_quantities:
+            product = products.get(pid)
+            name = product.name if product else pid
+            available = product.quantity if product else 0
+            raise ValueError(f"Insufficient stock for {name}. Available: {available}")
     
-    # Calculate totals
+    # The UPDATE already wrote the rows; mark the loaded values as clean
+    for pid, quantity in new_quantities.items():
+        if pid in products:
+            set_committed_value(products[pid], 'quantity', quantity)
+    return new_quantities
+
+
+def _record_stock_changes(db: Session, deltas: dict, products: dict, movement_types: tuple,
+                          reason: str, reference_type: str, reference_id: int):
+    """Apply {product_id: delta} and record one net movement per changed product.
+
+    movement_types is (type when stock goes up, type when it goes down).
+    """
+    new_quantities = _apply_stock_deltas(db, deltas, products)
+    db.add_all([models.InventoryMovement(
+        product_id=product_id,
+        movement_type=movement_types[0] if delta > 0 else movement_types[1],
+        quantity_before=new_quantities[product_id] - delta,
+        quantity_change=delta,
+        quantity_after=new_quantities[product_id],
+        reason=reason,
+        reference_type=reference_type,
+        reference_id=reference_id
+    ) for product_id, delta in sorted(deltas.items()) if delta])
+
+
+def _record_item_movements(db: Session, items: list, products: dict, sign: int, movement_type: str,
+                           reason: str, reference_type: str, reference_id: int):
+    """Move stock for an invoice's items (sign 1 adds, -1 takes) and record one movement per item.
+
+    The stock is changed in one UPDATE for all products; items whose product is
+    not in `products` (e.g. deleted products) are skipped.
+    """
+    totals = {}
+    for item in items:
+        if item.product_id in products:
+            totals[item.product_id] = totals.get(item.product_id, 0) + item.quantity
+    _apply_stock_deltas(db, {pid: sign * qty for pid, qty in totals.items()}, products)
+    stock = {pid: products[pid].quantity - sign * qty for pid, qty in totals.items()}
+    
+    movements = []
+    for item in items:
+        if item.product_id in products:
+            quantity_before = stock[item.product_id]
+            stock[item.product_id] += sign * item.quantity
+            movements.append(models.InventoryMovement(
+                product_id=item.product_id,
+                movement_type=movement_type,
+                quantity_before=quantity_before,
+                quantity_change=sign * item.quantity,
+                quantity_after=stock[item.product_id],
+                reason=reason,
+                reference_type=reference_type,
+                reference_id=reference_id
+            ))
+    db.add_all(movements)
+
+
+def _match_lines(old_items: list, new_lines: list):
+    """Pair an invoice's existing items with its new lines by product, in order.
+
+    Returns (kept, added, removed): (item, line) pairs to update in place, new
+    lines without an existing item, and existing items no longer on the invoice.
+    """
+    unmatched = {}
+    for item in old_items:
+        unmatched.setdefault(item.product_id, []).append(item)
+    kept = []
+    added = []
+    for line in new_lines:
+        candidates = unmatched.get(line['product_id'])
+        if candidates:
+            kept.append((candidates.pop(0), line))
+        else:
+            added.append(line)
+    removed = [item for items in unmatched.values() for item in items]
+    return kept, added, removed
+
+
+def _record_daily_summary(db: Session, db_sale: models.Sale, items: list, sign: int = 1):
+    """Add (sign=1) or remove (sign=-1) a sale's totals in daily_sales_summary.
+
+    Runs inside the caller's transaction so the summary commits or rolls back
+    together with the sale itself.
+    """
+    _write_daily_summary(db, _daily_summary_rows({}, [(db_sale, items)], sign))
+
+
+def _item_cost(item) -> Decimal:
+    """Python side of SALE_ITEM_COST"""
+    return item.total if item.unit_cost is None else item.unit_cost * item.quantity
+
+
+def _daily_summary_rows(rows: dict, sales: list, sign: int = 1, drawer_id: int = None) -> dict:
+    """Accumulate (db_sale, items) totals into {(date, payment_method, drawer_id): row}.
+
+    Each drawer (till) has its own summary rows, so checkouts on different
+    tills don't queue on one row lock; edits and deletes, which don't know the
+    till, go to the main drawer's rows. Readers always sum over drawers.
+    """
+    drawer_id = drawer_id or DEFAULT_CASH_DRAWER_ID
+    for db_sale, items in sales:
+        key = (db_sale.sale_date, db_sale.payment_method or "", drawer_id)
+        row = rows.setdefault(key, {
+            'summary_date': key[0], 'payment_method': key[1], 'drawer_id': key[2], 'revenue': Decimal("0"),
+            'cost': Decimal("0"), 'discount': Decimal("0"), 'invoice_count': 0, 'items_sold': 0
+        })
+        row['revenue'] += sign * db_sale.total
+        row['cost'] += sign * sum((_item_cost(item) for item in items), Decimal("0"))
+        row['discount'] += sign * (db_sale.discount or Decimal("0"))
+        row['invoice_count'] += sign
+        row['items_sold'] += sign * sum(item.quantity for item in items)
+    return rows
+
+
+def _write_daily_summary(db: Session, rows: dict):
+    # Rows that net to zero (e.g. an edit that didn't change the totals) are skipped
+    # Key order, so concurrent upserts lock shared rows in the same order and can't deadlock
+    rows = [row for _, row in sorted(rows.items()) if any(
+        row[field] for field in ('revenue', 'cost', 'discount', 'invoice_count', 'items_sold')
+    )]
+    if not rows:
+        return
+    
+    # One row per key: ON CONFLICT can't update the same row twice in a statement
+    summary = models.DailySalesSummary
+    stmt = pg_insert(summary).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[summary.summary_date, summary.payment_method, summary.drawer_id],
+        set_={
+            'revenue': summary.revenue + stmt.excluded.revenue,
+            'cost': summary.cost + stmt.excluded.cost,
+            'discount': summary.discount + stmt.excluded.discount,
+            'invoice_count': summary.invoice_count + stmt.excluded.invoice_count,
+            'items_sold': summary.items_sold + stmt.excluded.items_sold,
+            'updated_at': func.now()
+        }
+    )
+    db.execute(stmt)
+
+
+def rebuild_daily_sales_summary(db: Session) -> int:
+    """Recompute daily_sales_summary from the sales history. Returns the number of rows written."""
+    item_totals = db.query(
+        models.SaleItem.sale_id.label('sale_id'),
+        func.sum(SALE_ITEM_COST).label('cost'),
+        func.sum(models.SaleItem.quantity).label('items_sold')
+    ).group_by(models.SaleItem.sale_id).subquery()
+    
+    payment_method = func.coalesce(models.Sale.payment_method, "")
+    rows = select(
+        models.Sale.sale_date,
+        payment_method,
+        func.sum(models.Sale.total),
+        func.coalesce(func.sum(item_totals.c.cost), 0),
+        func.coalesce(func.sum(models.Sale.discount), 0),
+        func.count(models.Sale.id),
+        func.coalesce(func.sum(item_totals.c.items_sold), 0)
+    ).outerjoin(
+        item_totals, item_totals.c.sale_id == models.Sale.id
+    ).group_by(models.Sale.sale_date, payment_method)
+    
+    db.execute(delete(models.DailySalesSummary))
+    result = db.execute(insert(models.DailySalesSummary).from_select(
+        ['summary_date', 'payment_method', 'revenue', 'cost', 'discount', 'invoice_count', 'items_sold'],
+        rows
+    ))
+    db.commit()
+    cache.invalidate(cache.SALES)
+    return result.rowcount
+
+
+def _price_sale(sale: schemas.SaleCreate, products: dict, stock: dict):
+    """Check a sale against `stock` ({product_id: available}) and price its lines.
+
+    Returns (sale_items, requested, subtotal) without changing anything.
+    Raises ValueError if a product is missing or short of stock.
+    """
     subtotal = Decimal("0")
     sale_items = []
+    requested = {}
     
     for item in sale.items:
-        product = get_product(db, item.product_id)
+        product = products.get(item.product_id)
         if not product:
             raise ValueError(f"Product {item.product_id} not found")
-        if product.quantity < item.quantity:
-            raise ValueError(f"Insufficient stock for {product.name}. Available: {product.quantity}")
+        # Lines repeating a product draw from the same stock
+        requested[item.product_id] = requested.get(item.product_id, 0) + item.quantity
+        if stock[item.product_id] < requested[item.product_id]:
+            raise ValueError(f"Insufficient stock for {product.name}. Available: {stock[item.product_id]}")
         
         unit_price = item.unit_price if item.unit_price else product.sale_price
         item_total = unit_price * item.quantity
@@ -283,108 +848,193 @@ def create_sale(db: Session, sale: schemas.SaleCreate, username: str = None):
             'product_name': product.name,
             'quantity': item.quantity,
             'unit_price': unit_price,
+            'unit_cost': product.purchase_price,
             'total': item_total
         })
-    
-    total = subtotal - sale.discount
-    remaining = total - sale.paid
-    status = "مدفوعة" if remaining <= 0 else ("جزئي" if sale.paid > 0 else "غير مدفوعة")
-    
-    # Create sale
-    db_sale = models.Sale(
-        invoice_no=invoice_no,
-        customer_id=sale.customer_id,
-        customer_name=customer_name,
-        sale_date=sale.sale_date or date.today(),
-        subtotal=subtotal,
-        discount=sale.discount,
-        total=total,
-        paid=sale.paid,
-        remaining=max(remaining, Decimal("0")),
-        status=status,
-        payment_method=sale.payment_method if sale.paid > 0 else None,
-        notes=sale.notes,
-        created_by=db.query(models.User).filter(models.User.username == username).first().id if username else None
-    )
-    db.add(db_sale)
-    db.flush()
-    
-    # Create sale items and update inventory
-    for item_data in sale_items:
-        db_item = models.SaleItem(
-            sale_id=db_sale.id,
-            **item_data
-        )
-        db.add(db_item)
-        
-        # Update product quantity
-        product = get_product(db, item_data['product_id'])
-        quantity_before = product.quantity
-        product.quantity -= item_data['quantity']
+    return sale_items, requested, subtotal
+
+
+def _add_sales(db: Session, sales: list, created_by: int = None):
+    """Write sales with their stock movements, daily summary and cash, without committing.
+
+    Every sale is first checked in memory against the locked stock, in order, so
+    a rejected sale writes nothing and leaves the others alone. The accepted ones
+    are then written together: one SELECT ... FOR UPDATE for all their products,
+    one batch of invoice numbers, multi-row INSERTs, one conditional stock UPDATE
+    and one summary upsert, whether there is one sale or a few hundred.
+    Returns (created, errors): a list of (index, db_sale, db_items) and a dict
+    of {index: message} for the rejected sales.
+    """
+    customer_ids = {sale.customer_id for sale in sales if sale.customer_id}
+    customers = {
+        customer.id: customer
+        for customer in db.query(models.Customer).filter(models.Customer.id.in_(customer_ids)).all()
+    } if customer_ids else {}
+    
+    drawers = _active_drawer_ids(db, {sale.drawer_id or DEFAULT_CASH_DRAWER_ID for sale in sales})
+    
+    # Lock every product in the batch in a single query
+    products = _lock_products(db, [item.product_id for sale in sales for item in sale.items])
+    stock = {pid: product.quantity for pid, product in products.items()}
+    
+    accepted = []
+    errors = {}
+    for index, sale in enumerate(sales):
+        drawer_id = sale.drawer_id or DEFAULT_CASH_DRAWER_ID
+        if drawer_id not in drawers:
+            errors[index] = f"Cash drawer {drawer_id} not found"
+            continue
+        try:
+            sale_items, requested, subtotal = _price_sale(sale, products, stock)
+        except ValueError as e:
+            errors[index] = str(e)
+            continue
+        for pid, quantity in requested.items():
+            stock[pid] -= quantity
+        accepted.append((index, sale, sale_items, subtotal))
+    if not accepted:
+        return [], errors
+    
+    # Numbered only once validated, so rejected sales don't use up invoice numbers
+    invoice_nos = _next_invoice_nos(db, "INV", models.sale_invoice_seq, len(accepted))
+    
+    created = []
+    for (index, sale, sale_items, subtotal), invoice_no in zip(accepted, invoice_nos):
+        customer = customers.get(sale.customer_id)
+        total = subtotal - sale.discount
+        remaining = total - sale.paid
+        status = "مدفوعة" if remaining <= 0 else ("جزئي" if sale.paid > 0 else "غير مدفوعة")
         
-        # Record inventory movement
-        movement = models.InventoryMovement(
-            product_id=product.id,
-            movement_type='sale',
-            quantity_before=quantity_before,
-            quantity_change=-item_data['quantity'],
-            quantity_after=product.quantity,
-            reason='sale',
-            reference_type='sale',
-            reference_id=db_sale.id
+        db_sale = models.Sale(
+            invoice_no=invoice_no,
+            customer_id=sale.customer_id,
+            customer_name=customer.name if customer else (sale.customer_name or "عميل نقدي"),
+            sale_date=sale.sale_date or date.today(),
+            subtotal=subtotal,
+            discount=sale.discount,
+            total=total,
+            paid=sale.paid,
+            remaining=max(remaining, Decimal("0")),
+            status=status,
+            payment_method=sale.payment_method if sale.paid > 0 else None,
+            notes=sale.notes,
+            created_by=created_by
         )
-        db.add(movement)
-    
-    # Update customer balance if applicable
-    if sale.customer_id:
-        customer = get_customer(db, sale.customer_id)
+        db_items = [models.SaleItem(**item_data) for item_data in sale_items]
+        db_sale.items = db_items
+        created.append((index, db_sale, db_items))
+        
+        # Update customer balance if applicable
         if customer:
             customer.total_purchases += total
             customer.balance += max(remaining, Decimal("0"))
     
-    # Record cash income from payment (non-blocking if cash tracking fails)
-    if sale.paid > 0:
-        try:
-            add_cash_transaction(
-                db=db,
-                transaction_type='sale_income',
-                amount=sale.paid,
-                reference_type='sale',
-                reference_id=db_sale.id,
-                description=f'بيع - فاتورة {invoice_no}',
-                user_id=None
-            )
-        except Exception as cash_error:
-            print(f"Warning: Could not record cash transaction: {cash_error}")
+    # Added together so the flush writes sales and items as multi-row INSERTs
+    db.add_all([db_sale for _, db_sale, _ in created])
+    db.flush()
     
+    # Take the stock in one conditional UPDATE and walk the movements back from its result
+    taken = {}
+    for _, _, db_items in created:
+        for item in db_items:
+            taken[item.product_id] = taken.get(item.product_id, 0) + item.quantity
+    _apply_stock_deltas(db, {pid: -qty for pid, qty in taken.items()}, products)
+    stock = {pid: products[pid].quantity + qty for pid, qty in taken.items()}
+    
+    movements = []
+    for _, db_sale, db_items in created:
+        for item in db_items:
+            quantity_before = stock[item.product_id]
+            stock[item.product_id] -= item.quantity
+            
+            # Record inventory movement
+            movements.append(models.InventoryMovement(
+                product_id=item.product_id,
+                movement_type='sale',
+                quantity_before=quantity_before,
+                quantity_change=-item.quantity,
+                quantity_after=stock[item.product_id],
+                reason='sale',
+                reference_type='sale',
+                reference_id=db_sale.id
+            ))
+    db.add_all(movements)
+    
+    summary_rows = {}
+    for index, db_sale, db_items in created:
+        _daily_summary_rows(summary_rows, [(db_sale, db_items)], drawer_id=sales[index].drawer_id)
+    _write_daily_summary(db, summary_rows)
+    
+    # Record cash income from payments
+    payments = [{
+        'amount': db_sale.paid,
+        'reference_type': 'sale',
+        'reference_id': db_sale.id,
+        'description': f'بيع - فاتورة {db_sale.invoice_no}',
+        'drawer_id': sales[index].drawer_id
+    } for index, db_sale, _ in created if db_sale.paid > 0]
+    if payments:
+        add_cash_transactions(db, 'sale_income', payments)
+    
+    return created, errors
+
+
+def create_sale(db: Session, sale: schemas.SaleCreate, user_id: int = None):
+    created, errors = _add_sales(db, [sale], created_by=user_id)
+    if errors:
+        raise ValueError(errors[0])
+    _, db_sale, db_items = created[0]
+    
+    facts = fact_cache.sale_facts(db_sale, db_items)
     db.commit()
+    cache.invalidate(cache.SALES, cache.INVENTORY, cache.CUSTOMERS, cache.CASH)
+    fact_cache.record_sale(facts)
     db.refresh(db_sale)
     return db_sale
 
 
+SALES_BATCH_CHUNK_SIZE = int(os.getenv("SALES_BATCH_CHUNK_SIZE", "100"))
+
+
+def create_sales_batch(db: Session, sales: list, user_id: int = None, chunk_size: int = None):
+    """Create many sales (e.g. replayed from an offline till) with one commit per chunk.
+
+    A sale rejected with ValueError (missing product, not enough stock) is
+    reported and skipped; the rest of its chunk is still committed. Returns one
+    result dict per input sale, in order.
+    """
+    chunk_size = chunk_size or SALES_BATCH_CHUNK_SIZE
+    results = []
+    
+    for start in range(0, len(sales), chunk_size):
+        chunk = sales[start:start + chunk_size]
+        created, errors = _add_sales(db, chunk, created_by=user_id)
+        facts = [fact_cache.sale_facts(db_sale, db_items) for _, db_sale, db_items in created]
+        # Read before commit expires the objects
+        saved = {index: (db_sale.id, db_sale.invoice_no) for index, db_sale, _ in created}
+        db.commit()
+        if created:
+            cache.invalidate(cache.SALES, cache.INVENTORY, cache.CUSTOMERS, cache.CASH)
+            fact_cache.record_sales(facts)
+        
+        for index in range(len(chunk)):
+            if index in saved:
+                sale_id, invoice_no = saved[index]
+                results.append({'index': start + index, 'success': True, 'sale_id': sale_id, 'invoice_no': invoice_no})
+            else:
+                results.append({'index': start + index, 'success': False, 'error': errors[index]})
+    
+    return results
+
+
 def delete_sale(db: Session, sale_id: int):
     db_sale = get_sale(db, sale_id)
     if db_sale:
-        # Restore product quantities
-        for item in db_sale.items:
-            if item.product_id:
-                product = get_product(db, item.product_id)
-                if product:
-                    quantity_before = product.quantity
-                    product.quantity += item.quantity
-                    
-                    # Record inventory movement
-                    movement = models.InventoryMovement(
-                        product_id=product.id,
-                        movement_type='sale_reversal',
-                        quantity_before=quantity_before,
-                        quantity_change=item.quantity,
-                        quantity_after=product.quantity,
-                        reason='sale_deleted',
-                        reference_type='sale',
-                        reference_id=sale_id
-                    )
-                    db.add(movement)
+        _record_daily_summary(db, db_sale, db_sale.items, sign=-1)
+        
+        # Restore product quantities (items of deleted products have no product_id)
+        products = _lock_products(db, [item.product_id for item in db_sale.items])
+        _record_item_movements(db, db_sale.items, products, 1, 'sale_reversal', 'sale_deleted', 'sale', sale_id)
         
         # Update customer balance (prevent negative values)
         if db_sale.customer_id:
@@ -395,80 +1045,63 @@ def delete_sale(db: Session, sale_id: int):
         
         db.delete(db_sale)
         db.commit()
+        cache.invalidate(cache.SALES, cache.INVENTORY, cache.CUSTOMERS, cache.CASH)
+        fact_cache.invalidate()
         return True
     return False
 
 
-def update_sale(db: Session, sale_id: int, sale: schemas.SaleCreate, username: str = None):
-    """Update an existing sale - reverses old inventory and applies new"""
+def update_sale(db: Session, sale_id: int, sale: schemas.SaleCreate, user_id: int = None):
+    """Update an existing sale, writing only what changed.
+
+    The new lines are matched to the existing items by product: unchanged items
+    are left alone, changed ones are updated in place, and each product whose
+    quantity changed gets one net inventory movement.
+    """
     db_sale = get_sale(db, sale_id)
     if not db_sale:
         raise ValueError(f"Sale {sale_id} not found")
+    old_items = list(db_sale.items)
     
-    # Step 1: Restore old inventory (reverse the original sale)
-    old_customer = get_customer(db, db_sale.customer_id) if db_sale.customer_id else None
-    for item in db_sale.items:
-        if item.product_id:
-            product = get_product(db, item.product_id)
-            if product:
-                quantity_before = product.quantity
-                product.quantity += item.quantity
-                movement = models.InventoryMovement(
-                    product_id=product.id,
-                    movement_type='sale_reversal',
-                    quantity_before=quantity_before,
-                    quantity_change=item.quantity,
-                    quantity_after=product.quantity,
-                    reason='sale_edited',
-                    reference_type='sale',
-                    reference_id=sale_id
-                )
-                db.add(movement)
+    # Lock the products of both the old and the new lines in a single query
+    products = _lock_products(
+        db, [item.product_id for item in old_items] + [item.product_id for item in sale.items]
+    )
+    
+    # Stock already taken by this sale is available to its new lines
+    held = {}
+    for item in old_items:
+        if item.product_id in products:
+            held[item.product_id] = held.get(item.product_id, 0) + item.quantity
+    available = {pid: product.quantity + held.get(pid, 0) for pid, product in products.items()}
+    sale_items, requested, subtotal = _price_sale(sale, products, available)
+    
+    # Old figures for the daily summary, taken before anything is changed in place
+    summary_rows = _daily_summary_rows({}, [(
+        SimpleNamespace(sale_date=db_sale.sale_date, payment_method=db_sale.payment_method,
+                        total=db_sale.total, discount=db_sale.discount),
+        [SimpleNamespace(unit_cost=item.unit_cost, quantity=item.quantity, total=item.total) for item in old_items]
+    )], sign=-1)
     
     # Reverse old customer balance
+    old_customer = get_customer(db, db_sale.customer_id) if db_sale.customer_id else None
     if old_customer:
         old_customer.total_purchases = max(Decimal("0"), old_customer.total_purchases - db_sale.total)
         old_customer.balance = max(Decimal("0"), old_customer.balance - db_sale.remaining)
     
-    # Delete old sale items
-    for item in db_sale.items:
-        db.delete(item)
-    db.flush()
-    
-    # Step 2: Apply new sale data
     customer_name = sale.customer_name or "عميل نقدي"
-    if sale.customer_id:
-        customer = get_customer(db, sale.customer_id)
-        if customer:
-            customer_name = customer.name
-    
-    subtotal = Decimal("0")
-    sale_items = []
-    
-    for item in sale.items:
-        product = get_product(db, item.product_id)
-        if not product:
-            raise ValueError(f"Product {item.product_id} not found")
-        if product.quantity < item.quantity:
-            raise ValueError(f"Insufficient stock for {product.name}. Available: {product.quantity}")
-        
-        unit_price = item.unit_price if item.unit_price else product.sale_price
-        item_total = unit_price * item.quantity
-        subtotal += item_total
-        
-        sale_items.append({
-            'product_id': item.product_id,
-            'product_name': product.name,
-            'quantity': item.quantity,
-            'unit_price': unit_price,
-            'total': item_total
-        })
+    if old_customer and old_customer.id == sale.customer_id:
+        new_customer = old_customer
+    else:
+        new_customer = get_customer(db, sale.customer_id) if sale.customer_id else None
+    if new_customer:
+        customer_name = new_customer.name
     
     total = subtotal - sale.discount
     remaining = total - sale.paid
     status = "مدفوعة" if remaining <= 0 else ("جزئي" if sale.paid > 0 else "غير مدفوعة")
     
-    # Update sale record
+    # Update sale record (the flush only writes columns whose value changed)
     db_sale.customer_id = sale.customer_id
     db_sale.customer_name = customer_name
     db_sale.sale_date = sale.sale_date or date.today()
@@ -480,41 +1113,33 @@ def update_sale(db: Session, sale_id: int, sale: schemas.SaleCreate, username: s
     db_sale.status = status
     db_sale.payment_method = sale.payment_method if sale.paid > 0 else None
     db_sale.notes = sale.notes
-    db_sale.updated_by = db.query(models.User).filter(models.User.username == username).first().id if username else None
-    db.flush()
-    
-    # Create new sale items and update inventory
-    for item_data in sale_items:
-        db_item = models.SaleItem(
-            sale_id=db_sale.id,
-            **item_data
-        )
-        db.add(db_item)
-        
-        product = get_product(db, item_data['product_id'])
-        quantity_before = product.quantity
-        product.quantity -= item_data['quantity']
-        
-        movement = models.InventoryMovement(
-            product_id=product.id,
-            movement_type='sale',
-            quantity_before=quantity_before,
-            quantity_change=-item_data['quantity'],
-            quantity_after=product.quantity,
-            reason='sale_edited',
-            reference_type='sale',
-            reference_id=db_sale.id
-        )
-        db.add(movement)
+    db_sale.updated_by = user_id
+    
+    # Touch only the lines that changed; a kept line keeps the cost snapshot from the original sale
+    kept, added, removed = _match_lines(old_items, sale_items)
+    for db_item, line in kept:
+        for key, value in line.items():
+            if key != 'unit_cost':
+                setattr(db_item, key, value)
+    for db_item in removed:
+        db_sale.items.remove(db_item)
+    db_sale.items.extend(models.SaleItem(**line) for line in added)
+    
+    # One net movement per product whose quantity changed
+    deltas = {pid: held.get(pid, 0) - requested.get(pid, 0) for pid in set(held) | set(requested)}
+    _record_stock_changes(db, deltas, products, ('sale_reversal', 'sale'), 'sale_edited', 'sale', sale_id)
     
     # Update new customer balance
-    if sale.customer_id:
-        new_customer = get_customer(db, sale.customer_id)
-        if new_customer:
-            new_customer.total_purchases += total
-            new_customer.balance += max(remaining, Decimal("0"))
+    if new_customer:
+        new_customer.total_purchases += total
+        new_customer.balance += max(remaining, Decimal("0"))
+    
+    _daily_summary_rows(summary_rows, [(db_sale, db_sale.items)])
+    _write_daily_summary(db, summary_rows)
     
     db.commit()
+    cache.invalidate(cache.SALES, cache.INVENTORY, cache.CUSTOMERS, cache.CASH)
+    fact_cache.invalidate()
     db.refresh(db_sale)
     return db_sale
 
@@ -522,8 +1147,8 @@ def update_sale(db: Session, sale_id: int, sale: schemas.SaleCreate, username: s
 # ============================================
 # PURCHASE CRUD
 # ============================================
-def get_purchases(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Purchase).order_by(models.Purchase.id.desc()).offset(skip).limit(limit).all()
+def get_purchases(db: Session, cursor: str = None, limit: int = 100, include_items: bool = True) -> dict:
+    return _invoice_page(db, models.Purchase, models.PurchaseItem.purchase_id, cursor, limit, include_items)
 
 
 def get_purchase(db: Session, purchase_id: int):
@@ -531,74 +1156,69 @@ def get_purchase(db: Session, purchase_id: int):
 
 
 def generate_purchase_invoice_no(db: Session) -> str:
-    count = db.query(models.Purchase).count()
-    return f"PUR{str(count + 1).zfill(3)}"
+    return _next_invoice_no(db, "PUR", models.purchase_invoice_seq)
 
 
-def create_purchase(db: Session, purchase: schemas.PurchaseCreate, username: str = None, user_role: str = None):
-    """Create a purchase with cash validation.
-    
-    Args:
-        user_role: If 'admin', allows purchase even with insufficient cash (with warning returned).
-                  Other roles are blocked if cash is insufficient.
-    
-    Returns:
-        Tuple of (purchase_object, warning_message or None)
+def _price_purchase(purchase: schemas.PurchaseCreate, products: dict, supplier_names: dict):
+    """Price a purchase's lines against the loaded products and their suppliers' names.
+
+    Returns (purchase_items, subtotal). Raises ValueError if a product is missing.
     """
-    invoice_no = generate_purchase_invoice_no(db)
-    
-    supplier_name = purchase.supplier_name
-    if purchase.supplier_id:
-        supplier = get_supplier(db, purchase.supplier_id)
-        if supplier:
-            supplier_name = supplier.name
-    
     subtotal = Decimal("0")
     purchase_items = []
     
     for item in purchase.items:
-        product = get_product(db, item.product_id)
+        product = products.get(item.product_id)
         if not product:
             raise ValueError(f"Product {item.product_id} not found")
         
         item_total = item.unit_price * item.quantity
         subtotal += item_total
         
-        # Get supplier information from the product
-        item_supplier_id = product.supplier_id
-        item_supplier_name = None
-        if item_supplier_id:
-            supplier = get_supplier(db, item_supplier_id)
-            if supplier:
-                item_supplier_name = supplier.name
-        
+        # Supplier information comes from the product
         purchase_items.append({
             'product_id': item.product_id,
             'product_name': product.name,
-            'supplier_id': item_supplier_id,
-            'supplier_name': item_supplier_name,
+            'supplier_id': product.supplier_id,
+            'supplier_name': supplier_names.get(product.supplier_id),
             'quantity': item.quantity,
             'unit_price': item.unit_price,
             'total': item_total
         })
+    return purchase_items, subtotal
+
+
+def create_purchase(db: Session, purchase: schemas.PurchaseCreate, user_id: int = None, user_role: str = None):
+    """Create a purchase with cash validation.
+    
+    Args:
+        user_role: If 'admin', allows purchase even with insufficient cash (with warning returned).
+                  Other roles are blocked if cash is insufficient.
+    
+    Returns:
+        Tuple of (purchase_object, warning_message or None)
+    """
+    # Lock every product on the invoice, with its supplier's name, in a single query
+    products, supplier_names = _lock_products_with_suppliers(db, [item.product_id for item in purchase.items])
+    purchase_items, subtotal = _price_purchase(purchase, products, supplier_names)
+    
+    supplier = get_supplier(db, purchase.supplier_id) if purchase.supplier_id else None
+    supplier_name = supplier.name if supplier else purchase.supplier_name
     
     total = subtotal - purchase.discount
     remaining = total - purchase.paid
     status = "مدفوعة" if remaining <= 0 else ("جزئي" if purchase.paid > 0 else "غير مدفوعة")
     
-    # Validate cash balance if paying now (non-blocking if cash tracking fails)
+    # Validate the paying drawer and its balance if paying now
     warning_message = None
     if purchase.paid > 0:
-        try:
-            validation = validate_cash_for_purchase(db, purchase.paid, user_role or 'cashier')
-            if not validation['allowed']:
-                raise ValueError(validation['warning'])
-            warning_message = validation['warning']  # Will be None if sufficient funds
-        except ValueError:
-            raise  # Re-raise validation errors
-        except Exception as e:
-            print(f"Warning: Cash validation skipped: {e}")
-            warning_message = None
+        validation = validate_cash_for_purchase(db, purchase.paid, user_role or 'cashier', purchase.drawer_id)
+        if not validation['allowed']:
+            raise ValueError(validation['warning'])
+        warning_message = validation['warning']  # Will be None if sufficient funds
+    
+    # Numbered only once validated, so rejected purchases don't use up invoice numbers
+    invoice_no = generate_purchase_invoice_no(db)
     
     db_purchase = models.Purchase(
         invoice_no=invoice_no,
@@ -613,56 +1233,40 @@ def create_purchase(db: Session, purchase: schemas.PurchaseCreate, username: str
         status=status,
         payment_method=purchase.payment_method if purchase.paid > 0 else None,
         notes=purchase.notes,
-        created_by=db.query(models.User).filter(models.User.username == username).first().id if username else None
+        created_by=user_id
     )
+    # Added together so the flush writes the items as one multi-row INSERT
+    db_items = [models.PurchaseItem(**item_data) for item_data in purchase_items]
+    db_purchase.items = db_items
     db.add(db_purchase)
     db.flush()
     
-    for item_data in purchase_items:
-        db_item = models.PurchaseItem(
-            purchase_id=db_purchase.id,
-            **item_data
-        )
-        db.add(db_item)
-        
-        product = get_product(db, item_data['product_id'])
-        quantity_before = product.quantity
-        product.quantity += item_data['quantity']
-        
-        movement = models.InventoryMovement(
-            product_id=product.id,
-            movement_type='purchase',
-            quantity_before=quantity_before,
-            quantity_change=item_data['quantity'],
-            quantity_after=product.quantity,
-            reason='purchase',
-            reference_type='purchase',
-            reference_id=db_purchase.id
-        )
-        db.add(movement)
+    _record_item_movements(db, db_items, products, 1, 'purchase', 'purchase', 'purchase', db_purchase.id)
     
-    if purchase.supplier_id:
-        supplier = get_supplier(db, purchase.supplier_id)
-        if supplier:
-            supplier.total_purchases += total
-            supplier.balance += max(remaining, Decimal("0"))
+    if supplier:
+        supplier.total_purchases += total
+        supplier.balance += max(remaining, Decimal("0"))
     
-    # Record cash expense from payment (non-blocking if cash tracking fails)
+    # Record cash expense from payment
     if purchase.paid > 0:
-        try:
-            add_cash_transaction(
-                db=db,
-                transaction_type='purchase_expense',
-                amount=purchase.paid,
-                reference_type='purchase',
-                reference_id=db_purchase.id,
-                description=f'شراء - فاتورة {invoice_no}',
-                user_id=None
-            )
-        except Exception as cash_error:
-            print(f"Warning: Could not record cash transaction: {cash_error}")
+        transaction = add_cash_transaction(
+            db=db,
+            transaction_type='purchase_expense',
+            amount=purchase.paid,
+            reference_type='purchase',
+            reference_id=db_purchase.id,
+            description=f'شراء - فاتورة {invoice_no}',
+            user_id=None,
+            drawer_id=purchase.drawer_id
+        )
+        # Checked again against the locked balance: a concurrent payment may
+        # have drawn the drawer down since the validation above read it
+        if transaction.balance_after < 0 and (user_role or 'cashier') != 'admin':
+            db.rollback()
+            raise ValueError(_cash_shortage_warning(transaction.balance_before, purchase.paid))
     
     db.commit()
+    cache.invalidate(cache.PURCHASES, cache.INVENTORY, cache.SUPPLIERS, cache.CASH)
     db.refresh(db_purchase)
     return db_purchase, warning_message
 
@@ -670,31 +1274,22 @@ def create_purchase(db: Session, purchase: schemas.PurchaseCreate, username: str
 def delete_purchase(db: Session, purchase_id: int):
     db_purchase = get_purchase(db, purchase_id)
     if db_purchase:
-        # Validate stock before deleting
-        for item in db_purchase.items:
-            if item.product_id:
-                product = get_product(db, item.product_id)
-                if product and product.quantity < item.quantity:
-                    raise ValueError(f"Cannot delete purchase: would result in negative stock for {product.name}")
+        products = _lock_products(db, [item.product_id for item in db_purchase.items])
         
+        # Validate stock before deleting (lines repeating a product are taken back together)
+        taken = {}
         for item in db_purchase.items:
-            if item.product_id:
-                product = get_product(db, item.product_id)
-                if product:
-                    quantity_before = product.quantity
-                    product.quantity -= item.quantity
-                    
-                    movement = models.InventoryMovement(
-                        product_id=product.id,
-                        movement_type='purchase_reversal',
-                        quantity_before=quantity_before,
-                        quantity_change=-item.quantity,
-                        quantity_after=product.quantity,
-                        reason='purchase_deleted',
-                        reference_type='purchase',
-                        reference_id=purchase_id
-                    )
-                    db.add(movement)
+            if item.product_id in products:
+                taken[item.product_id] = taken.get(item.product_id, 0) + item.quantity
+        for product_id, quantity in taken.items():
+            if products[product_id].quantity < quantity:
+                raise ValueError(
+                    f"Cannot delete purchase: would result in negative stock for {products[product_id].name}"
+                )
+        
+        _record_item_movements(
+            db, db_purchase.items, products, -1, 'purchase_reversal', 'purchase_deleted', 'purchase', purchase_id
+        )
         
         # Update supplier balance (prevent negative values)
         if db_purchase.supplier_id:
@@ -705,93 +1300,59 @@ def delete_purchase(db: Session, purchase_id: int):
         
         db.delete(db_purchase)
         db.commit()
+        cache.invalidate(cache.PURCHASES, cache.INVENTORY, cache.SUPPLIERS, cache.CASH)
         return True
     return False
 
 
-def update_purchase(db: Session, purchase_id: int, purchase: schemas.PurchaseCreate, username: str = None):
-    """Update an existing purchase - reverses old inventory and applies new"""
+def update_purchase(db: Session, purchase_id: int, purchase: schemas.PurchaseCreate, user_id: int = None):
+    """Update an existing purchase, writing only what changed.
+
+    The new lines are matched to the existing items by product: unchanged items
+    are left alone, changed ones are updated in place, and each product whose
+    quantity changed gets one net inventory movement.
+    """
     db_purchase = get_purchase(db, purchase_id)
     if not db_purchase:
         raise ValueError(f"Purchase {purchase_id} not found")
+    old_items = list(db_purchase.items)
     
-    # Step 1: Validate that reversing won't cause negative stock
-    for item in db_purchase.items:
-        if item.product_id:
-            product = get_product(db, item.product_id)
-            if product and product.quantity < item.quantity:
-                raise ValueError(f"Cannot edit: would result in negative stock for {product.name}")
-    
-    # Step 2: Reverse old inventory
-    old_supplier = get_supplier(db, db_purchase.supplier_id) if db_purchase.supplier_id else None
-    for item in db_purchase.items:
-        if item.product_id:
-            product = get_product(db, item.product_id)
-            if product:
-                quantity_before = product.quantity
-                product.quantity -= item.quantity
-                movement = models.InventoryMovement(
-                    product_id=product.id,
-                    movement_type='purchase_reversal',
-                    quantity_before=quantity_before,
-                    quantity_change=-item.quantity,
-                    quantity_after=product.quantity,
-                    reason='purchase_edited',
-                    reference_type='purchase',
-                    reference_id=purchase_id
-                )
-                db.add(movement)
+    # Lock the products of both the old and the new lines, with their suppliers' names, in a single query
+    products, supplier_names = _lock_products_with_suppliers(
+        db, [item.product_id for item in old_items] + [item.product_id for item in purchase.items]
+    )
+    purchase_items, subtotal = _price_purchase(purchase, products, supplier_names)
+    
+    # Net stock change per product; only stock this purchase added can be taken back
+    deltas = {}
+    for item in old_items:
+        if item.product_id in products:
+            deltas[item.product_id] = deltas.get(item.product_id, 0) - item.quantity
+    for line in purchase_items:
+        deltas[line['product_id']] = deltas.get(line['product_id'], 0) + line['quantity']
+    for product_id, delta in deltas.items():
+        if products[product_id].quantity + delta < 0:
+            raise ValueError(f"Cannot edit: would result in negative stock for {products[product_id].name}")
     
     # Reverse old supplier balance
+    old_supplier = get_supplier(db, db_purchase.supplier_id) if db_purchase.supplier_id else None
     if old_supplier:
         old_supplier.total_purchases = max(Decimal("0"), old_supplier.total_purchases - db_purchase.total)
         old_supplier.balance = max(Decimal("0"), old_supplier.balance - db_purchase.remaining)
     
-    # Delete old purchase items
-    for item in db_purchase.items:
-        db.delete(item)
-    db.flush()
-    
-    # Step 3: Apply new purchase data
     supplier_name = purchase.supplier_name
-    if purchase.supplier_id:
-        supplier = get_supplier(db, purchase.supplier_id)
-        if supplier:
-            supplier_name = supplier.name
-    
-    subtotal = Decimal("0")
-    purchase_items = []
-    
-    for item in purchase.items:
-        product = get_product(db, item.product_id)
-        if not product:
-            raise ValueError(f"Product {item.product_id} not found")
-        
-        item_total = item.unit_price * item.quantity
-        subtotal += item_total
-        
-        item_supplier_id = product.supplier_id
-        item_supplier_name = None
-        if item_supplier_id:
-            item_supplier = get_supplier(db, item_supplier_id)
-            if item_supplier:
-                item_supplier_name = item_supplier.name
-        
-        purchase_items.append({
-            'product_id': item.product_id,
-            'product_name': product.name,
-            'supplier_id': item_supplier_id,
-            'supplier_name': item_supplier_name,
-            'quantity': item.quantity,
-            'unit_price': item.unit_price,
-            'total': item_total
-        })
+    if old_supplier and old_supplier.id == purchase.supplier_id:
+        new_supplier = old_supplier
+    else:
+        new_supplier = get_supplier(db, purchase.supplier_id) if purchase.supplier_id else None
+    if new_supplier:
+        supplier_name = new_supplier.name
     
     total = subtotal - purchase.discount
     remaining = total - purchase.paid
     status = "مدفوعة" if remaining <= 0 else ("جزئي" if purchase.paid > 0 else "غير مدفوعة")
     
-    # Update purchase record
+    # Update purchase record (the flush only writes columns whose value changed)
     db_purchase.supplier_id = purchase.supplier_id
     db_purchase.supplier_name = supplier_name
     db_purchase.purchase_date = purchase.purchase_date or date.today()
@@ -803,41 +1364,29 @@ def update_purchase(db: Session, purchase_id: int, purchase: schemas.PurchaseCre
     db_purchase.status = status
     db_purchase.payment_method = purchase.payment_method if purchase.paid > 0 else None
     db_purchase.notes = purchase.notes
-    db_purchase.updated_by = db.query(models.User).filter(models.User.username == username).first().id if username else None
-    db.flush()
-    
-    # Create new purchase items and update inventory
-    for item_data in purchase_items:
-        db_item = models.PurchaseItem(
-            purchase_id=db_purchase.id,
-            **item_data
-        )
-        db.add(db_item)
-        
-        product = get_product(db, item_data['product_id'])
-        quantity_before = product.quantity
-        product.quantity += item_data['quantity']
-        
-        movement = models.InventoryMovement(
-            product_id=product.id,
-            movement_type='purchase',
-            quantity_before=quantity_before,
-            quantity_change=item_data['quantity'],
-            quantity_after=product.quantity,
-            reason='purchase_edited',
-            reference_type='purchase',
-            reference_id=db_purchase.id
-        )
-        db.add(movement)
+    db_purchase.updated_by = user_id
+    
+    # Touch only the lines that changed
+    kept, added, removed = _match_lines(old_items, purchase_items)
+    for db_item, line in kept:
+        for key, value in line.items():
+            setattr(db_item, key, value)
+    for db_item in removed:
+        db_purchase.items.remove(db_item)
+    db_purchase.items.extend(models.PurchaseItem(**line) for line in added)
+    
+    # One net movement per product whose quantity changed
+    _record_stock_changes(
+        db, deltas, products, ('purchase', 'purchase_reversal'), 'purchase_edited', 'purchase', purchase_id
+    )
     
     # Update new supplier balance
-    if purchase.supplier_id:
-        new_supplier = get_supplier(db, purchase.supplier_id)
-        if new_supplier:
-            new_supplier.total_purchases += total
-            new_supplier.balance += max(remaining, Decimal("0"))
+    if new_supplier:
+        new_supplier.total_purchases += total
+        new_supplier.balance += max(remaining, Decimal("0"))
     
     db.commit()
+    cache.invalidate(cache.PURCHASES, cache.INVENTORY, cache.SUPPLIERS, cache.CASH)
     db.refresh(db_purchase)
     return db_purchase
 
@@ -845,45 +1394,64 @@ def update_purchase(db: Session, purchase_id: int, purchase: schemas.PurchaseCre
 # ============================================
 # INVENTORY CRUD
 # ============================================
-def get_inventory_movements(db: Session, product_id: int = None, skip: int = 0, limit: int = 100):
+def get_inventory_movements(db: Session, product_id: int = None, cursor: str = None, limit: int = 100) -> dict:
     query = db.query(models.InventoryMovement)
     if product_id:
         query = query.filter(models.InventoryMovement.product_id == product_id)
-    return query.order_by(models.InventoryMovement.created_at.desc()).offset(skip).limit(limit).all()
+    # Movements of one invoice share created_at; id keeps the order stable
+    return _keyset_page(
+        query, [models.InventoryMovement.created_at, models.InventoryMovement.id], cursor, limit
+    )
+
+
+def get_activity_logs(db: Session, entity_type: str = None, cursor: str = None, limit: int = 100) -> dict:
+    query = db.query(models.ActivityLog)
+    if entity_type:
+        query = query.filter(models.ActivityLog.entity_type == entity_type)
+    return _keyset_page(query, [models.ActivityLog.created_at, models.ActivityLog.id], cursor, limit)
 
 
 def adjust_inventory(db: Session, adjustment: schemas.InventoryAdjustment):
-    product = get_product(db, adjustment.product_id)
+    """Change one product's stock by hand and record the movement.
+
+    The row is locked first and changed with the same conditional UPDATE as
+    sales, so an adjustment can't overwrite a concurrent sale's decrement.
+    """
+    if adjustment.adjustment_type not in ('add', 'subtract', 'set'):
+        raise ValueError(f"Invalid adjustment type: {adjustment.adjustment_type}")
+    product = _lock_products(db, [adjustment.product_id]).get(adjustment.product_id)
     if not product:
         raise ValueError(f"Product {adjustment.product_id} not found")
     
-    quantity_before = product.quantity
-    
     if adjustment.adjustment_type == 'add':
-        product.quantity += adjustment.quantity
+        quantity_change = adjustment.quantity
     elif adjustment.adjustment_type == 'subtract':
-        if product.quantity < adjustment.quantity:
-            raise ValueError(f"Cannot subtract {adjustment.quantity}. Only {product.quantity} available.")
-        product.quantity -= adjustment.quantity
-    elif adjustment.adjustment_type == 'set':
-        product.quantity = adjustment.quantity
+        available = product.quantity
+        if available < adjustment.quantity:
+            db.rollback()
+            raise ValueError(f"Cannot subtract {adjustment.quantity}. Only {available} available.")
+        quantity_change = -adjustment.quantity
     else:
-        raise ValueError(f"Invalid adjustment type: {adjustment.adjustment_type}")
+        # The row is locked, so the stock it is set from can't change underneath
+        quantity_change = adjustment.quantity - product.quantity
     
-    quantity_change = product.quantity - quantity_before
+    quantity_after = _apply_stock_deltas(db, {product.id: quantity_change}, {product.id: product}).get(
+        product.id, product.quantity
+    )
     
     movement = models.InventoryMovement(
         product_id=product.id,
         movement_type=adjustment.adjustment_type,
-        quantity_before=quantity_before,
+        quantity_before=quantity_after - quantity_change,
         quantity_change=quantity_change,
-        quantity_after=product.quantity,
+        quantity_after=quantity_after,
         reason=adjustment.reason,
         reference_type='adjustment',
         notes=adjustment.notes
     )
     db.add(movement)
     db.commit()
+    cache.invalidate(cache.INVENTORY)
     db.refresh(movement)
     return movement
 
@@ -914,38 +1482,40 @@ def update_settings(db: Session, settings: List[schemas.SettingUpdate]):
 # ============================================
 # DASHBOARD & REPORTS
 # ============================================
+@cache.cached(cache.SALES, cache.INVENTORY, cache.CUSTOMERS)
 def get_dashboard_stats(db: Session):
-    total_sales = db.query(func.coalesce(func.sum(models.Sale.total), 0)).scalar()
-    total_products = db.query(models.Product).count()
-    total_customers = db.query(models.Customer).count()
-    
+    """Dashboard counters in two statements: a products aggregate, then sales/customers"""
+    total_products, low_stock_count = db.query(
+        func.count(models.Product.id),
+        func.count(models.Product.id).filter(models.Product.quantity <= models.Product.min_quantity)
+    ).one()
+
     today = date.today()
-    today_sales = db.query(models.Sale).filter(models.Sale.sale_date == today).all()
-    
-    today_profit = Decimal("0")
-    for sale in today_sales:
-        for item in sale.items:
-            if item.product_id:
-                product = db.query(models.Product).filter(models.Product.id == item.product_id).first()
-                if product:
-                    profit = (item.unit_price - product.purchase_price) * item.quantity
-                    today_profit += profit
-    
-    min_stock_setting = db.query(models.Setting).filter(models.Setting.key == 'min_stock_alert').first()
-    min_stock = int(min_stock_setting.value) if min_stock_setting and min_stock_setting.value else 5
-    low_stock_count = db.query(models.Product).filter(
-        models.Product.quantity <= models.Product.min_quantity
-    ).count()
-    
+    summary = models.DailySalesSummary
+    total_sales = db.query(func.coalesce(func.sum(summary.revenue), 0)).scalar_subquery()
+    total_customers = db.query(func.count(models.Customer.id)).scalar_subquery()
+    today_profit = db.query(
+        func.coalesce(func.sum(SUMMARY_PROFIT), 0)
+    ).filter(
+        summary.summary_date == today
+    ).scalar_subquery()
+
+    stats = db.query(
+        total_sales.label('total_sales'),
+        total_customers.label('total_customers'),
+        today_profit.label('today_profit')
+    ).one()
+
     return schemas.DashboardStats(
-        total_sales=total_sales,
+        total_sales=stats.total_sales,
         total_products=total_products,
-        total_customers=total_customers,
-        today_profit=today_profit,
+        total_customers=stats.total_customers,
+        today_profit=stats.today_profit,
         low_stock_count=low_stock_count
     )
 
 
+@cache.cached(cache.INVENTORY)
 def get_low_stock_products(db: Session):
     products = db.query(models.Product).filter(
         models.Product.quantity <= models.Product.min_quantity
@@ -971,45 +1541,42 @@ def get_low_stock_products(db: Session):
     return result
 
 
+@cache.cached(cache.SALES)
 def get_profit_report(db: Session, from_date: date = None, to_date: date = None):
-    query = db.query(models.Sale)
-    if from_date:
-        query = query.filter(models.Sale.sale_date >= from_date)
-    if to_date:
-        query = query.filter(models.Sale.sale_date <= to_date)
-    
-    sales = query.all()
-    
-    total_sales = Decimal("0")
-    total_cost = Decimal("0")
-    total_discount = Decimal("0")
-    
-    for sale in sales:
-        total_sales += sale.subtotal
-        total_discount += sale.discount
+    if fact_cache.enabled():
+        totals = fact_cache.store.sales_totals(db, from_date=from_date, to_date=to_date)
+    else:
+        summary = models.DailySalesSummary
+        query = db.query(
+            func.coalesce(func.sum(SUMMARY_SUBTOTAL), 0).label('total_sales'),
+            func.coalesce(func.sum(summary.discount), 0).label('total_discount'),
+            func.coalesce(func.sum(summary.invoice_count), 0).label('sales_count'),
+            func.coalesce(func.sum(summary.cost), 0).label('total_cost')
+        )
+        if from_date:
+            query = query.filter(summary.summary_date >= from_date)
+        if to_date:
+            query = query.filter(summary.summary_date <= to_date)
         
-        for item in sale.items:
-            if item.product_id:
-                product = db.query(models.Product).filter(models.Product.id == item.product_id).first()
-                if product:
-                    total_cost += product.purchase_price * item.quantity
+        totals = query.one()
     
-    gross_profit = total_sales - total_cost
-    net_profit = gross_profit - total_discount
+    gross_profit = totals.total_sales - totals.total_cost
+    net_profit = gross_profit - totals.total_discount
     
     return schemas.ProfitReport(
-        total_sales=total_sales,
-        total_cost=total_cost,
+        total_sales=totals.total_sales,
+        total_cost=totals.total_cost,
         gross_profit=gross_profit,
-        total_discount=total_discount,
+        total_discount=totals.total_discount,
         net_profit=net_profit,
-        sales_count=len(sales)
+        sales_count=int(totals.sales_count)
     )
 
 
 # ============================================
 # ANALYTICS FUNCTIONS
 # ============================================
+@cache.cached(cache.SALES)
 def get_sales_trend(db: Session, period: str = 'daily', days: int = 30):
     """Get sales trend data for charting"""
     from datetime import timedelta
@@ -1017,27 +1584,23 @@ def get_sales_trend(db: Session, period: str = 'daily', days: int = 30):
     today = date.today()
     start_date = today - timedelta(days=days)
     
-    sales = db.query(models.Sale).filter(
-        models.Sale.sale_date >= start_date
-    ).order_by(models.Sale.sale_date).all()
+    if fact_cache.enabled():
+        days_data = fact_cache.store.daily_totals(db, start_date)
+    else:
+        # Group by date (one summary row per day and payment method)
+        summary = models.DailySalesSummary
+        days_data = db.query(
+            summary.summary_date,
+            func.sum(summary.revenue),
+            func.sum(SUMMARY_PROFIT),
+            func.sum(summary.invoice_count)
+        ).filter(
+            summary.summary_date >= start_date
+        ).group_by(summary.summary_date).having(func.sum(summary.invoice_count) > 0).all()
     
-    # Group by date
     daily_data = {}
-    for sale in sales:
-        date_key = str(sale.sale_date)
-        if date_key not in daily_data:
-            daily_data[date_key] = {'sales': Decimal('0'), 'profit': Decimal('0'), 'orders': 0}
-        
-        daily_data[date_key]['sales'] += sale.total
-        daily_data[date_key]['orders'] += 1
-        
-        # Calculate profit for this sale
-        for item in sale.items:
-            if item.product_id:
-                product = db.query(models.Product).filter(models.Product.id == item.product_id).first()
-                if product:
-                    profit = (item.unit_price - product.purchase_price) * item.quantity
-                    daily_data[date_key]['profit'] += profit
+    for summary_date, sales_total, profit, orders in days_data:
+        daily_data[str(summary_date)] = {'sales': sales_total, 'profit': profit, 'orders': int(orders)}
     
     # Fill missing dates
     result = []
@@ -1063,80 +1626,125 @@ def get_sales_trend(db: Session, period: str = 'daily', days: int = 30):
     return schemas.SalesTrendReport(data=result, period=period)
 
 
-def get_top_products(db: Session, limit: int = 10):
-    """Get top selling products by revenue"""
-    # Aggregate sale items
-    from sqlalchemy import desc
-    
-    product_stats = {}
-    sale_items = db.query(models.SaleItem).all()
-    
-    for item in sale_items:
-        pid = item.product_id
-        if pid not in product_stats:
-            product = db.query(models.Product).filter(models.Product.id == pid).first()
-            product_stats[pid] = {
-                'id': pid,
-                'name': product.name if product else 'Unknown',
-                'quantity_sold': 0,
-                'revenue': Decimal('0'),
-                'profit': Decimal('0'),
-                'purchase_price': product.purchase_price if product else Decimal('0')
-            }
-        
-        product_stats[pid]['quantity_sold'] += item.quantity
-        product_stats[pid]['revenue'] += item.total
-        product_stats[pid]['profit'] += (item.unit_price - product_stats[pid]['purchase_price']) * item.quantity
+TOP_PRODUCTS_ORDER = ('revenue', 'quantity', 'profit')
+
+
+@cache.cached(cache.SALES, cache.INVENTORY)
+def get_top_products(db: Session, limit: int = 10, from_date: Optional[date] = None,
+                     to_date: Optional[date] = None, order_by: str = 'revenue'):
+    """Get top selling products by revenue, quantity or profit in one grouped query"""
+    if order_by not in TOP_PRODUCTS_ORDER:
+        raise ValueError(f"Invalid order_by: {order_by}")
+    
+    if fact_cache.enabled():
+        rows = fact_cache.store.top_products(db, limit, from_date=from_date, to_date=to_date, order_by=order_by)
+        return [schemas.TopProductItem(**row._asdict()) for row in rows]
+    
+    item = models.SaleItem
+    quantity_sold = func.sum(item.quantity).label('quantity_sold')
+    revenue = func.sum(item.total).label('revenue')
+    profit = func.sum(SALE_ITEM_PROFIT).label('profit')
+    # Deleted products keep their name on the sale item
+    name = func.coalesce(models.Product.name, func.max(item.product_name), 'Unknown').label('name')
+    
+    query = db.query(
+        item.product_id.label('id'), name, quantity_sold, revenue, profit
+    ).outerjoin(
+        models.Product, models.Product.id == item.product_id
+    ).filter(item.product_id.isnot(None))
     
-    # Sort by revenue and limit
-    sorted_products = sorted(product_stats.values(), key=lambda x: x['revenue'], reverse=True)[:limit]
+    if from_date or to_date:
+        query = query.join(models.Sale, models.Sale.id == item.sale_id)
+        if from_date:
+            query = query.filter(models.Sale.sale_date >= from_date)
+        if to_date:
+            query = query.filter(models.Sale.sale_date <= to_date)
+    
+    sort_key = {'revenue': revenue, 'quantity': quantity_sold, 'profit': profit}[order_by]
+    rows = query.group_by(item.product_id, models.Product.name).order_by(
+        sort_key.desc(), item.product_id
+    ).limit(limit).all()
     
     return [schemas.TopProductItem(
-        id=p['id'],
-        name=p['name'],
-        quantity_sold=p['quantity_sold'],
-        revenue=p['revenue'],
-        profit=p['profit']
-    ) for p in sorted_products]
+        id=row.id,
+        name=row.name,
+        quantity_sold=row.quantity_sold,
+        revenue=row.revenue,
+        profit=row.profit
+    ) for row in rows]
+
+
+@cache.cached(cache.SALES, cache.INVENTORY)
+def get_sales_by_category(db: Session, from_date: Optional[date] = None, to_date: Optional[date] = None):
+    """Quantity, revenue and profit per product category, by revenue; lines without one are grouped last"""
+    if fact_cache.enabled():
+        rows = fact_cache.store.sales_by_category(db, from_date=from_date, to_date=to_date)
+        return [schemas.CategorySalesItem(**row._asdict()) for row in rows]
+    
+    item = models.SaleItem
+    category_id = models.Product.category_id
+    revenue = func.sum(item.total).label('revenue')
+    
+    query = db.query(
+        category_id.label('category_id'),
+        func.coalesce(func.max(models.Category.name_ar), func.max(models.Category.name), fact_cache.UNCATEGORIZED).label('name'),
+        func.sum(item.quantity).label('quantity_sold'),
+        revenue,
+        func.sum(SALE_ITEM_PROFIT).label('profit')
+    ).select_from(item).outerjoin(
+        models.Product, models.Product.id == item.product_id
+    ).outerjoin(
+        models.Category, models.Category.id == category_id
+    )
+    
+    if from_date or to_date:
+        query = query.join(models.Sale, models.Sale.id == item.sale_id)
+        if from_date:
+            query = query.filter(models.Sale.sale_date >= from_date)
+        if to_date:
+            query = query.filter(models.Sale.sale_date <= to_date)
+    
+    rows = query.group_by(category_id).order_by(revenue.desc(), category_id.asc().nullslast()).all()
+    
+    return [schemas.CategorySalesItem(
+        category_id=row.category_id,
+        name=row.name,
+        quantity_sold=row.quantity_sold,
+        revenue=row.revenue,
+        profit=row.profit
+    ) for row in rows]
 
 
+@cache.cached(cache.INVENTORY)
 def get_inventory_value(db: Session):
     """Calculate total inventory value and stock health"""
-    products = db.query(models.Product).all()
+    is_out = models.Product.quantity == 0
+    is_low = and_(models.Product.quantity > 0, models.Product.quantity <= models.Product.min_quantity)
     
-    total_items = len(products)
-    total_quantity = 0
-    total_cost_value = Decimal('0')
-    total_sale_value = Decimal('0')
+    stats = db.query(
+        func.count(models.Product.id).label('total_items'),
+        func.coalesce(func.sum(models.Product.quantity), 0).label('total_quantity'),
+        func.coalesce(func.sum(models.Product.purchase_price * models.Product.quantity), 0).label('total_cost_value'),
+        func.coalesce(func.sum(models.Product.sale_price * models.Product.quantity), 0).label('total_sale_value'),
+        func.count(models.Product.id).filter(is_low).label('low_stock'),
+        func.count(models.Product.id).filter(is_out).label('out_of_stock')
+    ).one()
     
-    good_stock = 0
-    low_stock = 0
-    out_of_stock = 0
-    
-    for p in products:
-        total_quantity += p.quantity
-        total_cost_value += p.purchase_price * p.quantity
-        total_sale_value += p.sale_price * p.quantity
-        
-        if p.quantity == 0:
-            out_of_stock += 1
-        elif p.quantity <= p.min_quantity:
-            low_stock += 1
-        else:
-            good_stock += 1
+    good_stock = stats.total_items - stats.low_stock - stats.out_of_stock
     
     return schemas.InventoryValueReport(
-        total_items=total_items,
-        total_quantity=total_quantity,
-        total_cost_value=total_cost_value,
-        total_sale_value=total_sale_value,
-        potential_profit=total_sale_value - total_cost_value,
-        stock_health={'good': good_stock, 'low': low_stock, 'out': out_of_stock}
+        total_items=stats.total_items,
+        total_quantity=stats.total_quantity,
+        total_cost_value=stats.total_cost_value,
+        total_sale_value=stats.total_sale_value,
+        potential_profit=stats.total_sale_value - stats.total_cost_value,
+        stock_health={'good': good_stock, 'low': stats.low_stock, 'out': stats.out_of_stock}
     )
 
 
+@cache.cached(cache.SALES, cache.INVENTORY, cache.CUSTOMERS, cache.SUPPLIERS)
 def get_business_kpis(db: Session):
-    """Calculate comprehensive business KPIs"""
+    """Calculate comprehensive business KPIs with conditional aggregates in the database"""
     from datetime import timedelta
     
     today = date.today()
@@ -1145,64 +1753,73 @@ def get_business_kpis(db: Session):
     last_month_start = (month_start - timedelta(days=1)).replace(day=1)
     last_month_end = month_start - timedelta(days=1)
     
-    # Get all sales
-    all_sales = db.query(models.Sale).all()
-    today_sales = [s for s in all_sales if s.sale_date == today]
-    week_sales = [s for s in all_sales if s.sale_date >= week_ago]
-    month_sales = [s for s in all_sales if s.sale_date >= month_start]
-    last_month_sales = [s for s in all_sales if last_month_start <= s.sale_date <= last_month_end]
-    
-    # Revenue calculations
-    total_revenue = sum(s.total for s in all_sales) if all_sales else Decimal('0')
-    today_revenue = sum(s.total for s in today_sales) if today_sales else Decimal('0')
-    week_revenue = sum(s.total for s in week_sales) if week_sales else Decimal('0')
-    month_revenue = sum(s.total for s in month_sales) if month_sales else Decimal('0')
-    last_month_revenue = sum(s.total for s in last_month_sales) if last_month_sales else Decimal('0')
+    if fact_cache.enabled():
+        totals = fact_cache.store.kpi_totals(db, today, week_ago, month_start, last_month_start, last_month_end)
+    else:
+        summary = models.DailySalesSummary
+        in_today = summary.summary_date == today
+        in_week = summary.summary_date >= week_ago
+        in_month = summary.summary_date >= month_start
+        in_last_month = summary.summary_date.between(last_month_start, last_month_end)
+        
+        def total_of(column, *conditions):
+            total = func.sum(column)
+            if conditions:
+                total = total.filter(and_(*conditions))
+            return func.coalesce(total, 0)
+        
+        receivables = db.query(func.coalesce(func.sum(models.Customer.balance), 0)).scalar_subquery()
+        payables = db.query(func.coalesce(func.sum(models.Supplier.balance), 0)).scalar_subquery()
+        
+        totals = db.query(
+            total_of(summary.revenue).label('total_revenue'),
+            total_of(summary.revenue, in_today).label('today_revenue'),
+            total_of(summary.revenue, in_week).label('week_revenue'),
+            total_of(summary.revenue, in_month).label('month_revenue'),
+            total_of(summary.revenue, in_last_month).label('last_month_revenue'),
+            total_of(summary.invoice_count).label('total_orders'),
+            total_of(summary.invoice_count, in_month).label('month_orders'),
+            total_of(summary.invoice_count, in_last_month).label('last_month_orders'),
+            total_of(SUMMARY_SUBTOTAL).label('total_subtotal'),
+            total_of(summary.discount).label('total_discount'),
+            total_of(summary.cost).label('total_cost'),
+            receivables.label('pending_receivables'),
+            payables.label('pending_payables')
+        ).one()
     
     # Profit calculations
-    total_cost = Decimal('0')
-    total_discount = Decimal('0')
-    for sale in all_sales:
-        total_discount += sale.discount
-        for item in sale.items:
-            if item.product_id:
-                product = db.query(models.Product).filter(models.Product.id == item.product_id).first()
-                if product:
-                    total_cost += product.purchase_price * item.quantity
-    
-    gross_profit = sum(s.subtotal for s in all_sales) - total_cost if all_sales else Decimal('0')
-    net_profit = gross_profit - total_discount
+    total_revenue = totals.total_revenue
+    gross_profit = totals.total_subtotal - totals.total_cost
+    net_profit = gross_profit - totals.total_discount
     
     gross_margin = (gross_profit / total_revenue * 100) if total_revenue > 0 else Decimal('0')
     net_margin = (net_profit / total_revenue * 100) if total_revenue > 0 else Decimal('0')
     
     # Average order value
-    total_orders = len(all_sales)
+    total_orders = int(totals.total_orders)
     aov = total_revenue / total_orders if total_orders > 0 else Decimal('0')
     
-    # Receivables and Payables
-    pending_receivables = db.query(func.coalesce(func.sum(models.Customer.balance), 0)).scalar()
-    pending_payables = db.query(func.coalesce(func.sum(models.Supplier.balance), 0)).scalar()
-    
     # Inventory metrics
     inventory_data = get_inventory_value(db)
     
     # Growth calculations
+    month_revenue = totals.month_revenue
+    last_month_revenue = totals.last_month_revenue
     revenue_growth = ((month_revenue - last_month_revenue) / last_month_revenue * 100) if last_month_revenue > 0 else Decimal('0')
-    last_month_orders = len(last_month_sales)
-    orders_growth = ((len(month_sales) - last_month_orders) / last_month_orders * 100) if last_month_orders > 0 else Decimal('0')
+    last_month_orders = int(totals.last_month_orders)
+    orders_growth = ((int(totals.month_orders) - last_month_orders) / last_month_orders * 100) if last_month_orders > 0 else Decimal('0')
     
     return schemas.BusinessKPIs(
         total_revenue=total_revenue,
-        today_revenue=today_revenue,
-        this_week_revenue=week_revenue,
+        today_revenue=totals.today_revenue,
+        this_week_revenue=totals.week_revenue,
         this_month_revenue=month_revenue,
         gross_profit_margin=round(gross_margin, 2),
         net_profit_margin=round(net_margin, 2),
         average_order_value=round(aov, 2),
         total_orders=total_orders,
-        pending_receivables=pending_receivables,
-        pending_payables=pending_payables,
+        pending_receivables=totals.pending_receivables,
+        pending_payables=totals.pending_payables,
         inventory_value=inventory_data.total_cost_value,
         inventory_items=inventory_data.total_items,
         low_stock_items=inventory_data.stock_health['low'],
@@ -1212,52 +1829,218 @@ def get_business_kpis(db: Session):
     )
 
 
-def get_top_customers(db: Session, limit: int = 10):
-    """Get top customers by purchase amount"""
-    customers = db.query(models.Customer).order_by(models.Customer.total_purchases.desc()).limit(limit).all()
+@cache.cached(cache.SALES, cache.CUSTOMERS)
+def get_top_customers(db: Session, limit: int = 10, from_date: Optional[date] = None,
+                      to_date: Optional[date] = None):
+    """
+    Get top customers by purchase amount with order counts and last purchase in one query.
+    With a date range, customers are ranked by what they bought within it.
+    """
+    sale = models.Sale
+    stats = db.query(
+        sale.customer_id.label('customer_id'),
+        func.count(sale.id).label('orders_count'),
+        func.max(sale.sale_date).label('last_purchase'),
+        func.sum(sale.total).label('period_purchases')
+    ).filter(sale.customer_id.isnot(None))
+    if from_date:
+        stats = stats.filter(sale.sale_date >= from_date)
+    if to_date:
+        stats = stats.filter(sale.sale_date <= to_date)
+    stats = stats.group_by(sale.customer_id).subquery()
     
-    result = []
-    for c in customers:
-        # Count orders
-        orders_count = db.query(models.Sale).filter(models.Sale.customer_id == c.id).count()
-        # Get last purchase date
-        last_sale = db.query(models.Sale).filter(
-            models.Sale.customer_id == c.id
-        ).order_by(models.Sale.sale_date.desc()).first()
-        
-        result.append(schemas.CustomerAnalyticsItem(
-            id=c.id,
-            name=c.name,
-            total_purchases=c.total_purchases,
-            orders_count=orders_count,
-            balance=c.balance,
-            last_purchase=last_sale.sale_date if last_sale else None
-        ))
+    if from_date or to_date:
+        total_purchases = stats.c.period_purchases
+        query = db.query(models.Customer, stats).join(stats, stats.c.customer_id == models.Customer.id)
+    else:
+        total_purchases = models.Customer.total_purchases
+        query = db.query(models.Customer, stats).outerjoin(stats, stats.c.customer_id == models.Customer.id)
+    
+    rows = query.add_columns(total_purchases.label('total_purchases')).order_by(
+        total_purchases.desc(), models.Customer.id
+    ).limit(limit).all()
+    
+    return [schemas.CustomerAnalyticsItem(
+        id=row.Customer.id,
+        name=row.Customer.name,
+        total_purchases=row.total_purchases,
+        orders_count=row.orders_count or 0,
+        balance=row.Customer.balance,
+        last_purchase=row.last_purchase
+    ) for row in rows]
+
+
+FINANCIAL_REPORT_PERIODS = {
+    # period: (days back from today, bucket size)
+    'week': (7, 'day'),
+    'month': (30, 'day'),
+    '3months': (90, 'week'),
+    '6months': (180, 'week'),
+    'year': (365, 'month'),
+}
+
+
+def _bucket_key(bucket: date, group_by: str) -> str:
+    """Chart label for a bucket, using ISO weeks so year boundaries line up"""
+    if group_by == 'day':
+        return bucket.strftime('%Y-%m-%d')
+    elif group_by == 'week':
+        iso_year, iso_week, _ = bucket.isocalendar()
+        return f"{iso_year}-W{iso_week:02d}"
+    return bucket.strftime('%Y-%m')
+
+
+@cache.cached(cache.SALES, cache.PURCHASES)
+def get_financial_report(db: Session, period: str = 'month'):
+    """
+    Sales, purchases and profit per day/week/month bucket.
+    Buckets are built with date_trunc and generate_series, so the database returns
+    one row per bucket (empty buckets included) instead of every invoice in the period.
+    """
+    from datetime import timedelta
     
-    return result
+    if period not in FINANCIAL_REPORT_PERIODS:
+        raise ValueError(f"Invalid period: {period}")
+    days, group_by = FINANCIAL_REPORT_PERIODS[period]
+    today = date.today()
+    start_date = today - timedelta(days=days)
+    
+    def bucket_of(column):
+        return cast(func.date_trunc(group_by, cast(column, DateTime)), Date)
+    
+    summary = models.DailySalesSummary
+    sales = db.query(
+        bucket_of(summary.summary_date).label('bucket'),
+        func.sum(summary.revenue).label('sales'),
+        func.sum(SUMMARY_PROFIT).label('profit'),
+        func.sum(summary.invoice_count).label('sales_count')
+    ).filter(
+        summary.summary_date.between(start_date, today)
+    ).group_by(bucket_of(summary.summary_date)).subquery()
+    
+    purchases = db.query(
+        bucket_of(models.Purchase.purchase_date).label('bucket'),
+        func.sum(models.Purchase.total).label('purchases'),
+        func.count(models.Purchase.id).label('purchases_count')
+    ).filter(
+        models.Purchase.purchase_date.between(start_date, today)
+    ).group_by(bucket_of(models.Purchase.purchase_date)).subquery()
+    
+    buckets = func.generate_series(
+        func.date_trunc(group_by, cast(start_date, DateTime)),
+        func.date_trunc(group_by, cast(today, DateTime)),
+        cast(f'1 {group_by}', Interval)
+    ).table_valued('bucket').render_derived()
+    bucket = cast(buckets.c.bucket, Date)
+    
+    rows = db.query(
+        bucket.label('bucket'),
+        func.coalesce(sales.c.sales, 0).label('sales'),
+        func.coalesce(sales.c.profit, 0).label('profit'),
+        func.coalesce(sales.c.sales_count, 0).label('sales_count'),
+        func.coalesce(purchases.c.purchases, 0).label('purchases'),
+        func.coalesce(purchases.c.purchases_count, 0).label('purchases_count')
+    ).select_from(buckets).outerjoin(
+        sales, sales.c.bucket == bucket
+    ).outerjoin(
+        purchases, purchases.c.bucket == bucket
+    ).order_by(bucket).all()
+    
+    total_sales = float(sum(row.sales for row in rows))
+    total_purchases = float(sum(row.purchases for row in rows))
+    gross_profit = float(sum(row.profit for row in rows))
+    net_profit = total_sales - total_purchases
+    profit_margin = (gross_profit / total_sales * 100) if total_sales > 0 else 0
+    
+    trend_data = [{
+        'date': _bucket_key(row.bucket, group_by),
+        'sales': round(float(row.sales), 2),
+        'purchases': round(float(row.purchases), 2),
+        'profit': round(float(row.profit), 2)
+    } for row in rows]
+    
+    return {
+        'period': period,
+        'start_date': start_date.isoformat(),
+        'end_date': today.isoformat(),
+        'summary': {
+            'total_sales': round(total_sales, 2),
+            'total_purchases': round(total_purchases, 2),
+            'gross_profit': round(gross_profit, 2),
+            'net_profit': round(net_profit, 2),
+            'profit_margin': round(profit_margin, 2),
+            'sales_count': int(sum(row.sales_count for row in rows)),
+            'purchases_count': int(sum(row.purchases_count for row in rows))
+        },
+        'trend_data': trend_data
+    }
 
 
 # ============================================
 # CASH MANAGEMENT CRUD
 # ============================================
-def get_cash_balance(db: Session) -> Decimal:
-    """Get the current cash balance from the latest transaction"""
-    last_transaction = db.query(models.CashTransaction).order_by(
-        models.CashTransaction.id.desc()
-    ).first()
-    
-    if last_transaction:
-        return last_transaction.balance_after
-    return Decimal("0")
+DEFAULT_CASH_DRAWER_ID = 1
+DEFAULT_CASH_DRAWER_NAME = "الصندوق الرئيسي"
+
+
+def ensure_main_cash_drawer(db: Session):
+    """Create the main drawer (id 1) if missing; sales, purchases and capital use it by default"""
+    drawer = models.CashDrawer
+    db.execute(pg_insert(drawer).values(
+        id=DEFAULT_CASH_DRAWER_ID, name=DEFAULT_CASH_DRAWER_NAME, balance=0
+    ).on_conflict_do_nothing())
+    # The explicit id bypassed the serial; keep it ahead of existing rows
+    db.execute(text(
+        "SELECT setval(pg_get_serial_sequence('cash_drawers', 'id'), GREATEST(MAX(id), 1)) FROM cash_drawers"
+    ))
+    db.commit()
+
 
+def get_cash_drawers(db: Session, include_inactive: bool = False):
+    query = db.query(models.CashDrawer)
+    if not include_inactive:
+        query = query.filter(models.CashDrawer.is_active == True)
+    return query.order_by(models.CashDrawer.id).all()
 
-def get_cash_transactions(db: Session, skip: int = 0, limit: int = 100, transaction_type: str = None):
-    """Get list of cash transactions with optional filtering"""
+
+def create_cash_drawer(db: Session, drawer: schemas.CashDrawerCreate):
+    if db.query(models.CashDrawer).filter(models.CashDrawer.name == drawer.name).first():
+        raise ValueError(f"Cash drawer '{drawer.name}' already exists")
+    db_drawer = models.CashDrawer(name=drawer.name, balance=Decimal("0"))
+    db.add(db_drawer)
+    db.commit()
+    cache.invalidate(cache.CASH)
+    db.refresh(db_drawer)
+    return db_drawer
+
+
+def _active_drawer_ids(db: Session, drawer_ids) -> set:
+    """Which of `drawer_ids` are active cash drawers, in one query"""
+    return set(db.execute(select(models.CashDrawer.id).where(
+        models.CashDrawer.id.in_(drawer_ids), models.CashDrawer.is_active == True
+    )).scalars())
+
+
+def get_cash_balance(db: Session, drawer_id: int = None) -> Decimal:
+    """Balance of one drawer (primary key lookup), or of all drawers together when drawer_id is None"""
+    if drawer_id is not None:
+        balance = db.query(models.CashDrawer.balance).filter(models.CashDrawer.id == drawer_id).scalar()
+    else:
+        balance = db.query(func.sum(models.CashDrawer.balance)).scalar()
+    return balance if balance is not None else Decimal("0")
+
+
+def get_cash_transactions(db: Session, cursor: str = None, limit: int = 100, transaction_type: str = None,
+                          drawer_id: int = None) -> dict:
+    """Get a page of cash transactions with optional filtering"""
     query = db.query(models.CashTransaction)
     if transaction_type:
         query = query.filter(models.CashTransaction.transaction_type == transaction_type)
+    if drawer_id is not None:
+        query = query.filter(models.CashTransaction.drawer_id == drawer_id)
     
-    transactions = query.order_by(models.CashTransaction.id.desc()).offset(skip).limit(limit).all()
+    page = _keyset_page(query, [models.CashTransaction.id], cursor, limit)
+    transactions = page['items']
     
     # Enrich with user names
     result = []
@@ -1277,12 +2060,13 @@ def get_cash_transactions(db: Session, skip: int = 0, limit: int = 100, transact
             'reference_type': t.reference_type,
             'reference_id': t.reference_id,
             'description': t.description,
+            'drawer_id': t.drawer_id,
             'created_by': t.created_by,
             'created_by_name': user_name,
             'created_at': t.created_at
         })
     
-    return result
+    return {'items': result, 'next_cursor': page['next_cursor']}
 
 
 def add_cash_transaction(
@@ -1292,35 +2076,79 @@ def add_cash_transaction(
     reference_type: str = None,
     reference_id: int = None,
     description: str = None,
-    user_id: int = None
+    user_id: int = None,
+    drawer_id: int = None
 ) -> models.CashTransaction:
-    """Record a cash transaction (internal function used by other operations)"""
-    current_balance = get_cash_balance(db)
-    
-    # Calculate new balance based on transaction type
+    """Record a cash transaction on a drawer (internal function used by other operations)"""
+    return add_cash_transactions(db, transaction_type, [{
+        'amount': amount,
+        'reference_type': reference_type,
+        'reference_id': reference_id,
+        'description': description,
+        'drawer_id': drawer_id
+    }], user_id=user_id)[0]
+
+
+def add_cash_transactions(db: Session, transaction_type: str, entries: list,
+                          user_id: int = None) -> List[models.CashTransaction]:
+    """Record cash transactions of one type; entries are dicts of add_cash_transaction's arguments.
+
+    Each drawer's balance is changed once, with a single UPDATE ... RETURNING
+    for the entries' total, which holds that drawer's row lock until the caller
+    commits: transactions on the same drawer chain their balance_before and
+    balance_after correctly, and different drawers never wait on each other.
+    """
+    # Signed change based on transaction type
     if transaction_type in ['deposit', 'sale_income', 'purchase_refund']:
-        new_balance = current_balance + amount
+        sign = 1
     elif transaction_type in ['withdrawal', 'purchase_expense', 'sale_refund']:
-        new_balance = current_balance - amount
+        sign = -1
     else:
         raise ValueError(f"Unknown transaction type: {transaction_type}")
     
-    transaction = models.CashTransaction(
-        transaction_type=transaction_type,
-        amount=amount,
-        balance_before=current_balance,
-        balance_after=new_balance,
-        reference_type=reference_type,
-        reference_id=reference_id,
-        description=description,
-        created_by=user_id
-    )
-    db.add(transaction)
-    return transaction
+    totals = {}
+    for entry in entries:
+        drawer_id = entry.get('drawer_id') or DEFAULT_CASH_DRAWER_ID
+        totals[drawer_id] = totals.get(drawer_id, Decimal("0")) + sign * entry['amount']
+    
+    # Drawers are locked in id order so concurrent batches can't deadlock
+    drawer = models.CashDrawer
+    balances = {}
+    for drawer_id in sorted(totals):
+        new_balance = db.execute(
+            update(drawer).where(
+                drawer.id == drawer_id, drawer.is_active == True
+            ).values(
+                balance=drawer.balance + totals[drawer_id], updated_at=func.now()
+            ).returning(drawer.balance)
+        ).scalar()
+        if new_balance is None:
+            raise ValueError(f"Cash drawer {drawer_id} not found")
+        balances[drawer_id] = new_balance - totals[drawer_id]
+    
+    transactions = []
+    for entry in entries:
+        drawer_id = entry.get('drawer_id') or DEFAULT_CASH_DRAWER_ID
+        current_balance = balances[drawer_id]
+        balances[drawer_id] += sign * entry['amount']
+        transactions.append(models.CashTransaction(
+            transaction_type=transaction_type,
+            amount=entry['amount'],
+            balance_before=current_balance,
+            balance_after=balances[drawer_id],
+            reference_type=entry.get('reference_type'),
+            reference_id=entry.get('reference_id'),
+            description=entry.get('description'),
+            drawer_id=drawer_id,
+            created_by=user_id
+        ))
+    db.add_all(transactions)
+    return transactions
 
 
-def deposit_capital(db: Session, amount: Decimal, description: str = None, user_id: int = None) -> models.CashTransaction:
-    """Owner deposits capital into the cash register"""
+def deposit_capital(db: Session, amount: Decimal, description: str = None, user_id: int = None,
+                    drawer_id: int = None) -> models.CashTransaction:
+    """Owner deposits capital into a cash drawer"""
     if amount <= 0:
         raise ValueError("المبلغ يجب أن يكون أكبر من صفر")
     
@@ -1330,51 +2158,65 @@ def deposit_capital(db: Session, amount: Decimal, description: str = None, user_
         amount=amount,
         reference_type='manual',
         description=description or "إضافة رأس مال",
-        user_id=user_id
+        user_id=user_id,
+        drawer_id=drawer_id
     )
     db.commit()
+    cache.invalidate(cache.CASH)
     db.refresh(transaction)
     return transaction
 
 
-def withdraw_capital(db: Session, amount: Decimal, description: str = None, user_id: int = None) -> models.CashTransaction:
-    """Owner withdraws capital from the cash register"""
+def withdraw_capital(db: Session, amount: Decimal, description: str = None, user_id: int = None,
+                     drawer_id: int = None) -> models.CashTransaction:
+    """Owner withdraws capital from a cash drawer"""
     if amount <= 0:
         raise ValueError("المبلغ يجب أن يكون أكبر من صفر")
     
-    current_balance = get_cash_balance(db)
-    if amount > current_balance:
-        raise ValueError(f"رصيد الصندوق غير كافٍ. المتاح: {current_balance}")
-    
     transaction = add_cash_transaction(
         db=db,
         transaction_type='withdrawal',
         amount=amount,
         reference_type='manual',
         description=description or "سحب رأس مال",
-        user_id=user_id
+        user_id=user_id,
+        drawer_id=drawer_id
     )
+    # Checked against the locked balance, so two withdrawals can't both pass
+    if transaction.balance_after < 0:
+        db.rollback()
+        raise ValueError(f"رصيد الصندوق غير كافٍ. المتاح: {transaction.balance_before}")
     db.commit()
+    cache.invalidate(cache.CASH)
     db.refresh(transaction)
     return transaction
 
 
-def validate_cash_for_purchase(db: Session, amount: Decimal, user_role: str) -> dict:
+def _cash_shortage_warning(balance: Decimal, amount: Decimal) -> str:
+    return f"رصيد الصندوق غير كافٍ! المتاح: {balance} - المطلوب: {amount} - العجز: {amount - balance}"
+
+
+def validate_cash_for_purchase(db: Session, amount: Decimal, user_role: str, drawer_id: int = None) -> dict:
     """
-    Validate if there's enough cash for a purchase.
+    Validate if the paying drawer has enough cash for a purchase.
     Returns: {'allowed': bool, 'warning': str or None, 'balance': Decimal}
     
     - Admin users get a warning but can proceed
     - Other users are blocked if insufficient funds
+    Raises ValueError if the drawer doesn't exist or is inactive.
     """
-    current_balance = get_cash_balance(db)
+    drawer_id = drawer_id or DEFAULT_CASH_DRAWER_ID
+    current_balance = db.query(models.CashDrawer.balance).filter(
+        models.CashDrawer.id == drawer_id, models.CashDrawer.is_active == True
+    ).scalar()
+    if current_balance is None:
+        raise ValueError(f"Cash drawer {drawer_id} not found")
     
     if amount <= current_balance:
         return {'allowed': True, 'warning': None, 'balance': current_balance}
     
     # Insufficient funds
-    shortage = amount - current_balance
-    warning_msg = f"رصيد الصندوق غير كافٍ! المتاح: {current_balance} - المطلوب: {amount} - العجز: {shortage}"
+    warning_msg = _cash_shortage_warning(current_balance, amount)
     
     if user_role == 'admin':
         # Admin can proceed with warning
@@ -1382,3 +2224,112 @@ def validate_cash_for_purchase(db: Session, amount: Decimal, user_role: str) ->
     else:
         # Non-admin is blocked
         return {'allowed': False, 'warning': warning_msg, 'balance': current_balance}
+
+
+# ============================================
+# IDEMPOTENCY KEYS
+# ============================================
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", "24"))
+# How long a claim is reserved for the request that made it; after that a retry
+# takes the key over, assuming the first request died. Must outlast the slowest request.
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "120"))
+
+
+def claim_idempotency_key(db: Session, scope: str, key: str, payload: dict):
+    """Reserve an Idempotency-Key for a new request, or return the record of an earlier one.
+
+    Returns None when the caller now owns the key: it should run the request
+    inside pin_idempotency_key_on_commit and then call complete_idempotency_key
+    (or release_idempotency_key on failure). Otherwise returns the existing
+    IdempotencyKey, either completed (status_code set, to be replayed) or still
+    being processed by the first request. A claim whose lease ran out without
+    its work committing is taken over.
+    Raises ValueError if the key was used for a different request.
+    """
+    request_hash = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+    table = models.IdempotencyKey
+    
+    stmt = pg_insert(table).values(
+        scope=scope,
+        key=key,
+        request_hash=request_hash,
+        locked_until=func.now() + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS),
+        expires_at=func.now() + timedelta(hours=IDEMPOTENCY_KEY_TTL_HOURS)
+    )
+    # The primary key makes concurrent retries race for one row; an expired row,
+    # or an abandoned claim past its lease, is taken over
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.scope, table.key],
+        set_={
+            'request_hash': stmt.excluded.request_hash,
+            'status_code': None,
+            'response': null(),
+            'created_at': func.now(),
+            'locked_until': stmt.excluded.locked_until,
+            'expires_at': stmt.excluded.expires_at
+        },
+        where=or_(
+            table.expires_at < func.now(),
+            and_(table.status_code.is_(None), table.locked_until < func.now())
+        )
+    ).returning(table.key)
+    claimed = db.execute(stmt).first()
+    db.commit()
+    if claimed:
+        return None
+    
+    existing = db.query(table).filter(table.scope == scope, table.key == key).first()
+    if existing is None:
+        # The first request failed and released the key in between; claim it again
+        return claim_idempotency_key(db, scope, key, payload)
+    if existing.request_hash != request_hash:
+        raise ValueError("Idempotency-Key was already used for a different request")
+    return existing
+
+
+@contextmanager
+def pin_idempotency_key_on_commit(db: Session, scope: str, key: str):
+    """Within the block, every commit of `db` also extends the claim's lease to its expiry.
+
+    The request's work and the pin commit together, so once anything is
+    committed the key can't be taken over or released: if storing the response
+    then fails, retries get 409 instead of running the request a second time.
+    """
+    table = models.IdempotencyKey
+
+    def pin(session):
+        session.execute(update(table).where(
+            table.scope == scope, table.key == key, table.status_code.is_(None)
+        ).values(locked_until=table.expires_at))
+
+    event.listen(db, "before_commit", pin)
+    try:
+        yield
+    finally:
+        event.remove(db, "before_commit", pin)
+
+
+def complete_idempotency_key(db: Session, scope: str, key: str, status_code: int, response):
+    """Store the response of a claimed key so retries replay it"""
+    table = models.IdempotencyKey
+    db.query(table).filter(table.scope == scope, table.key == key).update(
+        {'status_code': status_code, 'response': response}, synchronize_session=False
+    )
+    db.commit()
+
+
+def release_idempotency_key(db: Session, scope: str, key: str):
+    """Give up a claimed key after the request failed, so a retry runs it again (unless its work was committed)"""
+    db.rollback()
+    table = models.IdempotencyKey
+    db.query(table).filter(
+        table.scope == scope, table.key == key, table.status_code.is_(None), table.locked_until < table.expires_at
+    ).delete(synchronize_session=False)
+    db.commit()
+
+
+def purge_expired_idempotency_keys(db: Session) -> int:
+    table = models.IdempotencyKey
+    deleted = db.query(table).filter(table.expires_at < func.now()).delete(synchronize_session=False)
+    db.commit()
+    return deleted
@@ -0,0 +1,328 @@
+"""
+Columnar in-memory sales facts for the analytics functions
+
+With ANALYTICS_ENGINE=columnar, sales and sale lines are held in NumPy arrays
+(dates as day numbers, money as integer cents) and the analytics in crud.py
+are answered with vectorized reductions instead of SQL. The arrays are loaded
+on startup, appended to by create_sale and reloaded after any other change to
+sales. Other workers' writes are detected through the cache.SALES version
+counter, so multi-worker deployments need the shared (redis) cache backend.
+
+Requires numpy; the default engine (sql) does not.
+"""
+import os
+import threading
+from collections import namedtuple
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+
+from sqlalchemy import select, func, cast, literal, type_coerce, BigInteger, Integer, Date
+from sqlalchemy.orm import Session
+
+import models
+import cache
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency, only needed for the columnar engine
+    np = None
+
+ANALYTICS_ENGINE = os.getenv("ANALYTICS_ENGINE", "sql")
+
+EPOCH = date(1970, 1, 1)
+
+# Name reported for lines whose product has no category (or was deleted)
+UNCATEGORIZED = "غير مصنف"
+
+TopProductRow = namedtuple('TopProductRow', ['id', 'name', 'quantity_sold', 'revenue', 'profit'])
+CategorySalesRow = namedtuple('CategorySalesRow', ['category_id', 'name', 'quantity_sold', 'revenue', 'profit'])
+
+
+def enabled() -> bool:
+    return ANALYTICS_ENGINE == "columnar"
+
+
+def _day(value: date) -> int:
+    return (value - EPOCH).days
+
+
+def _money(cents) -> Decimal:
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def _cents(column):
+    return cast(column * 100, BigInteger)
+
+
+def _day_number(column):
+    # date - date is an integer number of days in PostgreSQL
+    return type_coerce(column - literal(EPOCH, Date), Integer)
+
+
+class _Columns:
+    """Named int64 columns with amortized appends"""
+
+    def __init__(self, names, rows):
+        data = np.array(rows, dtype=np.int64).reshape(-1, len(names))
+        self.names = names
+        self.size = len(data)
+        self._data = {name: np.ascontiguousarray(data[:, i]) for i, name in enumerate(names)}
+
+    def append(self, rows):
+        count = len(rows)
+        capacity = len(self._data[self.names[0]])
+        if self.size + count > capacity:
+            new_capacity = max(capacity * 2, self.size + count, 1024)
+            for name, column in self._data.items():
+                grown = np.zeros(new_capacity, dtype=np.int64)
+                grown[:self.size] = column[:self.size]
+                self._data[name] = grown
+        for i, name in enumerate(self.names):
+            self._data[name][self.size:self.size + count] = [row[i] for row in rows]
+        self.size += count
+
+    def view(self):
+        """Fixed-length views of the columns; later appends never touch them"""
+        return SimpleNamespace(size=self.size, **{name: self._data[name][:self.size] for name in self.names})
+
+
+def _group_sum(keys, *values):
+    """Unique keys and the exact int64 sum of each value column per key"""
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]) if len(keys) else np.array([], dtype=np.int64)
+    sums = [np.add.reduceat(v[order], starts) if len(keys) else np.array([], dtype=np.int64) for v in values]
+    return sorted_keys[starts], sums
+
+
+class SalesFactStore:
+    SALE_COLUMNS = ('sale_id', 'day', 'total', 'discount')
+    LINE_COLUMNS = ('sale_id', 'day', 'product_id', 'category_id', 'customer_id', 'quantity', 'revenue', 'cost')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sales = None
+        self.lines = None
+        self.version = None
+        self.loaded_max_id = 0
+
+    def load(self, db: Session):
+        """(Re)load all sales facts from the database; returns views of the new columns"""
+        if np is None:
+            raise RuntimeError("ANALYTICS_ENGINE=columnar requires the 'numpy' package")
+        version = self._current_version()
+        sale = models.Sale
+        item = models.SaleItem
+        sales = db.execute(select(
+            sale.id, _day_number(sale.sale_date), _cents(sale.total), _cents(func.coalesce(sale.discount, 0))
+        )).all()
+        lines = db.execute(select(
+            item.sale_id,
+            _day_number(sale.sale_date),
+            func.coalesce(item.product_id, -1),
+            func.coalesce(models.Product.category_id, -1),
+            func.coalesce(sale.customer_id, -1),
+            item.quantity,
+            _cents(item.total),
+            func.coalesce(_cents(item.unit_cost) * item.quantity, _cents(item.total))
+        ).join(sale, sale.id == item.sale_id).outerjoin(models.Product, models.Product.id == item.product_id)).all()
+        with self._lock:
+            self.sales = _Columns(self.SALE_COLUMNS, sales)
+            self.lines = _Columns(self.LINE_COLUMNS, lines)
+            self.version = version
+            self.loaded_max_id = max((row[0] for row in sales), default=0)
+            return self.sales.view(), self.lines.view()
+
+    def invalidate(self):
+        with self._lock:
+            self.sales = None
+            self.lines = None
+
+    def record_sales(self, facts_list):
+        """Append newly committed sales; call once after the commit's cache.invalidate so versions line up"""
+        with self._lock:
+            if self.sales is None:
+                return
+            version = self._current_version()
+            if version is not None and self.version is not None and version != self.version + 1:
+                # Another worker changed sales in between; reload on next read
+                self.sales = None
+                self.lines = None
+                return
+            # The version is read before the snapshot, so load() may already hold a sale
+            # committed just before it whose version bump came after; don't count it twice.
+            # Only ids up to the largest one loaded need checking.
+            loaded = self.sales.view().sale_id
+            facts_list = [
+                (sale_row, line_rows) for sale_row, line_rows in facts_list
+                if sale_row[0] > self.loaded_max_id or not np.any(loaded == sale_row[0])
+            ]
+            self.sales.append([sale_row for sale_row, _ in facts_list])
+            self.lines.append([row for _, line_rows in facts_list for row in line_rows])
+            self.version = version
+
+    def _current_version(self):
+        if cache.backend is None:
+            return None
+        return cache.backend.versions((cache.SALES,))[0]
+
+    def _snapshot(self, db: Session):
+        """Current (sales, lines) columns, reloading if they are missing or stale"""
+        current = self._current_version()
+        with self._lock:
+            if self.sales is not None and self.version == current:
+                return self.sales.view(), self.lines.view()
+        return self.load(db)
+
+    # ----------------------------------------
+    # Aggregates mirroring the SQL implementations in crud.py
+    # ----------------------------------------
+    def sales_totals(self, db: Session, from_date: date = None, to_date: date = None):
+        sales, lines = self._snapshot(db)
+        sale_mask = _date_mask(sales.day, from_date, to_date)
+        line_mask = _date_mask(lines.day, from_date, to_date)
+        return _totals(sales, lines, sale_mask, line_mask)
+
+    def daily_totals(self, db: Session, start_date: date):
+        """(date, revenue, profit, orders) per day with sales since start_date"""
+        sales, lines = self._snapshot(db)
+        sale_mask = sales.day >= _day(start_date)
+        line_mask = lines.day >= _day(start_date)
+        days, (revenue, orders) = _group_sum(sales.day[sale_mask], sales.total[sale_mask], np.ones(int(sale_mask.sum()), dtype=np.int64))
+        line_days, (line_profit,) = _group_sum(lines.day[line_mask], lines.revenue[line_mask] - lines.cost[line_mask])
+        profit_by_day = dict(zip(line_days.tolist(), line_profit.tolist()))
+        return [
+            (date.fromordinal(EPOCH.toordinal() + day), _money(day_revenue), _money(profit_by_day.get(day, 0)), count)
+            for day, day_revenue, count in zip(days.tolist(), revenue.tolist(), orders.tolist())
+        ]
+
+    def top_products(self, db: Session, limit: int, from_date: date = None, to_date: date = None,
+                     order_by: str = 'revenue'):
+        _, lines = self._snapshot(db)
+        mask = _date_mask(lines.day, from_date, to_date) & (lines.product_id >= 0)
+        line_revenue = lines.revenue[mask]
+        product_ids, (quantity, revenue, profit) = _group_sum(
+            lines.product_id[mask], lines.quantity[mask], line_revenue, line_revenue - lines.cost[mask]
+        )
+        sort_key = {'revenue': revenue, 'quantity': quantity, 'profit': profit}[order_by]
+        top = np.lexsort((product_ids, -sort_key))[:limit]
+        ids = product_ids[top].tolist()
+        names = dict(db.query(models.Product.id, models.Product.name).filter(models.Product.id.in_(ids)).all()) if ids else {}
+        return [
+            TopProductRow(pid, names.get(pid, 'Unknown'), qty, _money(rev), _money(prof))
+            for pid, qty, rev, prof in zip(ids, quantity[top].tolist(), revenue[top].tolist(), profit[top].tolist())
+        ]
+
+    def sales_by_category(self, db: Session, from_date: date = None, to_date: date = None):
+        _, lines = self._snapshot(db)
+        mask = _date_mask(lines.day, from_date, to_date)
+        line_revenue = lines.revenue[mask]
+        category_ids, (quantity, revenue, profit) = _group_sum(
+            lines.category_id[mask], lines.quantity[mask], line_revenue, line_revenue - lines.cost[mask]
+        )
+        # Uncategorized (-1) sorts after the categories on equal revenue, like NULLS LAST
+        order = np.lexsort((np.where(category_ids < 0, np.iinfo(np.int64).max, category_ids), -revenue))
+        ids = category_ids[order].tolist()
+        names = dict(db.query(
+            models.Category.id, func.coalesce(models.Category.name_ar, models.Category.name)
+        ).filter(models.Category.id.in_(ids)).all()) if ids else {}
+        return [
+            CategorySalesRow(cid if cid >= 0 else None, names.get(cid, UNCATEGORIZED), qty, _money(rev), _money(prof))
+            for cid, qty, rev, prof in zip(ids, quantity[order].tolist(), revenue[order].tolist(), profit[order].tolist())
+        ]
+
+    def kpi_totals(self, db: Session, today: date, week_ago: date, month_start: date,
+                   last_month_start: date, last_month_end: date):
+        sales, lines = self._snapshot(db)
+        everything = _totals(sales, lines, np.ones(sales.size, dtype=bool), np.ones(lines.size, dtype=bool))
+
+        def window(from_date, to_date=None):
+            mask = _date_mask(sales.day, from_date, to_date)
+            return _money(sales.total[mask].sum()), int(mask.sum())
+
+        month_revenue, month_orders = window(month_start)
+        last_month_revenue, last_month_orders = window(last_month_start, last_month_end)
+        receivables = db.query(func.coalesce(func.sum(models.Customer.balance), 0)).scalar_subquery()
+        payables = db.query(func.coalesce(func.sum(models.Supplier.balance), 0)).scalar_subquery()
+        pending = db.query(receivables.label('receivables'), payables.label('payables')).one()
+        return SimpleNamespace(
+            total_revenue=everything.total_revenue,
+            today_revenue=window(today, today)[0],
+            week_revenue=window(week_ago)[0],
+            month_revenue=month_revenue,
+            last_month_revenue=last_month_revenue,
+            total_orders=everything.sales_count,
+            month_orders=month_orders,
+            last_month_orders=last_month_orders,
+            total_subtotal=everything.total_sales,
+            total_discount=everything.total_discount,
+            total_cost=everything.total_cost,
+            pending_receivables=pending.receivables,
+            pending_payables=pending.payables
+        )
+
+
+def _date_mask(days, from_date: date = None, to_date: date = None):
+    mask = np.ones(len(days), dtype=bool)
+    if from_date:
+        mask &= days >= _day(from_date)
+    if to_date:
+        mask &= days <= _day(to_date)
+    return mask
+
+
+def _totals(sales, lines, sale_mask, line_mask):
+    total = sales.total[sale_mask].sum()
+    discount = sales.discount[sale_mask].sum()
+    return SimpleNamespace(
+        total_revenue=_money(total),
+        total_sales=_money(total + discount),
+        total_discount=_money(discount),
+        total_cost=_money(lines.cost[line_mask].sum()),
+        sales_count=int(sale_mask.sum())
+    )
+
+
+store = SalesFactStore()
+
+
+def warm_up(db: Session):
+    """Load the store at startup so the first request doesn't pay for it"""
+    if enabled():
+        store.load(db)
+
+
+def sale_facts(db_sale: models.Sale, items: list):
+    """Fact rows for a new sale, taken before commit expires the ORM objects"""
+    if not enabled():
+        return None
+    day = _day(db_sale.sale_date)
+    customer_id = db_sale.customer_id if db_sale.customer_id is not None else -1
+    sale_row = (db_sale.id, day, int(db_sale.total * 100), int((db_sale.discount or 0) * 100))
+    line_rows = [(
+        db_sale.id, day,
+        item.product_id if item.product_id is not None else -1,
+        item.product.category_id if item.product is not None and item.product.category_id is not None else -1,
+        customer_id,
+        item.quantity,
+        int(item.total * 100),
+        int(item.total * 100) if item.unit_cost is None else int(item.unit_cost * 100) * item.quantity
+    ) for item in items]
+    return sale_row, line_rows
+
+
+def record_sale(facts):
+    if facts is not None:
+        store.record_sales([facts])
+
+
+def record_sales(facts_list):
+    facts_list = [facts for facts in facts_list if facts is not None]
+    if facts_list:
+        store.record_sales(facts_list)
+
+
+def invalidate():
+    if enabled():
+        store.invalidate()
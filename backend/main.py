@@ -2,9 +2,10 @@
 Sales Management System - FastAPI Backend
 نظام إدارة المبيعات - الواجهة الخلفية
 """
-from fastapi import FastAPI, Depends, HTTPException, Query, UploadFile, File, Request
+from fastapi import FastAPI, Depends, HTTPException, Query, UploadFile, File, Request, Header
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from typing import List, Optional
@@ -14,10 +15,12 @@ import io
 import json
 import os
 
-from database import get_db, engine
+from database import get_db, engine, SessionLocal
 import models
 import schemas
 import crud
+import fact_cache
+import activity_logger
 from auth import (
     get_password_hash, verify_password, create_access_token, 
     get_current_user, get_current_user_optional, require_admin, require_manager, require_cashier,
@@ -44,32 +47,110 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Largest page the cursor-paginated list endpoints return
+PAGE_LIMIT_MAX = int(os.getenv("PAGE_LIMIT_MAX", "500"))
+
+
+@app.on_event("startup")
+def ensure_cash_drawer():
+    """Make sure the main cash drawer exists before sales and purchases use it"""
+    db = SessionLocal()
+    try:
+        crud.ensure_main_cash_drawer(db)
+    finally:
+        db.close()
+
+
+@app.on_event("startup")
+def purge_idempotency_keys():
+    """Drop expired Idempotency-Key records"""
+    db = SessionLocal()
+    try:
+        crud.purge_expired_idempotency_keys(db)
+    finally:
+        db.close()
+
+
+@app.on_event("shutdown")
+def flush_activity_log():
+    """Write the activity log entries still queued"""
+    activity_logger.stop()
+
+
+@app.on_event("startup")
+def load_analytics_facts():
+    """Load the in-memory sales facts when ANALYTICS_ENGINE=columnar"""
+    db = SessionLocal()
+    try:
+        fact_cache.warm_up(db)
+    finally:
+        db.close()
+
+
+# ============================================
+# CURRENT USER HELPER
+# ============================================
+def current_user_id(db: Session, user: Optional[TokenData]) -> Optional[int]:
+    """Id of the logged-in user, from the token's uid claim (older tokens fall back to a lookup)"""
+    if user is None:
+        return None
+    if user.user_id is not None:
+        return user.user_id
+    return db.query(models.User.id).filter(models.User.username == user.username).scalar()
+
 
 # ============================================
 # ACTIVITY LOG HELPER
 # ============================================
-def log_activity(db: Session, user: Optional[TokenData], action: str, entity_type: str = None, 
+def log_activity(user: Optional[TokenData], action: str, entity_type: str = None, 
                  entity_id: int = None, entity_name: str = None, details: str = None, request: Request = None):
-    """Log user activity for audit trail"""
+    """Log user activity for audit trail (written in the background by activity_logger)"""
+    ip_address = None
+    if request:
+        ip_address = request.client.host if request.client else None
+    
+    activity_logger.log(
+        user_id=user.user_id if user else None,
+        username=user.username if user else "anonymous",
+        action=action,
+        entity_type=entity_type,
+        entity_id=entity_id,
+        entity_name=entity_name,
+        details=details,
+        ip_address=ip_address
+    )
+
+
+# ============================================
+# IDEMPOTENCY HELPER
+# ============================================
+def run_idempotent(db: Session, scope: str, key: Optional[str], payload: dict, response_model, create):
+    """
+    Run create() at most once per Idempotency-Key header value.
+    A retry with the same key and body gets the stored response back
+    (marked with an Idempotent-Replayed header) without creating anything.
+    """
+    if not key:
+        return create()
     try:
-        ip_address = None
-        if request:
-            ip_address = request.client.host if request.client else None
-        
-        log = models.ActivityLog(
-            user_id=None,  # We'll get this from username lookup if needed
-            username=user.username if user else "anonymous",
-            action=action,
-            entity_type=entity_type,
-            entity_id=entity_id,
-            entity_name=entity_name,
-            details=details,
-            ip_address=ip_address
-        )
-        db.add(log)
-        db.commit()
-    except Exception as e:
-        print(f"Error logging activity: {e}")
+        stored = crud.claim_idempotency_key(db, scope, key, payload)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if stored is not None:
+        if stored.status_code is None:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still being processed")
+        return JSONResponse(content=stored.response, status_code=stored.status_code,
+                            headers={"Idempotent-Replayed": "true"})
+    
+    try:
+        with crud.pin_idempotency_key_on_commit(db, scope, key):
+            result = create()
+    except BaseException:
+        crud.release_idempotency_key(db, scope, key)
+        raise
+    response = jsonable_encoder(response_model.model_validate(result))
+    crud.complete_idempotency_key(db, scope, key, 200, response)
+    return response
 
 
 # ============================================
@@ -103,19 +184,12 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
     db.commit()
     
     access_token = create_access_token(
-        data={"sub": user.username, "role": user.role},
+        data={"sub": user.username, "role": user.role, "uid": user.id},
         expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     )
     
     # Log login activity
-    log = models.ActivityLog(
-        user_id=user.id,
-        username=user.username,
-        action="login",
-        entity_type="auth"
-    )
-    db.add(log)
-    db.commit()
+    activity_logger.log(user_id=user.id, username=user.username, action="login", entity_type="auth")
     
     return {
         "access_token": access_token,
@@ -132,7 +206,10 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
 @app.get("/api/auth/me", response_model=UserResponse)
 def get_current_user_info(current_user: TokenData = Depends(get_current_user), db: Session = Depends(get_db)):
     """Get current user information"""
-    user = db.query(models.User).filter(models.User.username == current_user.username).first()
+    if current_user.user_id is not None:
+        user = db.get(models.User, current_user.user_id)
+    else:
+        user = db.query(models.User).filter(models.User.username == current_user.username).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
@@ -141,16 +218,9 @@ def get_current_user_info(current_user: TokenData = Depends(get_current_user), d
 @app.post("/api/auth/logout")
 def logout(current_user: TokenData = Depends(get_current_user), db: Session = Depends(get_db)):
     """Logout (logs the action)"""
-    user = db.query(models.User).filter(models.User.username == current_user.username).first()
-    if user:
-        log = models.ActivityLog(
-            user_id=user.id,
-            username=user.username,
-            action="logout",
-            entity_type="auth"
-        )
-        db.add(log)
-        db.commit()
+    user_id = current_user_id(db, current_user)
+    if user_id:
+        activity_logger.log(user_id=user_id, username=current_user.username, action="logout", entity_type="auth")
     return {"message": "تم تسجيل الخروج بنجاح"}
 
 
@@ -180,7 +250,7 @@ def create_user(user: UserCreate, current_user: TokenData = Depends(require_admi
     db.commit()
     db.refresh(db_user)
     
-    log_activity(db, current_user, "create", "user", db_user.id, db_user.username)
+    log_activity(current_user, "create", "user", db_user.id, db_user.username)
     return db_user
 
 
@@ -203,7 +273,7 @@ def update_user(user_id: int, user_update: UserUpdate, current_user: TokenData =
     db.commit()
     db.refresh(db_user)
     
-    log_activity(db, current_user, "update", "user", db_user.id, db_user.username)
+    log_activity(current_user, "update", "user", db_user.id, db_user.username)
     return db_user
 
 
@@ -221,7 +291,7 @@ def delete_user(user_id: int, current_user: TokenData = Depends(require_admin),
     db.delete(db_user)
     db.commit()
     
-    log_activity(db, current_user, "delete", "user", user_id, username)
+    log_activity(current_user, "delete", "user", user_id, username)
     return {"message": "تم حذف المستخدم بنجاح"}
 
 
@@ -230,17 +300,17 @@ def delete_user(user_id: int, current_user: TokenData = Depends(require_admin),
 # ============================================
 @app.get("/api/activity-logs")
 def get_activity_logs(
-    skip: int = 0, 
-    limit: int = 100,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=PAGE_LIMIT_MAX),
     entity_type: Optional[str] = None,
     current_user: TokenData = Depends(require_manager), 
     db: Session = Depends(get_db)
 ):
     """Get activity logs (admin/manager only)"""
-    query = db.query(models.ActivityLog).order_by(models.ActivityLog.created_at.desc())
-    if entity_type:
-        query = query.filter(models.ActivityLog.entity_type == entity_type)
-    return query.offset(skip).limit(limit).all()
+    try:
+        return crud.get_activity_logs(db, entity_type=entity_type, cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 # ============================================
@@ -285,12 +355,24 @@ def delete_category(category_id: int, db: Session = Depends(get_db)):
 # ============================================
 # SUPPLIER ENDPOINTS
 # ============================================
-@app.get("/api/suppliers", response_model=List[schemas.SupplierResponse])
-def get_suppliers(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_suppliers(db, skip=skip, limit=limit)
+@app.get("/api/suppliers", response_model=schemas.SupplierPage)
+def get_suppliers(
+    search: Optional[str] = None,
+    has_balance: Optional[bool] = None,
+    sort: str = 'id',
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=PAGE_LIMIT_MAX),
+    db: Session = Depends(get_db)
+):
+    """Suppliers filtered by name/code/phone and balance, sorted by e.g. sort=name or sort=-balance"""
+    try:
+        return crud.get_suppliers(db, search=search, has_balance=has_balance, sort=sort, skip=skip, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
-# NOTE: generate-code must come BEFORE {supplier_id} to avoid route conflict
+# NOTE: generate-code must come BEFORE {supplier_id} to avoid route conflict.
+# Each call reserves a new code, so an unused one leaves a gap in the numbering.
 @app.get("/api/suppliers/generate-code", response_model=dict)
 def generate_supplier_code(db: Session = Depends(get_db)):
     return {"code": crud.generate_supplier_code(db)}
@@ -330,12 +412,24 @@ def delete_supplier(supplier_id: int, db: Session = Depends(get_db)):
 # ============================================
 # CUSTOMER ENDPOINTS
 # ============================================
-@app.get("/api/customers", response_model=List[schemas.CustomerResponse])
-def get_customers(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_customers(db, skip=skip, limit=limit)
+@app.get("/api/customers", response_model=schemas.CustomerPage)
+def get_customers(
+    search: Optional[str] = None,
+    has_balance: Optional[bool] = None,
+    sort: str = 'id',
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=PAGE_LIMIT_MAX),
+    db: Session = Depends(get_db)
+):
+    """Customers filtered by name/code/phone and balance, sorted by e.g. sort=name or sort=-balance"""
+    try:
+        return crud.get_customers(db, search=search, has_balance=has_balance, sort=sort, skip=skip, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
-# NOTE: generate-code must come BEFORE {customer_id} to avoid route conflict
+# NOTE: generate-code must come BEFORE {customer_id} to avoid route conflict.
+# Each call reserves a new code, so an unused one leaves a gap in the numbering.
 @app.get("/api/customers/generate-code", response_model=dict)
 def generate_customer_code(db: Session = Depends(get_db)):
     return {"code": crud.generate_customer_code(db)}
@@ -375,56 +469,46 @@ def delete_customer(customer_id: int, db: Session = Depends(get_db)):
 # ============================================
 # PRODUCT ENDPOINTS
 # ============================================
-@app.get("/api/products", response_model=List[schemas.ProductSimple])
+@app.get("/api/products", response_model=schemas.ProductPage)
 def get_products(
-    skip: int = 0, 
-    limit: int = 100, 
+    search: Optional[str] = None,
     category: Optional[str] = None,
+    supplier_id: Optional[int] = None,
+    low_stock: Optional[bool] = None,
+    sort: str = 'id',
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=PAGE_LIMIT_MAX),
     db: Session = Depends(get_db)
 ):
-    return crud.get_products_with_details(db, skip=skip, limit=limit, category=category)
+    """Products filtered by name/code, category code, supplier and stock level, sorted by e.g. sort=-quantity"""
+    try:
+        return crud.get_products_page(
+            db, search=search, category=category, supplier_id=supplier_id, low_stock=low_stock,
+            sort=sort, skip=skip, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
-# NOTE: generate-code must come BEFORE {product_id} to avoid route conflict
+# NOTE: generate-code must come BEFORE {product_id} to avoid route conflict.
+# Each call reserves a new code, so an unused one leaves a gap in the numbering.
 @app.get("/api/products/generate-code", response_model=dict)
 def generate_product_code(db: Session = Depends(get_db)):
     return {"code": crud.generate_product_code(db)}
 
 
-@app.get("/api/products/{product_id}", response_model=schemas.ProductResponse)
-def get_product(product_id: int, db: Session = Depends(get_db)):
-    product = crud.get_product(db, product_id)
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return product
-
-
-@app.post("/api/products", response_model=schemas.ProductResponse)
-def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db)):
-    existing = crud.get_product_by_code(db, product.code)
-    if existing:
-        raise HTTPException(status_code=400, detail="Product code already exists")
-    return crud.create_product(db, product)
-
-
-@app.put("/api/products/{product_id}", response_model=schemas.ProductResponse)
-def update_product(product_id: int, product: schemas.ProductUpdate, db: Session = Depends(get_db)):
-    updated = crud.update_product(db, product_id, product)
-    if not updated:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return updated
-
-
-@app.delete("/api/products/{product_id}")
-def delete_product(product_id: int, db: Session = Depends(get_db)):
-    if not crud.delete_product(db, product_id):
-        raise HTTPException(status_code=404, detail="Product not found")
-    return {"message": "Product deleted successfully"}
+# Also registered before {product_id}
+@app.get("/api/products/search", response_model=List[schemas.ProductSimple])
+def search_products(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=50),
+    db: Session = Depends(get_db)
+):
+    """Point-of-sale lookup: an exact code (barcode) or a partial, Arabic-normalized name"""
+    return crud.search_products(db, q, limit=limit)
 
 
-# ============================================
-# PRODUCTS CSV IMPORT/EXPORT
-# ============================================
+# Registered before /api/products/{product_id}, which would otherwise match it
 @app.get("/api/products/export-csv")
 def export_products_csv(db: Session = Depends(get_db)):
     """Export all products to CSV with UTF-8 BOM for Arabic Excel support"""
@@ -466,6 +550,40 @@ def export_products_csv(db: Session = Depends(get_db)):
     )
 
 
+@app.get("/api/products/{product_id}", response_model=schemas.ProductResponse)
+def get_product(product_id: int, db: Session = Depends(get_db)):
+    product = crud.get_product(db, product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return product
+
+
+@app.post("/api/products", response_model=schemas.ProductResponse)
+def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db)):
+    existing = crud.get_product_by_code(db, product.code)
+    if existing:
+        raise HTTPException(status_code=400, detail="Product code already exists")
+    return crud.create_product(db, product)
+
+
+@app.put("/api/products/{product_id}", response_model=schemas.ProductResponse)
+def update_product(product_id: int, product: schemas.ProductUpdate, db: Session = Depends(get_db)):
+    updated = crud.update_product(db, product_id, product)
+    if not updated:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return updated
+
+
+@app.delete("/api/products/{product_id}")
+def delete_product(product_id: int, db: Session = Depends(get_db)):
+    if not crud.delete_product(db, product_id):
+        raise HTTPException(status_code=404, detail="Product not found")
+    return {"message": "Product deleted successfully"}
+
+
+# ============================================
+# PRODUCTS CSV IMPORT/EXPORT
+# ============================================
 @app.post("/api/products/import-csv")
 async def import_products_csv(file: UploadFile = File(...), db: Session = Depends(get_db)):
     """Import products from CSV file with validation"""
@@ -540,9 +658,18 @@ async def import_products_csv(file: UploadFile = File(...), db: Session = Depend
 # ============================================
 # SALE ENDPOINTS
 # ============================================
-@app.get("/api/sales", response_model=List[schemas.SaleResponse])
-def get_sales(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_sales(db, skip=skip, limit=limit)
+@app.get("/api/sales", response_model=schemas.SalePage)
+def get_sales(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=PAGE_LIMIT_MAX),
+    include: str = Query('items', regex='^(items|none)$'),
+    db: Session = Depends(get_db)
+):
+    """include=none returns header rows with items_count only, without loading the items"""
+    try:
+        return crud.get_sales(db, cursor=cursor, limit=limit, include_items=include == 'items')
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.get("/api/sales/{sale_id}", response_model=schemas.SaleResponse)
@@ -556,16 +683,51 @@ def get_sale(sale_id: int, db: Session = Depends(get_db)):
 @app.post("/api/sales", response_model=schemas.SaleResponse)
 def create_sale(
     sale: schemas.SaleCreate, 
+    idempotency_key: Optional[str] = Header(None, max_length=255),
     db: Session = Depends(get_db),
     current_user: TokenData = Depends(get_current_user_optional)
 ):
-    try:
-        result = crud.create_sale(db, sale, username=current_user.username if current_user else None)
-        if current_user:
-            log_activity(db, current_user, "create", "sale", result.id, f"فاتورة بيع #{result.id}")
-        return result
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    username = current_user.username if current_user else None
+    
+    def create():
+        try:
+            result = crud.create_sale(db, sale, user_id=current_user_id(db, current_user))
+            if current_user:
+                log_activity(current_user, "create", "sale", result.id, f"فاتورة بيع #{result.id}")
+            return result
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    payload = {"user": username, "sale": sale.model_dump(mode="json")}
+    return run_idempotent(db, "sale", idempotency_key, payload, schemas.SaleResponse, create)
+
+
+@app.post("/api/sales/batch", response_model=schemas.SaleBatchResponse)
+def create_sales_batch(
+    batch: schemas.SaleBatchCreate,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    db: Session = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user_optional)
+):
+    """Create many sales in one request; each sale succeeds or fails on its own"""
+    username = current_user.username if current_user else None
+    
+    # With an Idempotency-Key the batch is one transaction: a failure part way
+    # leaves nothing committed, so a retry can safely run it again
+    chunk_size = len(batch.sales) if idempotency_key else batch.chunk_size
+    
+    def create():
+        results = crud.create_sales_batch(
+            db, batch.sales, user_id=current_user_id(db, current_user), chunk_size=chunk_size
+        )
+        created = [r for r in results if r['success']]
+        if current_user and created:
+            log_activity(current_user, "create", "sale", None, f"دفعة فواتير بيع ({len(created)})",
+                         details=", ".join(r['invoice_no'] for r in created))
+        return {"created": len(created), "failed": len(results) - len(created), "results": results}
+    
+    payload = {"user": username, "batch": batch.model_dump(mode="json")}
+    return run_idempotent(db, "sale_batch", idempotency_key, payload, schemas.SaleBatchResponse, create)
 
 
 @app.put("/api/sales/{sale_id}", response_model=schemas.SaleResponse)
@@ -577,8 +739,8 @@ def update_sale(
 ):
     """Update/Edit an existing sale (manager only) - adjusts inventory accordingly"""
     try:
-        result = crud.update_sale(db, sale_id, sale, username=current_user.username)
-        log_activity(db, current_user, "update", "sale", sale_id, f"تعديل فاتورة بيع #{sale_id}")
+        result = crud.update_sale(db, sale_id, sale, user_id=current_user_id(db, current_user))
+        log_activity(current_user, "update", "sale", sale_id, f"تعديل فاتورة بيع #{sale_id}")
         return result
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -593,16 +755,25 @@ def delete_sale(
     """Delete a sale (manager only) - restores inventory"""
     if not crud.delete_sale(db, sale_id):
         raise HTTPException(status_code=404, detail="Sale not found")
-    log_activity(db, current_user, "delete", "sale", sale_id, f"حذف فاتورة بيع #{sale_id}")
+    log_activity(current_user, "delete", "sale", sale_id, f"حذف فاتورة بيع #{sale_id}")
     return {"message": "Sale deleted successfully"}
 
 
 # ============================================
 # PURCHASE ENDPOINTS
 # ============================================
-@app.get("/api/purchases", response_model=List[schemas.PurchaseResponse])
-def get_purchases(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_purchases(db, skip=skip, limit=limit)
+@app.get("/api/purchases", response_model=schemas.PurchasePage)
+def get_purchases(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=PAGE_LIMIT_MAX),
+    include: str = Query('items', regex='^(items|none)$'),
+    db: Session = Depends(get_db)
+):
+    """include=none returns header rows with items_count only, without loading the items"""
+    try:
+        return crud.get_purchases(db, cursor=cursor, limit=limit, include_items=include == 'items')
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.get("/api/purchases/{purchase_id}", response_model=schemas.PurchaseResponse)
@@ -616,25 +787,32 @@ def get_purchase(purchase_id: int, db: Session = Depends(get_db)):
 @app.post("/api/purchases", response_model=schemas.PurchaseResponse)
 def create_purchase(
     purchase: schemas.PurchaseCreate, 
+    idempotency_key: Optional[str] = Header(None, max_length=255),
     db: Session = Depends(get_db),
     current_user: TokenData = Depends(get_current_user_optional)
 ):
-    try:
-        user_role = current_user.role if current_user else 'cashier'
-        result, warning = crud.create_purchase(
-            db, 
-            purchase, 
-            username=current_user.username if current_user else None,
-            user_role=user_role
-        )
-        if current_user:
-            log_activity(db, current_user, "create", "purchase", result.id, f"فاتورة شراء #{result.id}")
-        
-        # If there's a warning (admin with insufficient funds), we still return the purchase
-        # but the frontend should display the warning
-        return result
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    username = current_user.username if current_user else None
+    
+    def create():
+        try:
+            user_role = current_user.role if current_user else 'cashier'
+            result, warning = crud.create_purchase(
+                db, 
+                purchase, 
+                user_id=current_user_id(db, current_user),
+                user_role=user_role
+            )
+            if current_user:
+                log_activity(current_user, "create", "purchase", result.id, f"فاتورة شراء #{result.id}")
+            
+            # If there's a warning (admin with insufficient funds), we still return the purchase
+            # but the frontend should display the warning
+            return result
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    payload = {"user": username, "purchase": purchase.model_dump(mode="json")}
+    return run_idempotent(db, "purchase", idempotency_key, payload, schemas.PurchaseResponse, create)
 
 
 @app.put("/api/purchases/{purchase_id}", response_model=schemas.PurchaseResponse)
@@ -646,8 +824,8 @@ def update_purchase(
 ):
     """Update/Edit an existing purchase (manager only) - adjusts inventory accordingly"""
     try:
-        result = crud.update_purchase(db, purchase_id, purchase, username=current_user.username)
-        log_activity(db, current_user, "update", "purchase", purchase_id, f"تعديل فاتورة شراء #{purchase_id}")
+        result = crud.update_purchase(db, purchase_id, purchase, user_id=current_user_id(db, current_user))
+        log_activity(current_user, "update", "purchase", purchase_id, f"تعديل فاتورة شراء #{purchase_id}")
         return result
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -660,23 +838,30 @@ def delete_purchase(
     current_user: TokenData = Depends(require_manager)
 ):
     """Delete a purchase (manager only) - reduces inventory"""
-    if not crud.delete_purchase(db, purchase_id):
+    try:
+        deleted = crud.delete_purchase(db, purchase_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not deleted:
         raise HTTPException(status_code=404, detail="Purchase not found")
-    log_activity(db, current_user, "delete", "purchase", purchase_id, f"حذف فاتورة شراء #{purchase_id}")
+    log_activity(current_user, "delete", "purchase", purchase_id, f"حذف فاتورة شراء #{purchase_id}")
     return {"message": "Purchase deleted successfully"}
 
 
 # ============================================
 # INVENTORY ENDPOINTS
 # ============================================
-@app.get("/api/inventory/movements", response_model=List[schemas.InventoryMovementResponse])
+@app.get("/api/inventory/movements", response_model=schemas.InventoryMovementPage)
 def get_inventory_movements(
     product_id: Optional[int] = None,
-    skip: int = 0, 
-    limit: int = 100, 
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=PAGE_LIMIT_MAX),
     db: Session = Depends(get_db)
 ):
-    return crud.get_inventory_movements(db, product_id=product_id, skip=skip, limit=limit)
+    try:
+        return crud.get_inventory_movements(db, product_id=product_id, cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.post("/api/inventory/adjust", response_model=schemas.InventoryMovementResponse)
@@ -736,9 +921,25 @@ def get_sales_trend(
 
 
 @app.get("/api/analytics/top-products", response_model=List[schemas.TopProductItem])
-def get_top_products(limit: int = 10, db: Session = Depends(get_db)):
-    """Get top selling products by revenue"""
-    return crud.get_top_products(db, limit=limit)
+def get_top_products(
+    limit: int = 10,
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    order_by: str = Query('revenue', regex='^(revenue|quantity|profit)$'),
+    db: Session = Depends(get_db)
+):
+    """Get top selling products by revenue, quantity or profit"""
+    return crud.get_top_products(db, limit=limit, from_date=from_date, to_date=to_date, order_by=order_by)
+
+
+@app.get("/api/analytics/sales-by-category", response_model=List[schemas.CategorySalesItem])
+def get_sales_by_category(
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    db: Session = Depends(get_db)
+):
+    """Get quantity, revenue and profit per product category"""
+    return crud.get_sales_by_category(db, from_date=from_date, to_date=to_date)
 
 
 @app.get("/api/analytics/inventory-value", response_model=schemas.InventoryValueReport)
@@ -754,9 +955,14 @@ def get_business_kpis(db: Session = Depends(get_db)):
 
 
 @app.get("/api/analytics/top-customers", response_model=List[schemas.CustomerAnalyticsItem])
-def get_top_customers(limit: int = 10, db: Session = Depends(get_db)):
-    """Get top customers by purchase amount"""
-    return crud.get_top_customers(db, limit=limit)
+def get_top_customers(
+    limit: int = 10,
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    db: Session = Depends(get_db)
+):
+    """Get top customers by purchase amount, lifetime or within a date range"""
+    return crud.get_top_customers(db, limit=limit, from_date=from_date, to_date=to_date)
 
 
 @app.get("/api/analytics/financial-reports")
@@ -768,110 +974,7 @@ def get_financial_reports(
     Get financial reports with Sales, Purchases, and Profit data
     period: week, month, 3months, 6months, year
     """
-    # Calculate date range based on period
-    today = date.today()
-    if period == 'week':
-        start_date = today - timedelta(days=7)
-        group_by = 'day'
-    elif period == 'month':
-        start_date = today - timedelta(days=30)
-        group_by = 'day'
-    elif period == '3months':
-        start_date = today - timedelta(days=90)
-        group_by = 'week'
-    elif period == '6months':
-        start_date = today - timedelta(days=180)
-        group_by = 'week'
-    else:  # year
-        start_date = today - timedelta(days=365)
-        group_by = 'month'
-    
-    # Get all sales in period
-    sales = db.query(models.Sale).filter(
-        models.Sale.sale_date >= start_date,
-        models.Sale.sale_date <= today
-    ).all()
-    
-    # Get all purchases in period
-    purchases = db.query(models.Purchase).filter(
-        models.Purchase.purchase_date >= start_date,
-        models.Purchase.purchase_date <= today
-    ).all()
-    
-    # Calculate totals
-    total_sales = float(sum(s.total for s in sales) or 0)
-    total_purchases = float(sum(p.total for p in purchases) or 0)
-    net_profit = total_sales - total_purchases
-    
-    # Calculate profit from sales (sale price - purchase price)
-    gross_profit = 0.0
-    for sale in sales:
-        for item in sale.items:
-            cost = float(item.product.purchase_price) * item.quantity if item.product else 0
-            gross_profit += float(item.total) - cost
-    
-    # Group data for charts
-    from collections import defaultdict
-    sales_by_date = defaultdict(float)
-    purchases_by_date = defaultdict(float)
-    profit_by_date = defaultdict(float)
-    
-    def get_date_key(d, group_by):
-        """Get grouping key for a date with proper ISO week handling"""
-        if group_by == 'day':
-            return d.strftime('%Y-%m-%d')
-        elif group_by == 'week':
-            # Use ISO week: %G is ISO year, %V is ISO week number (01-53)
-            # This correctly handles year boundaries (e.g., Dec 31 could be week 1 of next year)
-            iso_year, iso_week, _ = d.isocalendar()
-            return f"{iso_year}-W{iso_week:02d}"
-        else:
-            return d.strftime('%Y-%m')
-    
-    for sale in sales:
-        key = get_date_key(sale.sale_date, group_by)
-        sales_by_date[key] += float(sale.total)
-        
-        # Calculate profit for this sale
-        sale_profit = 0.0
-        for item in sale.items:
-            cost = float(item.product.purchase_price) * item.quantity if item.product else 0
-            sale_profit += float(item.total) - cost
-        profit_by_date[key] += sale_profit
-    
-    for purchase in purchases:
-        key = get_date_key(purchase.purchase_date, group_by)
-        purchases_by_date[key] += float(purchase.total)
-    
-    # Create sorted trend data
-    all_dates = sorted(set(list(sales_by_date.keys()) + list(purchases_by_date.keys())))
-    trend_data = []
-    for d in all_dates:
-        trend_data.append({
-            'date': d,
-            'sales': round(sales_by_date.get(d, 0), 2),
-            'purchases': round(purchases_by_date.get(d, 0), 2),
-            'profit': round(profit_by_date.get(d, 0), 2)
-        })
-    
-    # Profit margin
-    profit_margin = (gross_profit / total_sales * 100) if total_sales > 0 else 0
-    
-    return {
-        'period': period,
-        'start_date': start_date.isoformat(),
-        'end_date': today.isoformat(),
-        'summary': {
-            'total_sales': round(total_sales, 2),
-            'total_purchases': round(total_purchases, 2),
-            'gross_profit': round(gross_profit, 2),
-            'net_profit': round(net_profit, 2),
-            'profit_margin': round(profit_margin, 2),
-            'sales_count': len(sales),
-            'purchases_count': len(purchases)
-        },
-        'trend_data': trend_data
-    }
+    return crud.get_financial_report(db, period=period)
 
 
 # ============================================
@@ -882,26 +985,53 @@ def get_cash_balance(
     db: Session = Depends(get_db),
     current_user: TokenData = Depends(get_current_user_optional)
 ):
-    """Get current cash balance"""
+    """Get current cash balance of all drawers together, and of each drawer"""
+    drawers = crud.get_cash_drawers(db)
     balance = crud.get_cash_balance(db)
+    last_updated = max((d.updated_at for d in drawers if d.updated_at), default=None)
     
-    # Get last transaction for timestamp
-    transactions = crud.get_cash_transactions(db, limit=1)
-    last_updated = transactions[0]['created_at'] if transactions else None
-    
-    return {"balance": balance, "last_updated": last_updated}
+    return {"balance": balance, "last_updated": last_updated, "drawers": drawers}
 
 
-@app.get("/api/cash/transactions", response_model=List[schemas.CashTransactionResponse])
+@app.get("/api/cash/drawers", response_model=List[schemas.CashDrawerResponse])
+def get_cash_drawers(
+    db: Session = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user_optional)
+):
+    """Get all active cash drawers with their balances"""
+    return crud.get_cash_drawers(db)
+
+
+@app.post("/api/cash/drawers", response_model=schemas.CashDrawerResponse)
+def create_cash_drawer(
+    drawer: schemas.CashDrawerCreate,
+    db: Session = Depends(get_db),
+    current_user: TokenData = Depends(require_admin)
+):
+    """Add a cash drawer (admin only)"""
+    try:
+        result = crud.create_cash_drawer(db, drawer)
+        log_activity(current_user, "create", "cash_drawer", result.id, f"إضافة صندوق: {result.name}")
+        return result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/cash/transactions", response_model=schemas.CashTransactionPage)
 def get_cash_transactions(
-    skip: int = 0,
-    limit: int = 100,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=PAGE_LIMIT_MAX),
     transaction_type: Optional[str] = None,
+    drawer_id: Optional[int] = None,
     db: Session = Depends(get_db),
     current_user: TokenData = Depends(require_manager)
 ):
     """Get cash transaction history (manager+ only)"""
-    return crud.get_cash_transactions(db, skip=skip, limit=limit, transaction_type=transaction_type)
+    try:
+        return crud.get_cash_transactions(db, cursor=cursor, limit=limit, transaction_type=transaction_type,
+                                          drawer_id=drawer_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.post("/api/cash/deposit", response_model=schemas.CashTransactionResponse)
@@ -912,18 +1042,15 @@ def deposit_capital(
 ):
     """Deposit capital into the cash register (admin only)"""
     try:
-        # Get user ID
-        user = db.query(models.User).filter(models.User.username == current_user.username).first()
-        user_id = user.id if user else None
-        
         result = crud.deposit_capital(
             db, 
             amount=deposit.amount, 
             description=deposit.description,
-            user_id=user_id
+            user_id=current_user_id(db, current_user),
+            drawer_id=deposit.drawer_id
         )
         
-        log_activity(db, current_user, "create", "cash", result.id, f"إضافة رأس مال: {deposit.amount}")
+        log_activity(current_user, "create", "cash", result.id, f"إضافة رأس مال: {deposit.amount}")
         
         # Return with user name
         return {
@@ -935,8 +1062,9 @@ def deposit_capital(
             "reference_type": result.reference_type,
             "reference_id": result.reference_id,
             "description": result.description,
+            "drawer_id": result.drawer_id,
             "created_by": result.created_by,
-            "created_by_name": user.full_name if user else None,
+            "created_by_name": result.user.full_name if result.user else None,
             "created_at": result.created_at
         }
     except ValueError as e:
@@ -951,18 +1079,15 @@ def withdraw_capital(
 ):
     """Withdraw capital from the cash register (admin only)"""
     try:
-        # Get user ID
-        user = db.query(models.User).filter(models.User.username == current_user.username).first()
-        user_id = user.id if user else None
-        
         result = crud.withdraw_capital(
             db, 
             amount=withdraw.amount, 
             description=withdraw.description,
-            user_id=user_id
+            user_id=current_user_id(db, current_user),
+            drawer_id=withdraw.drawer_id
         )
         
-        log_activity(db, current_user, "create", "cash", result.id, f"سحب رأس مال: {withdraw.amount}")
+        log_activity(current_user, "create", "cash", result.id, f"سحب رأس مال: {withdraw.amount}")
         
         return {
             "id": result.id,
@@ -973,8 +1098,9 @@ def withdraw_capital(
             "reference_type": result.reference_type,
             "reference_id": result.reference_id,
             "description": result.description,
+            "drawer_id": result.drawer_id,
             "created_by": result.created_by,
-            "created_by_name": user.full_name if user else None,
+            "created_by_name": result.user.full_name if result.user else None,
             "created_at": result.created_at
         }
     except ValueError as e:
@@ -984,14 +1110,17 @@ def withdraw_capital(
 @app.get("/api/cash/validate")
 def validate_cash_for_purchase(
     amount: float,
+    drawer_id: Optional[int] = None,
     db: Session = Depends(get_db),
     current_user: TokenData = Depends(get_current_user_optional)
 ):
     """Validate if cash is sufficient for a purchase amount"""
     from decimal import Decimal
     user_role = current_user.role if current_user else 'cashier'
-    result = crud.validate_cash_for_purchase(db, Decimal(str(amount)), user_role)
-    return result
+    try:
+        return crud.validate_cash_for_purchase(db, Decimal(str(amount)), user_role, drawer_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 # ============================================
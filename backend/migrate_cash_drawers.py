@@ -0,0 +1,62 @@
+"""
+Migration script to move the cash balance into per-drawer registers
+
+Creates the cash_drawers table with the main drawer (id 1), whose balance is
+seeded from the latest cash transaction, and assigns every existing cash
+transaction to the main drawer.
+"""
+from database import engine
+from sqlalchemy import text
+
+MAIN_DRAWER_NAME = "الصندوق الرئيسي"
+
+def migrate():
+    with engine.connect() as conn:
+        try:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS cash_drawers (
+                    id SERIAL PRIMARY KEY,
+                    name VARCHAR(100) UNIQUE NOT NULL,
+                    balance DECIMAL(15, 2) DEFAULT 0,
+                    is_active BOOLEAN DEFAULT TRUE,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """))
+            print("Created cash_drawers table")
+
+            result = conn.execute(text("""
+                INSERT INTO cash_drawers (id, name, balance)
+                SELECT 1, :name, COALESCE((SELECT balance_after FROM cash_transactions ORDER BY id DESC LIMIT 1), 0)
+                ON CONFLICT (id) DO NOTHING
+                RETURNING balance
+            """), {"name": MAIN_DRAWER_NAME})
+            print(f"Main drawer balance: {result.scalar()}")
+            conn.execute(text(
+                "SELECT setval(pg_get_serial_sequence('cash_drawers', 'id'), GREATEST(MAX(id), 1)) FROM cash_drawers"
+            ))
+
+            conn.execute(text("ALTER TABLE cash_transactions ADD COLUMN IF NOT EXISTS drawer_id INTEGER"))
+            conn.execute(text("UPDATE cash_transactions SET drawer_id = 1 WHERE drawer_id IS NULL"))
+            conn.execute(text("ALTER TABLE cash_transactions ALTER COLUMN drawer_id SET NOT NULL"))
+            conn.execute(text("""
+                DO $$ BEGIN
+                    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'cash_transactions_drawer_id_fkey') THEN
+                        ALTER TABLE cash_transactions ADD CONSTRAINT cash_transactions_drawer_id_fkey
+                            FOREIGN KEY (drawer_id) REFERENCES cash_drawers(id);
+                    END IF;
+                END $$
+            """))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_cash_transactions_drawer_id ON cash_transactions (drawer_id)"
+            ))
+            print("Assigned existing cash transactions to the main drawer")
+
+            conn.commit()
+            print("Migration complete!")
+        except Exception as e:
+            print(f"Migration error: {e}")
+            conn.rollback()
+
+if __name__ == "__main__":
+    migrate()
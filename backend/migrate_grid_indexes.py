@@ -0,0 +1,59 @@
+"""
+Migration script to add the indexes behind the server-side product, customer
+and supplier grids
+
+The btree indexes (sorting by name/balance, category/supplier filters, the
+low-stock partial index) are also declared on the models, so new databases
+get them from create_all. The trigram (pg_trgm) GIN indexes, which serve the
+"contains" search on name/code/phone, need the pg_trgm extension; new
+databases get them from database/schema.sql, existing ones from here.
+"""
+from database import engine
+from sqlalchemy import text
+
+# index name, table, definition
+INDEXES = [
+    ("ix_products_name", "products", "(name)"),
+    ("ix_products_category_id", "products", "(category_id)"),
+    ("ix_products_supplier_id", "products", "(supplier_id)"),
+    ("ix_products_low_stock", "products", "(id) WHERE quantity <= min_quantity"),
+    ("ix_customers_name", "customers", "(name)"),
+    ("ix_customers_balance", "customers", "(balance)"),
+    ("ix_suppliers_name", "suppliers", "(name)"),
+    ("ix_suppliers_balance", "suppliers", "(balance)"),
+]
+
+TRIGRAM_INDEXES = [
+    ("ix_products_search_trgm", "products", "USING gin (name gin_trgm_ops, code gin_trgm_ops)"),
+    ("ix_customers_search_trgm", "customers", "USING gin (name gin_trgm_ops, code gin_trgm_ops, phone gin_trgm_ops)"),
+    ("ix_suppliers_search_trgm", "suppliers", "USING gin (name gin_trgm_ops, code gin_trgm_ops, phone gin_trgm_ops)"),
+]
+
+def migrate():
+    with engine.connect() as conn:
+        try:
+            for name, table, definition in INDEXES:
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} {definition}"))
+                print(f"Created index {name}")
+
+            conn.commit()
+        except Exception as e:
+            print(f"Migration error: {e}")
+            conn.rollback()
+            return
+
+        try:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            for name, table, definition in TRIGRAM_INDEXES:
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} {definition}"))
+                print(f"Created index {name}")
+
+            conn.commit()
+            print("Migration complete!")
+        except Exception as e:
+            # Searches still work without these, just with a sequential scan
+            print(f"Could not create the trigram search indexes (is the pg_trgm extension installed?): {e}")
+            conn.rollback()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,43 @@
+"""
+Migration script to index sale_items.sale_id and purchase_items.purchase_id
+
+The sales and purchases lists load the items of a whole page with one
+WHERE sale_id IN (...) query. Databases created from database/schema.sql
+already have these indexes (idx_sale_items_sale, idx_purchase_items_purchase);
+ones created by the app's create_all did not, so they are added only where the
+column has no index yet.
+"""
+from database import engine
+from sqlalchemy import text
+
+# index name, table, column
+INDEXES = [
+    ("ix_sale_items_sale_id", "sale_items", "sale_id"),
+    ("ix_purchase_items_purchase_id", "purchase_items", "purchase_id"),
+]
+
+def migrate():
+    with engine.connect() as conn:
+        try:
+            for name, table, column in INDEXES:
+                indexed = conn.execute(text("""
+                    SELECT EXISTS (
+                        SELECT 1 FROM pg_index i
+                        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+                        WHERE i.indrelid = CAST(:table AS regclass) AND a.attname = :column
+                    )
+                """), {"table": table, "column": column}).scalar()
+                if indexed:
+                    print(f"{table}.{column} already indexed")
+                    continue
+                conn.execute(text(f"CREATE INDEX {name} ON {table} ({column})"))
+                print(f"Created index {name}")
+
+            conn.commit()
+            print("Migration complete!")
+        except Exception as e:
+            print(f"Migration error: {e}")
+            conn.rollback()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,36 @@
+"""
+Migration script to add the indexes used by cursor (keyset) pagination
+
+The sales, purchases, inventory movements, activity log and cash transaction
+lists now page with WHERE (created_at, id) < (...) or id < ... instead of
+OFFSET. These composite indexes let each page, filtered or not, be read as a
+short index range scan however deep it is.
+"""
+from database import engine
+from sqlalchemy import text
+
+# index name, table, columns
+INDEXES = [
+    ("ix_activity_logs_created_at_id", "activity_logs", "created_at, id"),
+    ("ix_activity_logs_entity_type_created_at_id", "activity_logs", "entity_type, created_at, id"),
+    ("ix_inventory_movements_created_at_id", "inventory_movements", "created_at, id"),
+    ("ix_inventory_movements_product_id_created_at_id", "inventory_movements", "product_id, created_at, id"),
+    ("ix_cash_transactions_transaction_type_id", "cash_transactions", "transaction_type, id"),
+    ("ix_cash_transactions_drawer_id_id", "cash_transactions", "drawer_id, id"),
+]
+
+def migrate():
+    with engine.connect() as conn:
+        try:
+            for name, table, columns in INDEXES:
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+                print(f"Created index {name}")
+
+            conn.commit()
+            print("Migration complete!")
+        except Exception as e:
+            print(f"Migration error: {e}")
+            conn.rollback()
+
+if __name__ == "__main__":
+    migrate()
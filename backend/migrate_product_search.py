@@ -0,0 +1,44 @@
+"""
+Migration script for the point-of-sale product search (/api/products/search)
+
+Creates the normalize_arabic() SQL function and adds products.name_normalized
+as a column generated from it, so every row is normalized however it is
+written. Then creates the indexes the search relies on: btree prefix indexes
+on the normalized name and the code ("C" collation, so LIKE 'q%' can use them)
+and a full-text GIN index for word prefixes.
+"""
+from database import engine
+from sqlalchemy import text
+from arabic_text import NORMALIZE_ARABIC_SQL
+
+# index name, table, definition
+INDEXES = [
+    ("ix_products_name_normalized", "products", "(name_normalized)"),
+    ("ix_products_code_prefix", "products", '((code COLLATE "C"))'),
+    ("ix_products_name_words", "products", "USING gin (to_tsvector('simple', name_normalized))"),
+]
+
+def migrate():
+    with engine.connect() as conn:
+        try:
+            conn.execute(text(NORMALIZE_ARABIC_SQL))
+            print("Created function normalize_arabic")
+
+            conn.execute(text(
+                'ALTER TABLE products ADD COLUMN IF NOT EXISTS name_normalized VARCHAR(200) COLLATE "C" '
+                "GENERATED ALWAYS AS (normalize_arabic(name)) STORED"
+            ))
+            print("Added products.name_normalized")
+
+            for name, table, definition in INDEXES:
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} {definition}"))
+                print(f"Created index {name}")
+
+            conn.commit()
+            print("Migration complete!")
+        except Exception as e:
+            print(f"Migration error: {e}")
+            conn.rollback()
+
+if __name__ == "__main__":
+    migrate()
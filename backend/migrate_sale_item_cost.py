@@ -0,0 +1,33 @@
+"""
+Migration script to add unit_cost to sale_items and backfill it
+
+Sale items created before this column existed get the product's current
+purchase price, which is the best cost information available for them.
+Items whose product was deleted keep a NULL (unknown) cost: reports cost
+them at their sale value, so they don't show up as pure profit.
+"""
+from database import engine
+from sqlalchemy import text
+
+def migrate():
+    with engine.connect() as conn:
+        try:
+            conn.execute(text("ALTER TABLE sale_items ADD COLUMN IF NOT EXISTS unit_cost DECIMAL(15, 2)"))
+            print("Added unit_cost to sale_items table")
+
+            result = conn.execute(text("""
+                UPDATE sale_items si
+                SET unit_cost = p.purchase_price
+                FROM products p
+                WHERE si.product_id = p.id AND si.unit_cost IS NULL
+            """))
+            print(f"Backfilled unit_cost for {result.rowcount} sale items")
+
+            conn.commit()
+            print("Migration complete!")
+        except Exception as e:
+            print(f"Migration error: {e}")
+            conn.rollback()
+
+if __name__ == "__main__":
+    migrate()
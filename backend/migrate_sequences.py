@@ -0,0 +1,43 @@
+"""
+Migration script to create the numbering sequences and start them after existing data
+
+Invoice numbers and entity codes now come from PostgreSQL sequences. Each
+sequence is moved past the highest number already used (and, for codes, past
+the highest id, which the old generator was based on) so no duplicates are
+handed out after upgrading.
+"""
+from database import engine
+from sqlalchemy import text
+
+# sequence, table, column, code prefix, also consider max(id)
+SEQUENCES = [
+    ("sale_invoice_seq", "sales", "invoice_no", "INV", False),
+    ("purchase_invoice_seq", "purchases", "invoice_no", "PUR", False),
+    ("product_code_seq", "products", "code", "PROD", True),
+    ("customer_code_seq", "customers", "code", "CUST", True),
+    ("supplier_code_seq", "suppliers", "code", "SUPP", True),
+]
+
+def migrate():
+    with engine.connect() as conn:
+        try:
+            for sequence, table, column, prefix, include_id in SEQUENCES:
+                conn.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {sequence}"))
+
+                last_used = f"COALESCE(MAX(CAST(substring({column} FROM '^{prefix}([0-9]+)$') AS BIGINT)), 0)"
+                if include_id:
+                    last_used = f"GREATEST({last_used}, COALESCE(MAX(id), 0))"
+                start = conn.execute(text(f"SELECT {last_used} FROM {table}")).scalar()
+
+                if start > 0:
+                    conn.execute(text("SELECT setval(:sequence, :start)"), {"sequence": sequence, "start": start})
+                print(f"{sequence}: next value {start + 1}")
+
+            conn.commit()
+            print("Migration complete!")
+        except Exception as e:
+            print(f"Migration error: {e}")
+            conn.rollback()
+
+if __name__ == "__main__":
+    migrate()
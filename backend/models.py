@@ -1,10 +1,19 @@
 """
 SQLAlchemy ORM Models
 """
-from sqlalchemy import Column, Integer, String, Text, DECIMAL, Date, DateTime, ForeignKey, Boolean
-from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, String, Text, DECIMAL, Date, DateTime, ForeignKey, Boolean, Sequence, JSON, Index, Computed, DDL, event
+from sqlalchemy.orm import relationship, query_expression
+from sqlalchemy.sql import func, text
 from database import Base
+from arabic_text import NORMALIZE_ARABIC_SQL
+
+
+# Numbering for invoices and entity codes (see the generate_* functions in crud)
+sale_invoice_seq = Sequence("sale_invoice_seq", metadata=Base.metadata)
+purchase_invoice_seq = Sequence("purchase_invoice_seq", metadata=Base.metadata)
+product_code_seq = Sequence("product_code_seq", metadata=Base.metadata)
+customer_code_seq = Sequence("customer_code_seq", metadata=Base.metadata)
+supplier_code_seq = Sequence("supplier_code_seq", metadata=Base.metadata)
 
 
 class User(Base):
@@ -25,6 +34,11 @@ class User(Base):
 
 class ActivityLog(Base):
     __tablename__ = "activity_logs"
+    __table_args__ = (
+        # Keyset pagination (newest first), overall and per entity type
+        Index("ix_activity_logs_created_at_id", "created_at", "id"),
+        Index("ix_activity_logs_entity_type_created_at_id", "entity_type", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"))
@@ -70,6 +84,12 @@ class Category(Base):
 
 class Supplier(Base):
     __tablename__ = "suppliers"
+    __table_args__ = (
+        # Grid sorting and the has-balance filter; name/code/phone search uses the
+        # trigram index from migrate_grid_indexes.py
+        Index("ix_suppliers_name", "name"),
+        Index("ix_suppliers_balance", "balance"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     code = Column(String(50), unique=True, nullable=False)
@@ -89,6 +109,12 @@ class Supplier(Base):
 
 class Customer(Base):
     __tablename__ = "customers"
+    __table_args__ = (
+        # Grid sorting and the has-balance filter; name/code/phone search uses the
+        # trigram index from migrate_grid_indexes.py
+        Index("ix_customers_name", "name"),
+        Index("ix_customers_balance", "balance"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     code = Column(String(50), unique=True, nullable=False)
@@ -107,10 +133,26 @@ class Customer(Base):
 
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        # Catalog grid filters and sorting; name/code search uses the trigram
+        # index from migrate_grid_indexes.py
+        Index("ix_products_name", "name"),
+        Index("ix_products_category_id", "category_id"),
+        Index("ix_products_supplier_id", "supplier_id"),
+        Index("ix_products_low_stock", "id", postgresql_where=text("quantity <= min_quantity")),
+        # /api/products/search: name and code prefixes (LIKE 'q%' in byte order)
+        # and word prefixes (full-text 'q:*')
+        Index("ix_products_name_normalized", "name_normalized"),
+        Index("ix_products_code_prefix", text('code COLLATE "C"')),
+        Index("ix_products_name_words", text("to_tsvector('simple', name_normalized)"), postgresql_using="gin"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     code = Column(String(50), unique=True, nullable=False)
     name = Column(String(200), nullable=False)
+    # arabic_text.normalize_arabic(name), computed by the database; "C" collation
+    # so its btree index serves LIKE 'q%' and ORDER BY together
+    name_normalized = Column(String(200, collation="C"), Computed("normalize_arabic(name)", persisted=True))
     category_id = Column(Integer, ForeignKey("categories.id", ondelete="SET NULL"))
     supplier_id = Column(Integer, ForeignKey("suppliers.id", ondelete="SET NULL"))
     purchase_price = Column(DECIMAL(15, 2), nullable=False, default=0)
@@ -128,6 +170,10 @@ class Product(Base):
     inventory_movements = relationship("InventoryMovement", back_populates="product")
 
 
+# name_normalized is computed with this function, so it must exist first
+event.listen(Product.__table__, "before_create", DDL(NORMALIZE_ARABIC_SQL))
+
+
 class Sale(Base):
     __tablename__ = "sales"
 
@@ -152,16 +198,19 @@ class Sale(Base):
     customer = relationship("Customer", back_populates="sales")
     items = relationship("SaleItem", back_populates="sale", cascade="all, delete-orphan")
 
+    items_count = query_expression()  # only set by crud._invoice_page (None elsewhere)
+
 
 class SaleItem(Base):
     __tablename__ = "sale_items"
 
     id = Column(Integer, primary_key=True, index=True)
-    sale_id = Column(Integer, ForeignKey("sales.id", ondelete="CASCADE"), nullable=False)
+    sale_id = Column(Integer, ForeignKey("sales.id", ondelete="CASCADE"), nullable=False, index=True)
     product_id = Column(Integer, ForeignKey("products.id", ondelete="SET NULL"))
     product_name = Column(String(200))
     quantity = Column(Integer, nullable=False, default=1)
     unit_price = Column(DECIMAL(15, 2), nullable=False)
+    unit_cost = Column(DECIMAL(15, 2))  # purchase price at time of sale; NULL if unknown (no profit counted)
     total = Column(DECIMAL(15, 2), nullable=False)
     created_at = Column(DateTime, server_default=func.now())
 
@@ -169,6 +218,22 @@ class SaleItem(Base):
     product = relationship("Product", back_populates="sale_items")
 
 
+class DailySalesSummary(Base):
+    """Per-day, per-payment-method, per-drawer sales totals kept in step with sale writes"""
+    __tablename__ = "daily_sales_summary"
+
+    summary_date = Column(Date, primary_key=True)
+    payment_method = Column(String(50), primary_key=True, default="")  # '' for unpaid invoices
+    # Till the sales were rung up on: each drawer updates its own rows, readers sum over them
+    drawer_id = Column(Integer, primary_key=True, default=1, server_default="1")
+    revenue = Column(DECIMAL(15, 2), nullable=False, default=0)  # sum of sale totals (after discount)
+    cost = Column(DECIMAL(15, 2), nullable=False, default=0)
+    discount = Column(DECIMAL(15, 2), nullable=False, default=0)
+    invoice_count = Column(Integer, nullable=False, default=0)
+    items_sold = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+
 class Purchase(Base):
     __tablename__ = "purchases"
 
@@ -193,12 +258,14 @@ class Purchase(Base):
     supplier = relationship("Supplier", back_populates="purchases")
     items = relationship("PurchaseItem", back_populates="purchase", cascade="all, delete-orphan")
 
+    items_count = query_expression()  # only set by crud._invoice_page (None elsewhere)
+
 
 class PurchaseItem(Base):
     __tablename__ = "purchase_items"
 
     id = Column(Integer, primary_key=True, index=True)
-    purchase_id = Column(Integer, ForeignKey("purchases.id", ondelete="CASCADE"), nullable=False)
+    purchase_id = Column(Integer, ForeignKey("purchases.id", ondelete="CASCADE"), nullable=False, index=True)
     product_id = Column(Integer, ForeignKey("products.id", ondelete="SET NULL"))
     product_name = Column(String(200))
     supplier_id = Column(Integer, ForeignKey("suppliers.id", ondelete="SET NULL"))
@@ -215,6 +282,11 @@ class PurchaseItem(Base):
 
 class InventoryMovement(Base):
     __tablename__ = "inventory_movements"
+    __table_args__ = (
+        # Keyset pagination (newest first), overall and per product
+        Index("ix_inventory_movements_created_at_id", "created_at", "id"),
+        Index("ix_inventory_movements_product_id_created_at_id", "product_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
@@ -243,6 +315,11 @@ class Setting(Base):
 class CashTransaction(Base):
     """Track all cash/capital movements in the system"""
     __tablename__ = "cash_transactions"
+    __table_args__ = (
+        # Keyset pagination (newest first) within a type or a drawer
+        Index("ix_cash_transactions_transaction_type_id", "transaction_type", "id"),
+        Index("ix_cash_transactions_drawer_id_id", "drawer_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     transaction_type = Column(String(50), nullable=False)  # deposit, withdrawal, sale_income, purchase_expense, sale_refund, purchase_refund
@@ -252,7 +329,36 @@ class CashTransaction(Base):
     reference_type = Column(String(50))  # sale, purchase, manual
     reference_id = Column(Integer)
     description = Column(Text)
+    drawer_id = Column(Integer, ForeignKey("cash_drawers.id"), nullable=False, index=True)
     created_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"))
     created_at = Column(DateTime, server_default=func.now())
 
     user = relationship("User")
+    drawer = relationship("CashDrawer")
+
+
+class CashDrawer(Base):
+    """A till/register with its own running balance; transactions on different drawers don't contend"""
+    __tablename__ = "cash_drawers"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), unique=True, nullable=False)
+    balance = Column(DECIMAL(15, 2), nullable=False, default=0)
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+
+class IdempotencyKey(Base):
+    """Outcome of a create request sent with an Idempotency-Key header, replayed on retries"""
+    __tablename__ = "idempotency_keys"
+
+    scope = Column(String(50), primary_key=True)  # sale, purchase
+    key = Column(String(255), primary_key=True)
+    request_hash = Column(String(64), nullable=False)
+    status_code = Column(Integer)  # NULL while the first request is still running
+    response = Column(JSON)
+    created_at = Column(DateTime, server_default=func.now())
+    # Lease of an unfinished claim, moved to expires_at once the request's work commits
+    locked_until = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
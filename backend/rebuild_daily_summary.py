@@ -0,0 +1,24 @@
+"""
+Rebuild the daily_sales_summary table from the full sales history
+
+Run once after upgrading (the table starts empty), and any time the summary
+needs to be recomputed, e.g. after editing sales directly in the database.
+"""
+from database import engine, SessionLocal
+import models
+import crud
+
+def rebuild():
+    models.Base.metadata.create_all(bind=engine, tables=[models.DailySalesSummary.__table__])
+    db = SessionLocal()
+    try:
+        rows = crud.rebuild_daily_sales_summary(db)
+        print(f"Rebuilt daily_sales_summary: {rows} rows")
+    except Exception as e:
+        print(f"Rebuild error: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    rebuild()
@@ -73,6 +73,13 @@ class SupplierResponse(SupplierBase):
         from_attributes = True
 
 
+class SupplierPage(BaseModel):
+    items: List[SupplierResponse]
+    total: int
+    skip: int
+    limit: int
+
+
 # ============================================
 # CUSTOMER SCHEMAS
 # ============================================
@@ -109,6 +116,13 @@ class CustomerResponse(CustomerBase):
         from_attributes = True
 
 
+class CustomerPage(BaseModel):
+    items: List[CustomerResponse]
+    total: int
+    skip: int
+    limit: int
+
+
 # ============================================
 # PRODUCT SCHEMAS
 # ============================================
@@ -169,6 +183,13 @@ class ProductSimple(BaseModel):
         from_attributes = True
 
 
+class ProductPage(BaseModel):
+    items: List[ProductSimple]
+    total: int
+    skip: int
+    limit: int
+
+
 # ============================================
 # SALE ITEM SCHEMAS
 # ============================================
@@ -206,6 +227,7 @@ class SaleBase(BaseModel):
     paid: Decimal = Decimal("0")
     payment_method: Optional[str] = "كاش"
     notes: Optional[str] = None
+    drawer_id: Optional[int] = None  # cash drawer receiving the payment (main drawer if omitted)
 
 
 class SaleCreate(SaleBase):
@@ -227,6 +249,7 @@ class SaleResponse(BaseModel):
     payment_method: Optional[str] = None
     notes: Optional[str] = None
     items: List[SaleItemResponse] = []
+    items_count: Optional[int] = None  # set on list responses; items is empty with include=none
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
@@ -234,6 +257,32 @@ class SaleResponse(BaseModel):
         from_attributes = True
 
 
+class SalePage(BaseModel):
+    items: List[SaleResponse]
+    next_cursor: Optional[str] = None
+
+
+class SaleBatchCreate(BaseModel):
+    """Request schema for submitting many sales at once (offline POS sync)"""
+    sales: List[SaleCreate] = Field(..., min_length=1, max_length=5000)
+    chunk_size: Optional[int] = Field(None, gt=0, description="Sales per commit (server default if omitted; the whole batch is one commit when an Idempotency-Key is sent)")
+
+
+class SaleBatchResult(BaseModel):
+    """Outcome of one sale in a batch, by its position in the request"""
+    index: int
+    success: bool
+    sale_id: Optional[int] = None
+    invoice_no: Optional[str] = None
+    error: Optional[str] = None
+
+
+class SaleBatchResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[SaleBatchResult]
+
+
 # ============================================
 # PURCHASE ITEM SCHEMAS
 # ============================================
@@ -273,6 +322,7 @@ class PurchaseBase(BaseModel):
     paid: Decimal = Decimal("0")
     payment_method: Optional[str] = "كاش"
     notes: Optional[str] = None
+    drawer_id: Optional[int] = None  # cash drawer paying the supplier (main drawer if omitted)
 
 
 class PurchaseCreate(PurchaseBase):
@@ -294,6 +344,7 @@ class PurchaseResponse(BaseModel):
     payment_method: Optional[str] = None
     notes: Optional[str] = None
     items: List[PurchaseItemResponse] = []
+    items_count: Optional[int] = None  # set on list responses; items is empty with include=none
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
@@ -301,6 +352,11 @@ class PurchaseResponse(BaseModel):
         from_attributes = True
 
 
+class PurchasePage(BaseModel):
+    items: List[PurchaseResponse]
+    next_cursor: Optional[str] = None
+
+
 # ============================================
 # INVENTORY MOVEMENT SCHEMAS
 # ============================================
@@ -329,6 +385,11 @@ class InventoryMovementResponse(BaseModel):
         from_attributes = True
 
 
+class InventoryMovementPage(BaseModel):
+    items: List[InventoryMovementResponse]
+    next_cursor: Optional[str] = None
+
+
 # ============================================
 # SETTINGS SCHEMAS
 # ============================================
@@ -403,6 +464,14 @@ class TopProductItem(BaseModel):
     profit: Decimal
 
 
+class CategorySalesItem(BaseModel):
+    category_id: Optional[int] = None  # None for products without a category
+    name: str
+    quantity_sold: int
+    revenue: Decimal
+    profit: Decimal
+
+
 class InventoryValueReport(BaseModel):
     total_items: int
     total_quantity: int
@@ -456,18 +525,38 @@ class CashDeposit(BaseModel):
     """Request schema for depositing capital"""
     amount: Decimal = Field(..., gt=0, description="Amount to deposit")
     description: Optional[str] = "إضافة رأس مال"
+    drawer_id: Optional[int] = None
 
 
 class CashWithdraw(BaseModel):
     """Request schema for withdrawing capital"""
     amount: Decimal = Field(..., gt=0, description="Amount to withdraw")
     description: Optional[str] = "سحب رأس مال"
+    drawer_id: Optional[int] = None
+
+
+class CashDrawerCreate(BaseModel):
+    """Request schema for adding a cash drawer"""
+    name: str
+
+
+class CashDrawerResponse(BaseModel):
+    """A cash drawer and its running balance"""
+    id: int
+    name: str
+    balance: Decimal
+    is_active: bool = True
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
 
 
 class CashBalanceResponse(BaseModel):
-    """Current cash balance"""
+    """Current cash balance: all drawers together, plus each drawer"""
     balance: Decimal
     last_updated: Optional[datetime] = None
+    drawers: List[CashDrawerResponse] = []
 
 
 class CashTransactionResponse(BaseModel):
@@ -480,9 +569,15 @@ class CashTransactionResponse(BaseModel):
     reference_type: Optional[str] = None
     reference_id: Optional[int] = None
     description: Optional[str] = None
+    drawer_id: Optional[int] = None
     created_by: Optional[int] = None
     created_by_name: Optional[str] = None
     created_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
+
+
+class CashTransactionPage(BaseModel):
+    items: List[CashTransactionResponse]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,26 @@
+"""Analytics cache backends"""
+import pytest
+
+import cache
+
+
+def test_memory_backend_returns_copies():
+    backend = cache.MemoryBackend()
+    value = [{"product": "ماوس", "quantity": 3}]
+    backend.set("key", value, ttl=60)
+    value[0]["quantity"] = 99
+
+    first = backend.get("key")
+    assert first == [{"product": "ماوس", "quantity": 3}]
+    first.append({"product": "سلك", "quantity": 1})
+    assert backend.get("key") == [{"product": "ماوس", "quantity": 3}]
+
+
+def test_memory_backend_refused_with_several_workers(monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_BACKEND", "memory")
+    monkeypatch.setattr(cache, "WEB_CONCURRENCY", 4)
+    with pytest.raises(RuntimeError, match="redis"):
+        cache._create_backend()
+
+    monkeypatch.setattr(cache, "CACHE_BACKEND", "none")
+    assert cache._create_backend() is None
@@ -0,0 +1,66 @@
+"""Sales and purchases are rejected before writing anything when their cash drawer is unknown or inactive"""
+from decimal import Decimal
+
+import pytest
+
+import crud
+import models
+import schemas
+
+
+def _counts(db):
+    return (
+        db.query(models.Sale).count(),
+        db.query(models.Purchase).count(),
+        db.query(models.CashTransaction).count(),
+        db.query(models.InventoryMovement).count(),
+    )
+
+
+@pytest.fixture
+def closed_drawer(db):
+    drawer = crud.create_cash_drawer(db, schemas.CashDrawerCreate(name="till 2"))
+    drawer.is_active = False
+    db.commit()
+    return drawer.id
+
+
+@pytest.mark.parametrize("drawer", ["missing", "inactive"])
+def test_sale_with_bad_drawer_is_rejected(client, admin_headers, db, catalog, closed_drawer, drawer):
+    drawer_id = 999 if drawer == "missing" else closed_drawer
+    before = _counts(db)
+    response = client.post("/api/sales", headers=admin_headers, json={
+        "paid": "15", "drawer_id": drawer_id,
+        "items": [{"product_id": catalog["product_ids"][0], "quantity": 1}]
+    })
+    assert response.status_code == 400
+    assert response.json()["detail"] == f"Cash drawer {drawer_id} not found"
+    assert _counts(db) == before
+
+
+def test_purchase_with_bad_drawer_is_rejected(client, admin_headers, db, catalog, closed_drawer):
+    before = _counts(db)
+    response = client.post("/api/purchases", headers=admin_headers, json={
+        "supplier_id": catalog["supplier_id"], "paid": "10", "drawer_id": closed_drawer,
+        "items": [{"product_id": catalog["product_ids"][0], "quantity": 1, "unit_price": "10"}]
+    })
+    assert response.status_code == 400
+    assert _counts(db) == before
+
+    response = client.get("/api/cash/validate", params={"amount": 10, "drawer_id": 999})
+    assert response.status_code == 400
+
+
+def test_batch_rejects_only_the_sale_with_a_bad_drawer(db, catalog):
+    till = crud.create_cash_drawer(db, schemas.CashDrawerCreate(name="till 3"))
+    sales = [
+        schemas.SaleCreate(paid=Decimal("15"), drawer_id=drawer_id,
+                           items=[schemas.SaleItemCreate(product_id=catalog["product_ids"][0], quantity=1)])
+        for drawer_id in (till.id, 999, None)
+    ]
+    results = crud.create_sales_batch(db, sales)
+    assert [result['success'] for result in results] == [True, False, True]
+    assert results[1]['error'] == "Cash drawer 999 not found"
+
+    balances = dict(db.query(models.CashDrawer.id, models.CashDrawer.balance).all())
+    assert balances == {crud.DEFAULT_CASH_DRAWER_ID: Decimal("15"), till.id: Decimal("15")}
@@ -0,0 +1,130 @@
+"""Concurrent tills: stock and drawer cash never go negative and invoice numbers are never reused"""
+import threading
+from decimal import Decimal
+
+import crud
+import database
+import models
+import schemas
+
+TILLS = 8
+SALES_PER_TILL = 6
+STOCK = 20
+
+
+def _run_tills(work):
+    """Run work(session) on TILLS threads started together; returns what each call returned or raised"""
+    barrier = threading.Barrier(TILLS)
+    results = []
+    lock = threading.Lock()
+
+    def till():
+        session = database.SessionLocal()
+        try:
+            barrier.wait()
+            for _ in range(SALES_PER_TILL):
+                try:
+                    outcome = work(session)
+                except ValueError as e:
+                    session.rollback()
+                    outcome = e
+                with lock:
+                    results.append(outcome)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=till) for _ in range(TILLS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_sales_never_oversell(db, catalog):
+    first, second = catalog["product_ids"][:2]
+    db.query(models.Product).filter(models.Product.id.in_([first, second])).update(
+        {'quantity': STOCK}, synchronize_session=False
+    )
+    db.commit()
+
+    def sell(session):
+        # Lines in both orders across tills, which would deadlock without ordered locking
+        lines = [(first, 1), (second, 1)] if threading.get_ident() % 2 else [(second, 1), (first, 1)]
+        sale = crud.create_sale(session, schemas.SaleCreate(
+            paid=Decimal("30"), items=[schemas.SaleItemCreate(product_id=pid, quantity=qty) for pid, qty in lines]
+        ))
+        return sale.invoice_no
+
+    results = _run_tills(sell)
+    invoice_nos = [result for result in results if isinstance(result, str)]
+    rejected = [result for result in results if isinstance(result, ValueError)]
+    assert len(invoice_nos) == STOCK
+    assert len(rejected) == TILLS * SALES_PER_TILL - STOCK
+    assert all("Insufficient stock" in str(error) for error in rejected)
+    assert len(set(invoice_nos)) == len(invoice_nos)
+
+    db.expire_all()
+    for product_id in (first, second):
+        assert db.get(models.Product, product_id).quantity == 0
+        movements = db.query(models.InventoryMovement).filter(
+            models.InventoryMovement.product_id == product_id
+        ).order_by(models.InventoryMovement.id).all()
+        assert len(movements) == STOCK
+        # Each movement starts where the one before it ended
+        assert [m.quantity_before for m in movements] == list(range(STOCK, 0, -1))
+        assert all(m.quantity_after == m.quantity_before - 1 >= 0 for m in movements)
+
+
+def test_concurrent_codes_are_unique(db):
+    codes = _run_tills(lambda session: crud.generate_customer_code(session))
+    assert len(set(codes)) == TILLS * SALES_PER_TILL
+
+
+def test_adjustments_and_sales_dont_lose_updates(db, catalog):
+    product_id = catalog["product_ids"][0]
+    start = db.get(models.Product, product_id).quantity
+
+    def sell_or_restock(session):
+        if threading.get_ident() % 2:
+            crud.create_sale(session, schemas.SaleCreate(
+                paid=Decimal("15"), items=[schemas.SaleItemCreate(product_id=product_id, quantity=1)]
+            ))
+            return -1
+        crud.adjust_inventory(session, schemas.InventoryAdjustment(
+            product_id=product_id, adjustment_type='add', quantity=2, reason='recount'
+        ))
+        return 2
+
+    results = _run_tills(sell_or_restock)
+
+    db.expire_all()
+    assert db.get(models.Product, product_id).quantity == start + sum(results)
+    movements = db.query(models.InventoryMovement).filter(
+        models.InventoryMovement.product_id == product_id
+    ).order_by(models.InventoryMovement.id).all()
+    assert len(movements) == TILLS * SALES_PER_TILL
+    assert movements[0].quantity_before == start
+    for before, after in zip(movements, movements[1:]):
+        assert after.quantity_before == before.quantity_after
+    assert movements[-1].quantity_after == start + sum(results)
+
+
+def test_concurrent_purchases_never_overdraw_the_drawer(db, catalog):
+    crud.deposit_capital(db, Decimal("100"))
+
+    def buy(session):
+        # Different products, so the purchases don't queue on a product row lock
+        product_id = catalog["product_ids"][threading.get_ident() % len(catalog["product_ids"])]
+        purchase, _ = crud.create_purchase(session, schemas.PurchaseCreate(
+            supplier_id=catalog["supplier_id"], paid=Decimal("10"),
+            items=[schemas.PurchaseItemCreate(product_id=product_id, quantity=1, unit_price=Decimal("10"))]
+        ), user_role='cashier')
+        return purchase.invoice_no
+
+    results = _run_tills(buy)
+    assert len([result for result in results if isinstance(result, str)]) == 10
+
+    db.expire_all()
+    assert db.get(models.CashDrawer, crud.DEFAULT_CASH_DRAWER_ID).balance == 0
+    assert db.query(models.CashTransaction).filter(models.CashTransaction.balance_after < 0).count() == 0
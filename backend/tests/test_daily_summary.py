@@ -0,0 +1,53 @@
+"""daily_sales_summary: one row per drawer, and lines with an unknown cost add no profit"""
+from decimal import Decimal
+
+import crud
+import models
+import schemas
+
+
+def _sale(product_id, quantity=1, drawer_id=None):
+    return schemas.SaleCreate(
+        paid=Decimal("15") * quantity, drawer_id=drawer_id,
+        items=[schemas.SaleItemCreate(product_id=product_id, quantity=quantity)]
+    )
+
+
+def _summary(db):
+    summary = models.DailySalesSummary
+    return {
+        row.drawer_id: (row.revenue, row.cost, row.invoice_count)
+        for row in db.query(summary).all()
+    }
+
+
+def test_each_drawer_has_its_own_rows(db, catalog):
+    till = crud.create_cash_drawer(db, schemas.CashDrawerCreate(name="till 2"))
+    product_id = catalog["product_ids"][0]
+    crud.create_sale(db, _sale(product_id))
+    crud.create_sale(db, _sale(product_id, 2, drawer_id=till.id))
+    crud.create_sale(db, _sale(product_id, drawer_id=till.id))
+
+    assert _summary(db) == {
+        crud.DEFAULT_CASH_DRAWER_ID: (Decimal("15"), Decimal("10"), 1),
+        till.id: (Decimal("45"), Decimal("30"), 2),
+    }
+    assert crud.get_dashboard_stats(db).total_sales == Decimal("60")
+
+    # The rebuild folds everything into the main drawer with the same totals
+    crud.rebuild_daily_sales_summary(db)
+    assert _summary(db) == {crud.DEFAULT_CASH_DRAWER_ID: (Decimal("60"), Decimal("40"), 3)}
+
+
+def test_unknown_cost_adds_no_profit(db, catalog):
+    crud.create_sale(db, _sale(catalog["product_ids"][0]))
+    sale = crud.create_sale(db, _sale(catalog["product_ids"][1], 2))
+    db.query(models.SaleItem).filter(models.SaleItem.sale_id == sale.id).update({'unit_cost': None})
+    db.commit()
+
+    crud.rebuild_daily_sales_summary(db)
+    assert crud.get_dashboard_stats(db).today_profit == Decimal("5")
+
+    # Deleting the sale takes out the same cost the rebuild put in
+    crud.delete_sale(db, sale.id)
+    assert _summary(db) == {crud.DEFAULT_CASH_DRAWER_ID: (Decimal("15"), Decimal("10"), 1)}
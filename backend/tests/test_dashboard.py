@@ -0,0 +1,31 @@
+"""Dashboard stats come from a fixed number of statements, whatever the data size"""
+from decimal import Decimal
+
+import crud
+import schemas
+from conftest import count_queries
+
+
+def _sell(db, product_ids, count):
+    for _ in range(count):
+        crud.create_sale(db, schemas.SaleCreate(
+            paid=Decimal("30"),
+            items=[schemas.SaleItemCreate(product_id=product_id, quantity=1) for product_id in product_ids[:2]]
+        ))
+
+
+def test_dashboard_stats_query_count(engine, db, catalog):
+    _sell(db, catalog["product_ids"], 1)
+    with count_queries(engine) as statements:
+        stats = crud.get_dashboard_stats(db)
+    assert len(statements) == 2
+    assert stats.total_sales == Decimal("30")
+    assert stats.total_products == 5
+    assert stats.total_customers == 1
+    assert stats.today_profit == Decimal("10")
+
+    _sell(db, catalog["product_ids"], 20)
+    with count_queries(engine) as statements:
+        stats = crud.get_dashboard_stats(db)
+    assert len(statements) == 2
+    assert stats.total_sales == Decimal("630")
@@ -0,0 +1,138 @@
+"""The columnar engine (ANALYTICS_ENGINE=columnar) must answer exactly like the SQL one"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import cache
+import crud
+import fact_cache
+import models
+import schemas
+
+
+@pytest.fixture
+def sales_history(db, catalog):
+    """Sales over two months, in two categories, uncategorized and deleted products, one line of unknown cost"""
+    other = models.Category(code="electrical", name="Electrical Tools", name_ar="الأدوات الكهربائية")
+    db.add(other)
+    db.flush()
+    first, second, third, fourth, fifth = (db.get(models.Product, pid) for pid in catalog["product_ids"])
+    second.category_id = other.id
+    third.category_id = None
+    fourth.purchase_price = Decimal("12.5")
+    db.commit()
+
+    today = date.today()
+    for days_ago, lines, discount in [
+        (0, [(first, 2), (second, 1)], Decimal("0")),
+        (0, [(third, 3)], Decimal("2")),
+        (3, [(second, 4), (fourth, 1)], Decimal("0")),
+        (9, [(fifth, 1), (first, 1)], Decimal("1.5")),
+        (40, [(fourth, 2), (fifth, 5)], Decimal("0")),
+    ]:
+        crud.create_sale(db, schemas.SaleCreate(
+            customer_id=catalog["customer_id"] if days_ago % 2 else None,
+            sale_date=today - timedelta(days=days_ago), discount=discount, paid=Decimal("0"),
+            items=[schemas.SaleItemCreate(product_id=product.id, quantity=quantity) for product, quantity in lines]
+        ))
+
+    # A line whose cost is unknown, and lines whose product is gone (as ON DELETE SET NULL leaves them)
+    items = models.SaleItem
+    db.query(items).filter(items.product_id == third.id).update({'unit_cost': None})
+    db.query(items).filter(items.product_id == fifth.id).update({'product_id': None})
+    db.commit()
+    crud.rebuild_daily_sales_summary(db)
+
+
+def _reports(db):
+    today = date.today()
+    week = {'from_date': today - timedelta(days=7), 'to_date': today}
+    return {
+        'profit': crud.get_profit_report(db),
+        'profit_week': crud.get_profit_report(db, **week),
+        'trend': crud.get_sales_trend(db, days=60),
+        'top_revenue': crud.get_top_products(db),
+        'top_quantity': crud.get_top_products(db, order_by='quantity'),
+        'top_profit_week': crud.get_top_products(db, order_by='profit', **week),
+        'kpis': crud.get_business_kpis(db),
+        'categories': crud.get_sales_by_category(db),
+        'categories_week': crud.get_sales_by_category(db, **week),
+    }
+
+
+@pytest.fixture
+def columnar(monkeypatch):
+    def enable():
+        monkeypatch.setattr(fact_cache, "ANALYTICS_ENGINE", "columnar")
+        monkeypatch.setattr(fact_cache, "store", fact_cache.SalesFactStore())
+    return enable
+
+
+def test_columnar_matches_sql(db, catalog, sales_history, columnar, monkeypatch):
+    expected = _reports(db)
+    assert [(row.name, row.revenue) for row in expected['categories']] == [
+        ("غير مصنف", Decimal("135")), ("أجهزة الكمبيوتر", Decimal("90")), ("الأدوات الكهربائية", Decimal("75"))
+    ]
+
+    columnar()
+    assert _reports(db) == expected
+
+    # A sale appended after the load is counted like SQL counts it
+    crud.create_sale(db, schemas.SaleCreate(
+        paid=Decimal("45"), items=[schemas.SaleItemCreate(product_id=catalog["product_ids"][0], quantity=3)]
+    ))
+    appended = _reports(db)
+    monkeypatch.setattr(fact_cache, "ANALYTICS_ENGINE", "sql")
+    assert appended == _reports(db)
+    assert appended != expected
+
+
+def test_category_changes_reach_every_worker(db, catalog, sales_history, columnar, monkeypatch):
+    monkeypatch.setattr(cache, "backend", cache.MemoryBackend())
+    columnar()
+    this_worker = fact_cache.store
+    this_worker.load(db)
+    # The store of another worker, loaded before the changes
+    other_worker = fact_cache.SalesFactStore()
+    other_worker.load(db)
+
+    def check():
+        # Straight to the SQL query and the stores, past the result cache
+        monkeypatch.setattr(fact_cache, "ANALYTICS_ENGINE", "sql")
+        expected = [tuple(row.model_dump().values()) for row in crud.get_sales_by_category.__wrapped__(db)]
+        monkeypatch.setattr(fact_cache, "ANALYTICS_ENGINE", "columnar")
+        for store in (this_worker, other_worker):
+            assert [tuple(row) for row in store.sales_by_category(db)] == expected
+        return expected
+
+    electrical = db.query(models.Category).filter(models.Category.code == "electrical").one()
+    assert crud.delete_category(db, electrical.id)
+    # Its products' lines join the uncategorized ones in a single row
+    assert [row[1] for row in check()] == ["غير مصنف", "أجهزة الكمبيوتر"]
+
+    crud.update_product(db, catalog["product_ids"][3], schemas.ProductUpdate(category_id=None))
+    check()
+
+
+def test_sale_loaded_before_its_version_bump_is_counted_once(db, catalog, columnar, monkeypatch):
+    monkeypatch.setattr(cache, "backend", cache.MemoryBackend())
+    columnar()
+    fact_cache.store.load(db)
+
+    # The sale commits, the store reloads, and only then does the writer bump the version and append
+    created, _ = crud._add_sales(db, [schemas.SaleCreate(
+        paid=Decimal("30"), items=[schemas.SaleItemCreate(product_id=catalog["product_ids"][0], quantity=2)]
+    )])
+    _, db_sale, db_items = created[0]
+    facts = fact_cache.sale_facts(db_sale, db_items)
+    db.commit()
+    fact_cache.store.load(db)
+    cache.invalidate(cache.SALES)
+    fact_cache.record_sale(facts)
+
+    report = crud.get_profit_report(db)
+    assert report.sales_count == 1
+    assert report.total_sales == Decimal("30")
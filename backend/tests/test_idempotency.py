@@ -0,0 +1,87 @@
+"""A request sent with an Idempotency-Key creates its records at most once, even when it fails part way"""
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func
+
+import crud
+import fact_cache
+import models
+
+
+def _sale(catalog, index=0):
+    return {"paid": "15", "items": [{"product_id": catalog["product_ids"][index], "quantity": 1}]}
+
+
+def _expire_lease(db, key):
+    db.query(models.IdempotencyKey).filter(models.IdempotencyKey.key == key).update(
+        {"locked_until": func.now() - timedelta(seconds=1)}, synchronize_session=False
+    )
+    db.commit()
+
+
+def test_batch_failing_part_way_commits_nothing(client, admin_headers, db, catalog, monkeypatch):
+    headers = {**admin_headers, "Idempotency-Key": "batch-1"}
+    body = {"chunk_size": 1, "sales": [_sale(catalog, 0), _sale(catalog, 1), _sale(catalog, 2)]}
+
+    sale_facts = fact_cache.sale_facts
+    calls = []
+
+    def fail_on_second_sale(*args):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("connection lost")
+        return sale_facts(*args)
+
+    monkeypatch.setattr(fact_cache, "sale_facts", fail_on_second_sale)
+    with pytest.raises(RuntimeError):
+        client.post("/api/sales/batch", headers=headers, json=body)
+    assert db.query(models.Sale).count() == 0
+    monkeypatch.setattr(fact_cache, "sale_facts", sale_facts)
+
+    response = client.post("/api/sales/batch", headers=headers, json=body)
+    assert response.status_code == 200
+    assert response.json()["created"] == 3
+    assert db.query(models.Sale).count() == 3
+
+    replay = client.post("/api/sales/batch", headers=headers, json=body)
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert replay.json() == response.json()
+    assert db.query(models.Sale).count() == 3
+
+
+def test_abandoned_claim_is_taken_over_after_its_lease(client, admin_headers, db, catalog, monkeypatch):
+    headers = {**admin_headers, "Idempotency-Key": "crashed"}
+
+    # The worker dies before it can release the key
+    monkeypatch.setattr(crud, "release_idempotency_key", lambda *args: None)
+    monkeypatch.setattr(crud, "create_sale", lambda *args, **kwargs: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        client.post("/api/sales", headers=headers, json=_sale(catalog))
+    monkeypatch.undo()
+
+    assert client.post("/api/sales", headers=headers, json=_sale(catalog)).status_code == 409
+
+    _expire_lease(db, "crashed")
+    response = client.post("/api/sales", headers=headers, json=_sale(catalog))
+    assert response.status_code == 200
+    assert db.query(models.Sale).count() == 1
+
+
+def test_committed_sale_is_not_repeated_when_storing_the_response_fails(client, admin_headers, db, catalog, monkeypatch):
+    headers = {**admin_headers, "Idempotency-Key": "no-response"}
+
+    def fail(*args):
+        raise RuntimeError("connection lost")
+
+    monkeypatch.setattr(crud, "complete_idempotency_key", fail)
+    with pytest.raises(RuntimeError):
+        client.post("/api/sales", headers=headers, json=_sale(catalog))
+    monkeypatch.undo()
+    assert db.query(models.Sale).count() == 1
+
+    # The sale committed together with the pin, so the claim can't be released or taken over
+    assert client.post("/api/sales", headers=headers, json=_sale(catalog)).status_code == 409
+    crud.release_idempotency_key(db, "sale", "no-response")
+    assert client.post("/api/sales", headers=headers, json=_sale(catalog)).status_code == 409
+    assert db.query(models.Sale).count() == 1
@@ -0,0 +1,77 @@
+"""Point-of-sale search over products.name_normalized, which the database computes for every row"""
+import os
+
+import pytest
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import DBAPIError
+
+import crud
+import models
+import schemas
+from arabic_text import normalize_arabic
+
+DATABASE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "database")
+
+
+def _add(db, code, name):
+    return crud.create_product(db, schemas.ProductCreate(code=code, name=name))
+
+
+def _codes(rows):
+    return [row["code"] for row in rows]
+
+
+def test_spelling_variants_match_in_rank_order(db):
+    _add(db, "P1", "شاي العروسة")
+    _add(db, "P2", "عروسة حلوى")
+    _add(db, "P3", "إبريق قهوة")
+    _add(db, "P4", "أبريق شاي")
+    _add(db, "P5", "عصير مانجو")
+    _add(db, "ابريق-9", "كوب")
+
+    # Name prefix, then word inside the name with its article
+    assert _codes(crud.search_products(db, "عروسه")) == ["P2", "P1"]
+    # Hamza forms fold together; names first in normalized order, then codes
+    assert _codes(crud.search_products(db, "ابريق")) == ["P4", "P3", "ابريق-9"]
+    assert _codes(crud.search_products(db, "P5")) == ["P5"]
+
+
+def test_renamed_product_is_found_by_its_new_name(db):
+    product = _add(db, "P1", "شاي")
+    crud.update_product(db, product.id, schemas.ProductUpdate(name="قهوة تركي"))
+    assert product.name_normalized == "قهوه تركي"
+    assert _codes(crud.search_products(db, "قهوه")) == ["P1"]
+
+
+@pytest.mark.parametrize("name", [
+    "شاىٌ  أحمد", "  مـــانجو\tطازجة ", "Dell Laptop ٢٠٢٤", "ک۱۲ إبريق آلي مؤسسة",
+])
+def test_sql_normalization_matches_python(db, name):
+    assert db.execute(select(func.normalize_arabic(name))).scalar() == normalize_arabic(name)
+
+
+def test_rows_inserted_outside_crud_are_normalized(db):
+    db.execute(text("INSERT INTO products (code, name, purchase_price, sale_price, quantity) VALUES ('RAW1', 'مِكْواة بخار', 5, 8, 0)"))
+    db.commit()
+    assert _codes(crud.search_products(db, "مكواه")) == ["RAW1"]
+
+
+def test_fresh_install_from_schema_sql_is_searchable(engine, db):
+    # As docker-compose does: schema.sql and seed_data.sql on an empty database,
+    # then the tables schema.sql lacks from create_all when the app starts
+    with engine.begin() as conn:
+        conn.execute(text("DROP SCHEMA public CASCADE"))
+        conn.execute(text("CREATE SCHEMA public"))
+        for name in ("schema.sql", "seed_data.sql"):
+            with open(os.path.join(DATABASE_DIR, name), encoding="utf-8") as f:
+                sql = f.read()
+            try:
+                conn.exec_driver_sql(sql)
+            except DBAPIError as e:
+                if "extension" in str(e) and "is not available" in str(e):
+                    pytest.skip(f"A PostgreSQL extension schema.sql needs is not installed: {e.orig}")
+                raise
+    models.Base.metadata.create_all(bind=engine)
+
+    assert db.query(models.Product).filter(models.Product.name_normalized.is_(None)).count() == 0
+    assert _codes(crud.search_products(db, "ماوس")) == ["PROD002"]
@@ -0,0 +1,56 @@
+"""Writing a sale takes the same number of round trips whatever its line count"""
+from decimal import Decimal
+
+import pytest
+
+import crud
+import models
+import schemas
+from conftest import count_queries
+
+
+@pytest.fixture
+def product_ids(db, catalog):
+    products = [
+        models.Product(code=f"BULK{i:03d}", name=f"صنف {i}", category_id=catalog["category_id"],
+                       purchase_price=Decimal("4"), sale_price=Decimal("6"), quantity=1000, min_quantity=1)
+        for i in range(60)
+    ]
+    db.add_all(products)
+    db.commit()
+    return [product.id for product in products]
+
+
+def _sale(product_ids, customer_id, quantity=1):
+    return schemas.SaleCreate(
+        customer_id=customer_id, paid=Decimal("6") * len(product_ids),
+        items=[schemas.SaleItemCreate(product_id=product_id, quantity=quantity) for product_id in product_ids]
+    )
+
+
+def _round_trips(engine, write):
+    with count_queries(engine) as statements:
+        write()
+    return len(statements)
+
+
+def test_create_sale_round_trips_do_not_grow_with_lines(engine, db, catalog, product_ids):
+    customer_id = catalog["customer_id"]
+    counts = [
+        _round_trips(engine, lambda: crud.create_sale(db, _sale(product_ids[:lines], customer_id)))
+        for lines in (1, 10, 40)
+    ]
+    assert counts[0] == counts[1] == counts[2]
+
+
+def test_update_sale_round_trips_do_not_grow_with_lines(engine, db, catalog, product_ids):
+    customer_id = catalog["customer_id"]
+    counts = []
+    # At least two lines, so every edit keeps, removes and adds some
+    for lines in (2, 10, 30):
+        sale_id = crud.create_sale(db, _sale(product_ids[:lines], customer_id)).id
+        # Drop the first line, change the quantity of the rest and add new ones
+        changed = _sale(product_ids[1:lines] + product_ids[lines:2 * lines], customer_id, quantity=2)
+        counts.append(_round_trips(engine, lambda: crud.update_sale(db, sale_id, changed)))
+        db.expire_all()
+    assert counts[0] == counts[1] == counts[2]
@@ -0,0 +1,17 @@
+"""database/seed_data.sql leaves the database ready to use"""
+import os
+
+import crud
+
+SEED_DATA = os.path.join(os.path.dirname(__file__), "..", "..", "database", "seed_data.sql")
+
+
+def test_generated_codes_follow_the_seeded_ones(engine, db):
+    with open(SEED_DATA, encoding="utf-8") as f:
+        seed = f.read()
+    with engine.begin() as conn:
+        conn.exec_driver_sql(seed)
+
+    assert crud.generate_supplier_code(db) == "SUPP004"
+    assert crud.generate_customer_code(db) == "CUST004"
+    assert crud.generate_product_code(db) == "PROD006"
@@ -3,6 +3,8 @@
 
 -- Enable UUID extension
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+-- Trigram indexes for the grids' "contains" search
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 -- ============================================
 -- DROP TABLES (for clean reinstall)
@@ -65,6 +67,18 @@ CREATE TABLE customers (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- ============================================
+-- ARABIC SEARCH NORMALIZATION
+-- ============================================
+-- Same folding as backend/arabic_text.py (NORMALIZE_ARABIC_SQL)
+CREATE OR REPLACE FUNCTION normalize_arabic(value TEXT) RETURNS TEXT
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+    SELECT btrim(regexp_replace(lower(translate(
+        regexp_replace(value, '[\u064B-\u065F\u0670\u0640]', '', 'g'),
+        'أإآٱىیئؤةک٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹', 'اااايييوهك01234567890123456789'
+    )), '\s+', ' ', 'g'))
+$$;
+
 -- ============================================
 -- PRODUCTS TABLE
 -- ============================================
@@ -72,6 +86,7 @@ CREATE TABLE products (
     id SERIAL PRIMARY KEY,
     code VARCHAR(50) UNIQUE NOT NULL,
     name VARCHAR(200) NOT NULL,
+    name_normalized VARCHAR(200) COLLATE "C" GENERATED ALWAYS AS (normalize_arabic(name)) STORED,
     category_id INTEGER REFERENCES categories(id) ON DELETE SET NULL,
     supplier_id INTEGER REFERENCES suppliers(id) ON DELETE SET NULL,
     purchase_price DECIMAL(15, 2) NOT NULL DEFAULT 0,
@@ -113,6 +128,7 @@ CREATE TABLE sale_items (
     product_name VARCHAR(200),
     quantity INTEGER NOT NULL DEFAULT 1,
     unit_price DECIMAL(15, 2) NOT NULL,
+    unit_cost DECIMAL(15, 2), -- purchase price at time of sale; NULL if unknown
     total DECIMAL(15, 2) NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -180,12 +196,29 @@ CREATE TABLE settings (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- ============================================
+-- NUMBERING SEQUENCES (invoice numbers and codes)
+-- ============================================
+CREATE SEQUENCE sale_invoice_seq;
+CREATE SEQUENCE purchase_invoice_seq;
+CREATE SEQUENCE product_code_seq;
+CREATE SEQUENCE customer_code_seq;
+CREATE SEQUENCE supplier_code_seq;
+
 -- ============================================
 -- INDEXES
 -- ============================================
 CREATE INDEX idx_products_category ON products(category_id);
 CREATE INDEX idx_products_supplier ON products(supplier_id);
 CREATE INDEX idx_products_code ON products(code);
+-- Grid "contains" search (ILIKE) on name/code/phone
+CREATE INDEX ix_products_search_trgm ON products USING gin (name gin_trgm_ops, code gin_trgm_ops);
+CREATE INDEX ix_customers_search_trgm ON customers USING gin (name gin_trgm_ops, code gin_trgm_ops, phone gin_trgm_ops);
+CREATE INDEX ix_suppliers_search_trgm ON suppliers USING gin (name gin_trgm_ops, code gin_trgm_ops, phone gin_trgm_ops);
+-- Point-of-sale search (/api/products/search)
+CREATE INDEX ix_products_name_normalized ON products(name_normalized);
+CREATE INDEX ix_products_code_prefix ON products((code COLLATE "C"));
+CREATE INDEX ix_products_name_words ON products USING gin (to_tsvector('simple', name_normalized));
 CREATE INDEX idx_sales_customer ON sales(customer_id);
 CREATE INDEX idx_sales_date ON sales(sale_date);
 CREATE INDEX idx_sales_invoice ON sales(invoice_no);
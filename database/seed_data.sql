@@ -44,3 +44,11 @@ INSERT INTO products (code, name, category_id, supplier_id, purchase_price, sale
 ('PROD003', 'ريسيفر ديجيتال', 3, 2, 120, 200, 15, 3, 'ريسيفر ديجيتال عالي الجودة'),
 ('PROD004', 'سلك HDMI', 4, 1, 15, 30, 60, 10, 'سلك HDMI بطول 2 متر'),
 ('PROD005', 'مروحة مكتب', 2, 3, 60, 110, 12, 3, 'مروحة مكتب صغيرة');
+
+-- ============================================
+-- NUMBERING SEQUENCES
+-- ============================================
+-- Continue after the seeded codes, so generated codes don't collide with them
+SELECT setval('supplier_code_seq', (SELECT MAX(CAST(substring(code FROM '^SUPP([0-9]+)$') AS BIGINT)) FROM suppliers));
+SELECT setval('customer_code_seq', (SELECT MAX(CAST(substring(code FROM '^CUST([0-9]+)$') AS BIGINT)) FROM customers));
+SELECT setval('product_code_seq', (SELECT MAX(CAST(substring(code FROM '^PROD([0-9]+)$') AS BIGINT)) FROM products));
@@ -0,0 +1,44 @@
+// Cash drawer (till) selection shared by the sales and purchases forms
+import { useState, useEffect } from 'react'
+import { CashAPI } from '../services/api'
+
+// Remembered per browser, since each till runs on its own device
+const STORAGE_KEY = 'cashDrawerId'
+
+// Active drawers and the one this device pays into / out of ('' until they are loaded)
+export function useCashDrawer() {
+    const [drawers, setDrawers] = useState([])
+    const [drawerId, setDrawerId] = useState('')
+
+    useEffect(() => {
+        CashAPI.getDrawers()
+            .then(data => {
+                setDrawers(data)
+                const saved = localStorage.getItem(STORAGE_KEY)
+                // A remembered drawer may have been closed since
+                const drawer = data.find(d => String(d.id) === saved) || data[0]
+                setDrawerId(drawer ? String(drawer.id) : '')
+            })
+            .catch(error => console.error('Error loading cash drawers:', error))
+    }, [])
+
+    const selectDrawer = (id) => {
+        setDrawerId(id)
+        localStorage.setItem(STORAGE_KEY, id)
+    }
+
+    return { drawers, drawerId, selectDrawer }
+}
+
+// Nothing to choose with a single drawer, so the select only shows with several
+export function CashDrawerSelect({ drawers, drawerId, onChange }) {
+    if (drawers.length < 2) return null
+    return (
+        <div className="form-group">
+            <label>الصندوق</label>
+            <select className="form-control" value={drawerId} onChange={e => onChange(e.target.value)}>
+                {drawers.map(d => <option key={d.id} value={d.id}>{d.name}</option>)}
+            </select>
+        </div>
+    )
+}
@@ -1,12 +1,21 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import { CustomersAPI } from '../services/api'
+import { SortableHeader, Pagination } from './GridControls'
+
+const PAGE_SIZE = 50
 
 function Customers() {
     const [customers, setCustomers] = useState([])
+    const [total, setTotal] = useState(0)
+    const [skip, setSkip] = useState(0)
+    const [sort, setSort] = useState('id')
+    const [balanceFilter, setBalanceFilter] = useState('')
     const [loading, setLoading] = useState(true)
     const [showModal, setShowModal] = useState(false)
     const [editingCustomer, setEditingCustomer] = useState(null)
     const [searchTerm, setSearchTerm] = useState('')
+    const [search, setSearch] = useState('')
+    const requestRef = useRef(0)
     const [formData, setFormData] = useState({
         code: '',
         name: '',
@@ -15,15 +24,38 @@ function Customers() {
         address: ''
     })
 
+    // Wait for a pause in typing before asking the server to search
+    useEffect(() => {
+        const timer = setTimeout(() => {
+            setSearch(searchTerm.trim())
+            setSkip(0)
+        }, 300)
+        return () => clearTimeout(timer)
+    }, [searchTerm])
+
     useEffect(() => {
         loadCustomers()
-    }, [])
+    }, [search, balanceFilter, sort, skip])
 
     const loadCustomers = async () => {
+        // Only the latest request may update the grid
+        const request = ++requestRef.current
         try {
-            setLoading(true)
-            const data = await CustomersAPI.getAll()
-            setCustomers(data)
+            const data = await CustomersAPI.list({
+                search: search || undefined,
+                has_balance: balanceFilter || undefined,
+                sort,
+                skip,
+                limit: PAGE_SIZE
+            })
+            if (request !== requestRef.current) return
+            if (data.items.length === 0 && skip > 0) {
+                // The last row of the page was deleted
+                setSkip(Math.max(0, skip - PAGE_SIZE))
+                return
+            }
+            setCustomers(data.items)
+            setTotal(data.total)
         } catch (error) {
             console.error('Error loading customers:', error)
         } finally {
@@ -33,15 +65,22 @@ function Customers() {
 
     const formatCurrency = (amount) => parseFloat(amount || 0).toFixed(2) + ' ج.م'
 
-    const handleAdd = () => {
+    const handleAdd = async () => {
         setEditingCustomer(null)
         setFormData({
-            code: `CUST${String(customers.length + 1).padStart(3, '0')}`,
+            code: '',
             name: '',
             phone: '',
             email: '',
             address: ''
         })
+        try {
+            // The server numbers codes; the grid's total is only the filtered row count
+            const code = await CustomersAPI.generateCode()
+            setFormData(data => ({ ...data, code }))
+        } catch (error) {
+            console.error('Error generating customer code:', error)
+        }
         setShowModal(true)
     }
 
@@ -91,11 +130,10 @@ function Customers() {
         }
     }
 
-    const filteredCustomers = customers.filter(c =>
-        c.name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        c.code.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        (c.phone && c.phone.includes(searchTerm))
-    )
+    const changeSort = (value) => {
+        setSort(value)
+        setSkip(0)
+    }
 
     if (loading) {
         return (
@@ -116,30 +154,41 @@ function Customers() {
             </div>
 
             <div className="card">
-                <div className="search-box">
-                    <input
-                        type="text"
-                        placeholder="بحث عن عميل..."
-                        value={searchTerm}
-                        onChange={(e) => setSearchTerm(e.target.value)}
-                    />
-                    <i className="fas fa-search"></i>
+                <div className="grid-toolbar">
+                    <div className="search-box">
+                        <input
+                            type="text"
+                            placeholder="بحث عن عميل..."
+                            value={searchTerm}
+                            onChange={(e) => setSearchTerm(e.target.value)}
+                        />
+                        <i className="fas fa-search"></i>
+                    </div>
+                    <select
+                        className="form-control"
+                        value={balanceFilter}
+                        onChange={e => { setBalanceFilter(e.target.value); setSkip(0) }}
+                    >
+                        <option value="">كل العملاء</option>
+                        <option value="true">عليهم رصيد</option>
+                        <option value="false">بدون رصيد</option>
+                    </select>
                 </div>
 
                 <table>
                     <thead>
                         <tr>
-                            <th>كود العميل</th>
-                            <th>اسم العميل</th>
+                            <SortableHeader field="code" sort={sort} onSort={changeSort}>كود العميل</SortableHeader>
+                            <SortableHeader field="name" sort={sort} onSort={changeSort}>اسم العميل</SortableHeader>
                             <th>الهاتف</th>
                             <th>البريد الإلكتروني</th>
-                            <th>إجمالي المشتريات</th>
-                            <th>الرصيد</th>
+                            <SortableHeader field="total_purchases" sort={sort} onSort={changeSort}>إجمالي المشتريات</SortableHeader>
+                            <SortableHeader field="balance" sort={sort} onSort={changeSort}>الرصيد</SortableHeader>
                             <th>الإجراءات</th>
                         </tr>
                     </thead>
                     <tbody>
-                        {filteredCustomers.map(customer => (
+                        {customers.map(customer => (
                             <tr key={customer.id}>
                                 <td>{customer.code}</td>
                                 <td>{customer.name}</td>
@@ -161,6 +210,8 @@ function Customers() {
                         ))}
                     </tbody>
                 </table>
+
+                <Pagination skip={skip} limit={PAGE_SIZE} total={total} onChange={setSkip} />
             </div>
 
             {/* Modal */}
@@ -0,0 +1,37 @@
+// Shared controls for the server-side paginated grids (products, customers, suppliers)
+
+// Column header that sorts by `field`; clicking again reverses the order ('-field')
+export function SortableHeader({ field, sort, onSort, children }) {
+    const icon = sort === field ? 'fa-sort-up' : sort === `-${field}` ? 'fa-sort-down' : 'fa-sort'
+    return (
+        <th className="sortable" onClick={() => onSort(sort === field ? `-${field}` : field)}>
+            {children} <i className={`fas ${icon}`}></i>
+        </th>
+    )
+}
+
+export function Pagination({ skip, limit, total, onChange }) {
+    const from = total === 0 ? 0 : skip + 1
+    const to = Math.min(skip + limit, total)
+    return (
+        <div className="pagination">
+            <span>{from} - {to} من {total}</span>
+            <div className="pagination-buttons">
+                <button
+                    className="btn btn-sm"
+                    disabled={skip === 0}
+                    onClick={() => onChange(Math.max(0, skip - limit))}
+                >
+                    <i className="fas fa-chevron-right"></i> السابق
+                </button>
+                <button
+                    className="btn btn-sm"
+                    disabled={skip + limit >= total}
+                    onClick={() => onChange(skip + limit)}
+                >
+                    التالي <i className="fas fa-chevron-left"></i>
+                </button>
+            </div>
+        </div>
+    )
+}
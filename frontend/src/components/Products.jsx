@@ -1,14 +1,24 @@
 import { useState, useEffect, useRef } from 'react'
 import { ProductsAPI, CategoriesAPI, SuppliersAPI } from '../services/api'
+import { SortableHeader, Pagination } from './GridControls'
+
+const PAGE_SIZE = 50
 
 function Products() {
     const [products, setProducts] = useState([])
+    const [total, setTotal] = useState(0)
+    const [skip, setSkip] = useState(0)
+    const [sort, setSort] = useState('id')
+    const [categoryFilter, setCategoryFilter] = useState('all')
+    const [stockFilter, setStockFilter] = useState('')
     const [categories, setCategories] = useState([])
     const [suppliers, setSuppliers] = useState([])
     const [loading, setLoading] = useState(true)
     const [showModal, setShowModal] = useState(false)
     const [editingProduct, setEditingProduct] = useState(null)
     const [searchTerm, setSearchTerm] = useState('')
+    const [search, setSearch] = useState('')
+    const requestRef = useRef(0)
     const [importing, setImporting] = useState(false)
     const [importResult, setImportResult] = useState(null)
     const fileInputRef = useRef(null)
@@ -25,20 +35,55 @@ function Products() {
     })
 
     useEffect(() => {
-        loadData()
+        loadLookups()
     }, [])
 
-    const loadData = async () => {
+    // Wait for a pause in typing before asking the server to search
+    useEffect(() => {
+        const timer = setTimeout(() => {
+            setSearch(searchTerm.trim())
+            setSkip(0)
+        }, 300)
+        return () => clearTimeout(timer)
+    }, [searchTerm])
+
+    useEffect(() => {
+        loadData()
+    }, [search, categoryFilter, stockFilter, sort, skip])
+
+    const loadLookups = async () => {
         try {
-            setLoading(true)
-            const [productsData, categoriesData, suppliersData] = await Promise.all([
-                ProductsAPI.getAll(),
+            const [categoriesData, suppliersData] = await Promise.all([
                 CategoriesAPI.getAll(),
                 SuppliersAPI.getAll()
             ])
-            setProducts(productsData)
             setCategories(categoriesData)
             setSuppliers(suppliersData)
+        } catch (error) {
+            console.error('Error loading categories and suppliers:', error)
+        }
+    }
+
+    const loadData = async () => {
+        // Only the latest request may update the grid
+        const request = ++requestRef.current
+        try {
+            const data = await ProductsAPI.list({
+                search: search || undefined,
+                category: categoryFilter,
+                low_stock: stockFilter || undefined,
+                sort,
+                skip,
+                limit: PAGE_SIZE
+            })
+            if (request !== requestRef.current) return
+            if (data.items.length === 0 && skip > 0) {
+                // The last row of the page was deleted
+                setSkip(Math.max(0, skip - PAGE_SIZE))
+                return
+            }
+            setProducts(data.items)
+            setTotal(data.total)
         } catch (error) {
             console.error('Error loading products:', error)
         } finally {
@@ -48,10 +93,10 @@ function Products() {
 
     const formatCurrency = (amount) => parseFloat(amount || 0).toFixed(2) + ' ج.م'
 
-    const handleAdd = () => {
+    const handleAdd = async () => {
         setEditingProduct(null)
         setFormData({
-            code: `PROD${String(products.length + 1).padStart(3, '0')}`,
+            code: '',
             name: '',
             category_id: '',
             supplier_id: '',
@@ -61,6 +106,13 @@ function Products() {
             min_quantity: '5',
             description: ''
         })
+        try {
+            // The server numbers codes; the grid's total is only the filtered row count
+            const code = await ProductsAPI.generateCode()
+            setFormData(data => ({ ...data, code }))
+        } catch (error) {
+            console.error('Error generating product code:', error)
+        }
         setShowModal(true)
     }
 
@@ -155,10 +207,10 @@ function Products() {
         }
     }
 
-    const filteredProducts = products.filter(p =>
-        p.name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        p.code.toLowerCase().includes(searchTerm.toLowerCase())
-    )
+    const changeSort = (value) => {
+        setSort(value)
+        setSkip(0)
+    }
 
     if (loading) {
         return (
@@ -199,31 +251,52 @@ function Products() {
             </div>
 
             <div className="card">
-                <div className="search-box">
-                    <input
-                        type="text"
-                        placeholder="بحث عن صنف..."
-                        value={searchTerm}
-                        onChange={(e) => setSearchTerm(e.target.value)}
-                    />
-                    <i className="fas fa-search"></i>
+                <div className="grid-toolbar">
+                    <div className="search-box">
+                        <input
+                            type="text"
+                            placeholder="بحث عن صنف..."
+                            value={searchTerm}
+                            onChange={(e) => setSearchTerm(e.target.value)}
+                        />
+                        <i className="fas fa-search"></i>
+                    </div>
+                    <select
+                        className="form-control"
+                        value={categoryFilter}
+                        onChange={e => { setCategoryFilter(e.target.value); setSkip(0) }}
+                    >
+                        <option value="all">كل الفئات</option>
+                        {categories.map(cat => (
+                            <option key={cat.id} value={cat.code}>{cat.name_ar || cat.name}</option>
+                        ))}
+                    </select>
+                    <select
+                        className="form-control"
+                        value={stockFilter}
+                        onChange={e => { setStockFilter(e.target.value); setSkip(0) }}
+                    >
+                        <option value="">كل الكميات</option>
+                        <option value="true">عند حد الطلب أو أقل</option>
+                        <option value="false">فوق حد الطلب</option>
+                    </select>
                 </div>
 
                 <table>
                     <thead>
                         <tr>
-                            <th>كود الصنف</th>
-                            <th>اسم الصنف</th>
-                            <th>الفئة</th>
-                            <th>سعر الشراء</th>
-                            <th>سعر البيع</th>
-                            <th>الكمية</th>
-                            <th>المورد</th>
+                            <SortableHeader field="code" sort={sort} onSort={changeSort}>كود الصنف</SortableHeader>
+                            <SortableHeader field="name" sort={sort} onSort={changeSort}>اسم الصنف</SortableHeader>
+                            <SortableHeader field="category" sort={sort} onSort={changeSort}>الفئة</SortableHeader>
+                            <SortableHeader field="purchase_price" sort={sort} onSort={changeSort}>سعر الشراء</SortableHeader>
+                            <SortableHeader field="sale_price" sort={sort} onSort={changeSort}>سعر البيع</SortableHeader>
+                            <SortableHeader field="quantity" sort={sort} onSort={changeSort}>الكمية</SortableHeader>
+                            <SortableHeader field="supplier" sort={sort} onSort={changeSort}>المورد</SortableHeader>
                             <th>الإجراءات</th>
                         </tr>
                     </thead>
                     <tbody>
-                        {filteredProducts.map(product => (
+                        {products.map(product => (
                             <tr key={product.id}>
                                 <td>{product.code}</td>
                                 <td>{product.name}</td>
@@ -250,6 +323,8 @@ function Products() {
                         ))}
                     </tbody>
                 </table>
+
+                <Pagination skip={skip} limit={PAGE_SIZE} total={total} onChange={setSkip} />
             </div>
 
             {/* Modal */}
@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react'
-import { PurchasesAPI, ProductsAPI, SuppliersAPI } from '../services/api'
+import { PurchasesAPI, ProductsAPI, SuppliersAPI, newIdempotencyKey } from '../services/api'
+import { useCashDrawer, CashDrawerSelect } from './CashDrawerSelect'
 
 function Purchases({ user }) {
     const [purchases, setPurchases] = useState([])
@@ -11,6 +12,8 @@ function Purchases({ user }) {
     const [selectedPurchase, setSelectedPurchase] = useState(null)
     const [editingPurchase, setEditingPurchase] = useState(null)
     const [purchaseItems, setPurchaseItems] = useState([])
+    // One key per new purchase form, so resubmitting after a lost response can't create it twice
+    const [idempotencyKey, setIdempotencyKey] = useState(null)
     const [formData, setFormData] = useState({
         supplier_id: '',
         purchase_date: new Date().toISOString().split('T')[0],
@@ -22,6 +25,7 @@ function Purchases({ user }) {
     const [selectedProduct, setSelectedProduct] = useState('')
     const [quantity, setQuantity] = useState(1)
     const [unitPrice, setUnitPrice] = useState('')
+    const { drawers, drawerId, selectDrawer } = useCashDrawer()
 
     // Check if user can edit (admin or manager)
     const canEdit = user && (user.role === 'admin' || user.role === 'manager')
@@ -125,6 +129,7 @@ function Purchases({ user }) {
             paid: paidAmount,
             payment_method: paidAmount > 0 ? formData.payment_method : null,
             notes: formData.notes,
+            drawer_id: drawerId ? parseInt(drawerId) : null,
             items: purchaseItems.map(item => ({
                 product_id: item.product_id,
                 quantity: item.quantity,
@@ -138,7 +143,7 @@ function Purchases({ user }) {
                 await PurchasesAPI.update(editingPurchase.id, purchaseData)
             } else {
                 // Create new purchase
-                await PurchasesAPI.create(purchaseData)
+                await PurchasesAPI.create(purchaseData, idempotencyKey)
             }
             setShowModal(false)
             setPurchaseItems([])
@@ -166,6 +171,7 @@ function Purchases({ user }) {
     const openModal = () => {
         setPurchaseItems([])
         setEditingPurchase(null)
+        setIdempotencyKey(newIdempotencyKey())
         setFormData({ supplier_id: '', purchase_date: new Date().toISOString().split('T')[0], payment_method: 'كاش', discount: 0, paid: 0, notes: '' })
         setShowModal(true)
     }
@@ -338,16 +344,19 @@ function Purchases({ user }) {
                                     </div>
                                 </div>
 
-                                {/* Payment Method - Only show when there's payment */}
+                                {/* Payment Method and cash drawer - Only show when there's payment */}
                                 {parseFloat(formData.paid) > 0 && (
-                                    <div className="form-group">
-                                        <label>طريقة الدفع</label>
-                                        <select className="form-control" value={formData.payment_method} onChange={e => setFormData({ ...formData, payment_method: e.target.value })}>
-                                            <option value="كاش">كاش (Cash)</option>
-                                            <option value="فيزا">فيزا (Visa)</option>
-                                            <option value="تحويل بنكي">تحويل بنكي (Bank Transfer)</option>
-                                            <option value="أخرى">أخرى (Other)</option>
-                                        </select>
+                                    <div className="form-row">
+                                        <div className="form-group">
+                                            <label>طريقة الدفع</label>
+                                            <select className="form-control" value={formData.payment_method} onChange={e => setFormData({ ...formData, payment_method: e.target.value })}>
+                                                <option value="كاش">كاش (Cash)</option>
+                                                <option value="فيزا">فيزا (Visa)</option>
+                                                <option value="تحويل بنكي">تحويل بنكي (Bank Transfer)</option>
+                                                <option value="أخرى">أخرى (Other)</option>
+                                            </select>
+                                        </div>
+                                        <CashDrawerSelect drawers={drawers} drawerId={drawerId} onChange={selectDrawer} />
                                     </div>
                                 )}
 
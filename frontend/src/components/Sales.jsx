@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react'
-import { SalesAPI, ProductsAPI, CustomersAPI } from '../services/api'
+import { SalesAPI, ProductsAPI, CustomersAPI, newIdempotencyKey } from '../services/api'
+import { useCashDrawer, CashDrawerSelect } from './CashDrawerSelect'
 
 function Sales({ user }) {
     const [sales, setSales] = useState([])
@@ -11,6 +12,8 @@ function Sales({ user }) {
     const [selectedSale, setSelectedSale] = useState(null)
     const [editingSale, setEditingSale] = useState(null)
     const [saleItems, setSaleItems] = useState([])
+    // One key per new sale form, so resubmitting after a lost response can't create it twice
+    const [idempotencyKey, setIdempotencyKey] = useState(null)
     const [formData, setFormData] = useState({
         customer_id: '',
         sale_date: new Date().toISOString().split('T')[0],
@@ -20,8 +23,11 @@ function Sales({ user }) {
         notes: ''
     })
     const [selectedProduct, setSelectedProduct] = useState('')
+    const [productSearch, setProductSearch] = useState('')
+    const [searchResults, setSearchResults] = useState(null)
     const [quantity, setQuantity] = useState(1)
     const [unitPrice, setUnitPrice] = useState('')
+    const { drawers, drawerId, selectDrawer } = useCashDrawer()
 
     // Check if user can edit (admin or manager)
     const canEdit = user && (user.role === 'admin' || user.role === 'manager')
@@ -30,6 +36,36 @@ function Sales({ user }) {
         loadData()
     }, [])
 
+    // Look products up on the server as the cashier types or scans a code
+    useEffect(() => {
+        const q = productSearch.trim()
+        if (!q) {
+            setSearchResults(null)
+            return
+        }
+        let cancelled = false
+        const timer = setTimeout(async () => {
+            try {
+                const results = await ProductsAPI.search(q)
+                if (cancelled) return
+                setSearchResults(results)
+                // A scanned code matches exactly one product: select it straight away
+                if (results.length === 1 && results[0].code === q) {
+                    setSelectedProduct(String(results[0].id))
+                    setUnitPrice(results[0].sale_price)
+                }
+            } catch (error) {
+                console.error('Error searching products:', error)
+            }
+        }, 250)
+        return () => {
+            cancelled = true
+            clearTimeout(timer)
+        }
+    }, [productSearch])
+
+    const productOptions = searchResults || products
+
     const loadData = async () => {
         try {
             setLoading(true)
@@ -55,7 +91,7 @@ function Sales({ user }) {
             alert('يرجى اختيار منتج وكمية صحيحة')
             return
         }
-        const product = products.find(p => p.id === parseInt(selectedProduct))
+        const product = productOptions.find(p => p.id === parseInt(selectedProduct))
         if (!product) return
 
         if (quantity > product.quantity) {
@@ -83,6 +119,7 @@ function Sales({ user }) {
         }
 
         setSelectedProduct('')
+        setProductSearch('')
         setQuantity(1)
         setUnitPrice('')
     }
@@ -125,6 +162,7 @@ function Sales({ user }) {
             paid: paidAmount,
             payment_method: paidAmount > 0 ? formData.payment_method : null,
             notes: formData.notes,
+            drawer_id: drawerId ? parseInt(drawerId) : null,
             items: saleItems.map(item => ({
                 product_id: item.product_id,
                 quantity: item.quantity,
@@ -138,10 +176,11 @@ function Sales({ user }) {
                 await SalesAPI.update(editingSale.id, saleData)
             } else {
                 // Create new sale
-                await SalesAPI.create(saleData)
+                await SalesAPI.create(saleData, idempotencyKey)
             }
             setShowModal(false)
             setSaleItems([])
+            setProductSearch('')
             setEditingSale(null)
             setFormData({ customer_id: '', sale_date: new Date().toISOString().split('T')[0], payment_method: 'كاش', discount: 0, paid: 0, notes: '' })
             loadData()
@@ -164,7 +203,9 @@ function Sales({ user }) {
 
     const openModal = () => {
         setSaleItems([])
+        setProductSearch('')
         setEditingSale(null)
+        setIdempotencyKey(newIdempotencyKey())
         setFormData({ customer_id: '', sale_date: new Date().toISOString().split('T')[0], payment_method: 'كاش', discount: 0, paid: 0, notes: '' })
         setShowModal(true)
     }
@@ -330,31 +371,44 @@ function Sales({ user }) {
                                     </div>
                                 </div>
 
-                                {/* Payment Method - Only show when there's payment */}
+                                {/* Payment Method and cash drawer - Only show when there's payment */}
                                 {parseFloat(formData.paid) > 0 && (
-                                    <div className="form-group">
-                                        <label>طريقة الدفع</label>
-                                        <select className="form-control" value={formData.payment_method} onChange={e => setFormData({ ...formData, payment_method: e.target.value })}>
-                                            <option value="كاش">كاش (Cash)</option>
-                                            <option value="فيزا">فيزا (Visa)</option>
-                                            <option value="تحويل بنكي">تحويل بنكي (Bank Transfer)</option>
-                                            <option value="أخرى">أخرى (Other)</option>
-                                        </select>
+                                    <div className="form-row">
+                                        <div className="form-group">
+                                            <label>طريقة الدفع</label>
+                                            <select className="form-control" value={formData.payment_method} onChange={e => setFormData({ ...formData, payment_method: e.target.value })}>
+                                                <option value="كاش">كاش (Cash)</option>
+                                                <option value="فيزا">فيزا (Visa)</option>
+                                                <option value="تحويل بنكي">تحويل بنكي (Bank Transfer)</option>
+                                                <option value="أخرى">أخرى (Other)</option>
+                                            </select>
+                                        </div>
+                                        <CashDrawerSelect drawers={drawers} drawerId={drawerId} onChange={selectDrawer} />
                                     </div>
                                 )}
 
                                 <div className="card" style={{ marginBottom: '20px', background: '#f8f9fa', padding: '15px' }}>
                                     <h4 style={{ marginBottom: '15px' }}>إضافة صنف</h4>
+                                    <div className="form-group">
+                                        <label>بحث بالاسم أو الكود</label>
+                                        <input
+                                            type="text"
+                                            className="form-control"
+                                            value={productSearch}
+                                            onChange={e => setProductSearch(e.target.value)}
+                                            placeholder="اكتب جزءا من الاسم أو امسح الباركود"
+                                        />
+                                    </div>
                                     <div className="form-row">
                                         <div className="form-group">
                                             <label>الصنف</label>
                                             <select className="form-control" value={selectedProduct} onChange={e => {
                                                 setSelectedProduct(e.target.value)
-                                                const p = products.find(pr => pr.id === parseInt(e.target.value))
+                                                const p = productOptions.find(pr => pr.id === parseInt(e.target.value))
                                                 if (p) setUnitPrice(p.sale_price)
                                             }}>
                                                 <option value="">اختر صنف</option>
-                                                {products.filter(p => p.quantity > 0).map(p => <option key={p.id} value={p.id}>{p.name} ({p.quantity} متاح)</option>)}
+                                                {productOptions.filter(p => p.quantity > 0).map(p => <option key={p.id} value={p.id}>{p.name} ({p.quantity} متاح)</option>)}
                                             </select>
                                         </div>
                                         <div className="form-group">
@@ -1,12 +1,21 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import { SuppliersAPI } from '../services/api'
+import { SortableHeader, Pagination } from './GridControls'
+
+const PAGE_SIZE = 50
 
 function Suppliers() {
     const [suppliers, setSuppliers] = useState([])
+    const [total, setTotal] = useState(0)
+    const [skip, setSkip] = useState(0)
+    const [sort, setSort] = useState('id')
+    const [balanceFilter, setBalanceFilter] = useState('')
     const [loading, setLoading] = useState(true)
     const [showModal, setShowModal] = useState(false)
     const [editingSupplier, setEditingSupplier] = useState(null)
     const [searchTerm, setSearchTerm] = useState('')
+    const [search, setSearch] = useState('')
+    const requestRef = useRef(0)
     const [formData, setFormData] = useState({
         code: '',
         name: '',
@@ -15,15 +24,38 @@ function Suppliers() {
         address: ''
     })
 
+    // Wait for a pause in typing before asking the server to search
+    useEffect(() => {
+        const timer = setTimeout(() => {
+            setSearch(searchTerm.trim())
+            setSkip(0)
+        }, 300)
+        return () => clearTimeout(timer)
+    }, [searchTerm])
+
     useEffect(() => {
         loadSuppliers()
-    }, [])
+    }, [search, balanceFilter, sort, skip])
 
     const loadSuppliers = async () => {
+        // Only the latest request may update the grid
+        const request = ++requestRef.current
         try {
-            setLoading(true)
-            const data = await SuppliersAPI.getAll()
-            setSuppliers(data)
+            const data = await SuppliersAPI.list({
+                search: search || undefined,
+                has_balance: balanceFilter || undefined,
+                sort,
+                skip,
+                limit: PAGE_SIZE
+            })
+            if (request !== requestRef.current) return
+            if (data.items.length === 0 && skip > 0) {
+                // The last row of the page was deleted
+                setSkip(Math.max(0, skip - PAGE_SIZE))
+                return
+            }
+            setSuppliers(data.items)
+            setTotal(data.total)
         } catch (error) {
             console.error('Error loading suppliers:', error)
         } finally {
@@ -33,15 +65,22 @@ function Suppliers() {
 
     const formatCurrency = (amount) => parseFloat(amount || 0).toFixed(2) + ' ج.م'
 
-    const handleAdd = () => {
+    const handleAdd = async () => {
         setEditingSupplier(null)
         setFormData({
-            code: `SUPP${String(suppliers.length + 1).padStart(3, '0')}`,
+            code: '',
             name: '',
             phone: '',
             email: '',
             address: ''
         })
+        try {
+            // The server numbers codes; the grid's total is only the filtered row count
+            const code = await SuppliersAPI.generateCode()
+            setFormData(data => ({ ...data, code }))
+        } catch (error) {
+            console.error('Error generating supplier code:', error)
+        }
         setShowModal(true)
     }
 
@@ -89,10 +128,10 @@ function Suppliers() {
         }
     }
 
-    const filteredSuppliers = suppliers.filter(s =>
-        s.name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        s.code.toLowerCase().includes(searchTerm.toLowerCase())
-    )
+    const changeSort = (value) => {
+        setSort(value)
+        setSkip(0)
+    }
 
     if (loading) {
         return <div className="loading"><div className="loading-spinner"></div><span>جاري التحميل...</span></div>
@@ -108,26 +147,37 @@ function Suppliers() {
             </div>
 
             <div className="card">
-                <div className="search-box">
-                    <input type="text" placeholder="بحث عن مورد..." value={searchTerm} onChange={(e) => setSearchTerm(e.target.value)} />
-                    <i className="fas fa-search"></i>
+                <div className="grid-toolbar">
+                    <div className="search-box">
+                        <input type="text" placeholder="بحث عن مورد..." value={searchTerm} onChange={(e) => setSearchTerm(e.target.value)} />
+                        <i className="fas fa-search"></i>
+                    </div>
+                    <select
+                        className="form-control"
+                        value={balanceFilter}
+                        onChange={e => { setBalanceFilter(e.target.value); setSkip(0) }}
+                    >
+                        <option value="">كل الموردين</option>
+                        <option value="true">لهم رصيد</option>
+                        <option value="false">بدون رصيد</option>
+                    </select>
                 </div>
 
                 <table>
                     <thead>
                         <tr>
-                            <th>كود المورد</th>
-                            <th>اسم المورد</th>
+                            <SortableHeader field="code" sort={sort} onSort={changeSort}>كود المورد</SortableHeader>
+                            <SortableHeader field="name" sort={sort} onSort={changeSort}>اسم المورد</SortableHeader>
                             <th>الهاتف</th>
                             <th>البريد الإلكتروني</th>
                             <th>العنوان</th>
-                            <th>إجمالي المشتريات</th>
-                            <th>الرصيد</th>
+                            <SortableHeader field="total_purchases" sort={sort} onSort={changeSort}>إجمالي المشتريات</SortableHeader>
+                            <SortableHeader field="balance" sort={sort} onSort={changeSort}>الرصيد</SortableHeader>
                             <th>الإجراءات</th>
                         </tr>
                     </thead>
                     <tbody>
-                        {filteredSuppliers.map(supplier => (
+                        {suppliers.map(supplier => (
                             <tr key={supplier.id}>
                                 <td>{supplier.code}</td>
                                 <td>{supplier.name}</td>
@@ -150,6 +200,8 @@ function Suppliers() {
                         ))}
                     </tbody>
                 </table>
+
+                <Pagination skip={skip} limit={PAGE_SIZE} total={total} onChange={setSkip} />
             </div>
 
             {showModal && (
@@ -31,6 +31,13 @@ api.interceptors.response.use(
     }
 );
 
+// Key for the Idempotency-Key header: a create retried with the same key
+// (after a timeout or a double click) is applied only once
+export const newIdempotencyKey = () =>
+    crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+
+const idempotent = (idempotencyKey) => (idempotencyKey ? { headers: { 'Idempotency-Key': idempotencyKey } } : undefined);
+
 // Categories API
 export const CategoriesAPI = {
     getAll: () => api.get('/categories').then(res => res.data),
@@ -42,7 +49,11 @@ export const CategoriesAPI = {
 
 // Suppliers API
 export const SuppliersAPI = {
-    getAll: () => api.get('/suppliers').then(res => res.data),
+    getAll: () => api.get('/suppliers').then(res => res.data.items),
+    // One page of the grid: { search, has_balance, sort, skip, limit } -> { items, total, skip, limit }
+    list: (params) => api.get('/suppliers', { params }).then(res => res.data),
+    // Reserves the next free code; an unused one is skipped, never reissued
+    generateCode: () => api.get('/suppliers/generate-code').then(res => res.data.code),
     getById: (id) => api.get(`/suppliers/${id}`).then(res => res.data),
     create: (data) => api.post('/suppliers', data).then(res => res.data),
     update: (id, data) => api.put(`/suppliers/${id}`, data).then(res => res.data),
@@ -51,7 +62,11 @@ export const SuppliersAPI = {
 
 // Customers API
 export const CustomersAPI = {
-    getAll: () => api.get('/customers').then(res => res.data),
+    getAll: () => api.get('/customers').then(res => res.data.items),
+    // One page of the grid: { search, has_balance, sort, skip, limit } -> { items, total, skip, limit }
+    list: (params) => api.get('/customers', { params }).then(res => res.data),
+    // Reserves the next free code; an unused one is skipped, never reissued
+    generateCode: () => api.get('/customers/generate-code').then(res => res.data.code),
     getById: (id) => api.get(`/customers/${id}`).then(res => res.data),
     create: (data) => api.post('/customers', data).then(res => res.data),
     update: (id, data) => api.put(`/customers/${id}`, data).then(res => res.data),
@@ -62,8 +77,14 @@ export const CustomersAPI = {
 export const ProductsAPI = {
     getAll: (category = null) => {
         const params = category && category !== 'all' ? `?category=${category}` : '';
-        return api.get(`/products${params}`).then(res => res.data);
+        return api.get(`/products${params}`).then(res => res.data.items);
     },
+    // One page of the grid: { search, category, supplier_id, low_stock, sort, skip, limit } -> { items, total, skip, limit }
+    list: (params) => api.get('/products', { params }).then(res => res.data),
+    // Point-of-sale lookup by exact code (barcode) or partial name, best matches first
+    search: (q, limit = 20) => api.get('/products/search', { params: { q, limit } }).then(res => res.data),
+    // Reserves the next free code; an unused one is skipped, never reissued
+    generateCode: () => api.get('/products/generate-code').then(res => res.data.code),
     getById: (id) => api.get(`/products/${id}`).then(res => res.data),
     create: (data) => api.post('/products', data).then(res => res.data),
     update: (id, data) => api.put(`/products/${id}`, data).then(res => res.data),
@@ -82,18 +103,18 @@ export const ProductsAPI = {
 
 // Sales API
 export const SalesAPI = {
-    getAll: () => api.get('/sales').then(res => res.data),
+    getAll: () => api.get('/sales?include=none').then(res => res.data.items),
     getById: (id) => api.get(`/sales/${id}`).then(res => res.data),
-    create: (data) => api.post('/sales', data).then(res => res.data),
+    create: (data, idempotencyKey) => api.post('/sales', data, idempotent(idempotencyKey)).then(res => res.data),
     update: (id, data) => api.put(`/sales/${id}`, data).then(res => res.data),
     delete: (id) => api.delete(`/sales/${id}`).then(res => res.data),
 };
 
 // Purchases API
 export const PurchasesAPI = {
-    getAll: () => api.get('/purchases').then(res => res.data),
+    getAll: () => api.get('/purchases?include=none').then(res => res.data.items),
     getById: (id) => api.get(`/purchases/${id}`).then(res => res.data),
-    create: (data) => api.post('/purchases', data).then(res => res.data),
+    create: (data, idempotencyKey) => api.post('/purchases', data, idempotent(idempotencyKey)).then(res => res.data),
     update: (id, data) => api.put(`/purchases/${id}`, data).then(res => res.data),
     delete: (id) => api.delete(`/purchases/${id}`).then(res => res.data),
 };
@@ -102,7 +123,7 @@ export const PurchasesAPI = {
 export const InventoryAPI = {
     getMovements: (productId = null) => {
         const params = productId ? `?product_id=${productId}` : '';
-        return api.get(`/inventory/movements${params}`).then(res => res.data);
+        return api.get(`/inventory/movements${params}`).then(res => res.data.items);
     },
     adjust: (data) => api.post('/inventory/adjust', data).then(res => res.data),
 };
@@ -130,6 +151,7 @@ export const DashboardAPI = {
 export const AnalyticsAPI = {
     getSalesTrend: (days = 30) => api.get(`/analytics/sales-trend?days=${days}`).then(res => res.data),
     getTopProducts: (limit = 10) => api.get(`/analytics/top-products?limit=${limit}`).then(res => res.data),
+    getSalesByCategory: (params = {}) => api.get('/analytics/sales-by-category', { params }).then(res => res.data),
     getInventoryValue: () => api.get('/analytics/inventory-value').then(res => res.data),
     getKPIs: () => api.get('/analytics/kpis').then(res => res.data),
     getTopCustomers: (limit = 10) => api.get(`/analytics/top-customers?limit=${limit}`).then(res => res.data),
@@ -139,7 +161,8 @@ export const AnalyticsAPI = {
 // Cash Management API
 export const CashAPI = {
     getBalance: () => api.get('/cash/balance').then(res => res.data),
-    getTransactions: (limit = 100) => api.get(`/cash/transactions?limit=${limit}`).then(res => res.data),
+    getDrawers: () => api.get('/cash/drawers').then(res => res.data),
+    getTransactions: (limit = 100) => api.get(`/cash/transactions?limit=${limit}`).then(res => res.data.items),
     deposit: (amount, description) => api.post('/cash/deposit', { amount, description }).then(res => res.data),
     withdraw: (amount, description) => api.post('/cash/withdraw', { amount, description }).then(res => res.data),
     validate: (amount) => api.get(`/cash/validate?amount=${amount}`).then(res => res.data),